@@ -0,0 +1,90 @@
+# bench/bench_catalog.py
+"""Бенчмарк постраничной выдачи каталога файлов.
+
+Заполняет временную базу заданным числом записей и замеряет время получения
+первой страницы, страницы из середины (по курсору) и отфильтрованной страницы
+при разных сортировках. Для сравнения замеряется выборка всего каталога одним
+запросом, как делал прежний list_files.
+
+Пример:
+    python bench/bench_catalog.py --files 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+import database  # noqa: E402
+
+SENDERS = ['alice', 'bob', 'carol', 'dave', 'eve']
+TYPES = ['Документ', 'Изображение', 'Видео', 'Архив', 'Другой']
+
+def fill_catalog(count):
+    conn = database.sqlite3.connect(database.USERS_DB)
+    rows = [(
+        f"{SENDERS[i % len(SENDERS)]}_file{i:07d}.bin", f"file{i:07d}.bin", SENDERS[i % len(SENDERS)],
+        (i * 7919) % (50 * 1024 * 1024), TYPES[i % len(TYPES)],
+        f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} 12:00:00", None
+    ) for i in range(count)]
+    conn.executemany(
+        'INSERT INTO files (stored_name, file_name, sender, size, file_type, date, sha256) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк постраничной выдачи каталога файлов")
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--page', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database.USERS_DB = os.path.join(tmp_dir, 'bench.db')
+        database.init_db()
+        fill_catalog(args.files)
+
+        report = {}
+        for sort in ('id', 'name', 'size', 'date'):
+            first_ms, (_, cursor) = timed(lambda: database.get_file_page(sort=sort, limit=args.page), args.repeat)
+            # Курсор из середины каталога: пролистываем до нее страницами по 1000
+            middle = None
+            for _ in range(args.files // 2 // 1000):
+                _, middle = database.get_file_page(sort=sort, after=middle, limit=1000)
+            middle_ms, _ = timed(lambda: database.get_file_page(sort=sort, after=middle, limit=args.page), args.repeat)
+            filtered_ms, _ = timed(lambda: database.get_file_page(
+                {'sender': 'carol', 'name_prefix': 'file00'}, sort=sort, limit=args.page), args.repeat)
+            report[sort] = {'first_ms': round(first_ms, 2), 'middle_ms': round(middle_ms, 2),
+                            'filtered_ms': round(filtered_ms, 2)}
+        full_ms, _ = timed(lambda: database.get_file_page(limit=args.files), 1)
+        report['full_catalog_ms'] = round(full_ms, 2)
+
+    print(f"{'сортировка':<12}{'первая, мс':>12}{'середина, мс':>14}{'фильтр, мс':>12}")
+    for sort in ('id', 'name', 'size', 'date'):
+        r = report[sort]
+        print(f"{sort:<12}{r['first_ms']:>12.2f}{r['middle_ms']:>14.2f}{r['filtered_ms']:>12.2f}")
+    print(f"Весь каталог одним запросом ({args.files} файлов): {report['full_catalog_ms']:.1f} мс")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
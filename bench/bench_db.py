@@ -0,0 +1,89 @@
+# bench/bench_db.py
+"""Бенчмарк поиска хеша пароля при входе.
+
+Сравнивает прежний способ (новое соединение sqlite3.connect на каждый запрос)
+с пулом соединений из server/database.py (WAL, настроенные PRAGMA,
+кешированные запросы). Несколько потоков одновременно ищут случайных
+пользователей, как при массовом переподключении клиентов после перезапуска
+сервера.
+
+Пример:
+    python bench/bench_db.py --users 10000 --threads 8 --lookups 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+import database  # noqa: E402
+
+def legacy_lookup(nickname):
+    """Прежняя реализация get_user_password_hash."""
+    conn = sqlite3.connect(database.USERS_DB)
+    cursor = conn.cursor()
+    cursor.execute('SELECT password_hash FROM users WHERE nickname = ?', (nickname,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def run(lookup, users, threads, lookups):
+    """Выполняет lookups поисков в threads потоках и возвращает поисков в секунду."""
+    per_thread = lookups // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        barrier.wait()
+        for _ in range(per_thread):
+            if lookup(f"user{rng.randrange(users)}") is None:
+                raise AssertionError("Пользователь не найден")
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска пользователей в SQLite")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--json', help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database.USERS_DB = os.path.join(tmp_dir, 'bench.db')
+        database.init_db()
+        with database.connection() as conn:
+            conn.executemany('INSERT INTO users (nickname, password_hash) VALUES (?, ?)',
+                             [(f"user{i}", f"hash{i}") for i in range(args.users)])
+
+        report = {
+            'legacy_connect_per_call': run(legacy_lookup, args.users, args.threads, args.lookups),
+            'pool': run(database.get_user_password_hash, args.users, args.threads, args.lookups),
+        }
+        database.get_pool().close()
+
+    for name, rate in report.items():
+        print(f"{name:<26}{rate:>12.0f} поисков/с")
+    print(f"Ускорение: {report['pool'] / report['legacy_connect_per_call']:.1f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({name: round(rate) for name, rate in report.items()}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# bench/bench_framing.py
+"""Микробенчмарк разбора входящих сообщений.
+
+Сравнивает прежний способ (str += данные по 4 КБ и split('\\n') всего буфера)
+с FrameReader на строках JSON длиной 1 КБ, 1 МБ и 8 МБ, а также бинарные кадры
+того же размера. Передача идет через socketpair, отправитель работает в
+отдельном потоке. Каждое принятое сообщение сверяется с отправленным.
+
+Пример:
+    python bench/bench_framing.py --sizes 1024 1048576 8388608
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+from framing import FrameReader, encode_message, encode_binary_frame  # noqa: E402
+
+TOTAL_BYTES = 32 * 1024 * 1024  # Примерный объем данных на один замер
+
+class LegacyReader:
+    """Прежний разбор: строковый буфер, чтение по 4 КБ, split всего буфера."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = ""
+
+    def read_message(self):
+        while '\n' not in self.buffer:
+            data = self.sock.recv(4096).decode()
+            if not data:
+                return None
+            self.buffer += data
+        message, self.buffer = self.buffer.split('\n', 1)
+        return message.strip()
+
+def make_json_frame(size):
+    message = {'type': 'file_chunk', 'file_name': 'bench.bin', 'file_data': 'ab' * (size // 2)}
+    return encode_message(message)
+
+def run(reader_factory, read_one, frames, count):
+    """Отправляет count одинаковых кадров и возвращает (секунды, МБ/с)."""
+    sender, receiver = socket.socketpair()
+    total = sum(len(f) for f in frames) * count // len(frames)
+
+    def send():
+        for i in range(count):
+            sender.sendall(frames[i % len(frames)])
+        sender.shutdown(socket.SHUT_WR)
+
+    thread = threading.Thread(target=send, daemon=True)
+    reader = reader_factory(receiver)
+    started = time.perf_counter()
+    thread.start()
+    for i in range(count):
+        if not read_one(reader, i):
+            raise AssertionError(f"Сообщение {i} разобрано неверно")
+    elapsed = time.perf_counter() - started
+    thread.join()
+    sender.close()
+    receiver.close()
+    return elapsed, total / elapsed / (1024 * 1024)
+
+def bench_size(size, legacy_limit):
+    json_frame = make_json_frame(size)
+    expected_line = json_frame.strip()
+    payload = os.urandom(size)
+    binary_frame = encode_binary_frame({'type': 'file_chunk', 'file_name': 'bench.bin'}, payload)
+    count = max(1, TOTAL_BYTES // len(json_frame))
+    results = {}
+
+    def check_legacy(reader, i):
+        return reader.read_message() == expected_line.decode()
+
+    def check_line(reader, i):
+        frame = reader.read_frame()
+        return frame is not None and frame.header == expected_line
+
+    def check_binary(reader, i):
+        frame = reader.read_frame()
+        return frame is not None and frame.payload == payload
+
+    if size <= legacy_limit:
+        # Прежний способ квадратичен по длине строки, поэтому ограничиваем число повторов
+        legacy_count = max(1, min(count, TOTAL_BYTES // 8 // len(json_frame)))
+        results['legacy_str'] = run(LegacyReader, check_legacy, [json_frame], legacy_count)
+    results['framereader_json'] = run(lambda s: FrameReader(s, 256 * 1024), check_line, [json_frame], count)
+    results['framereader_binary'] = run(lambda s: FrameReader(s, 256 * 1024), check_binary, [binary_frame], count)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк разбора кадров")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1024, 1024 * 1024, 8 * 1024 * 1024])
+    parser.add_argument('--legacy-limit', type=int, default=8 * 1024 * 1024,
+                        help="Не замерять прежний способ для сообщений больше этого размера")
+    parser.add_argument('--json', help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    report = {}
+    print(f"{'размер':>10}  {'способ':<20}{'сек':>9}{'МБ/с':>10}")
+    for size in args.sizes:
+        results = bench_size(size, args.legacy_limit)
+        report[size] = {name: {'sec': round(sec, 4), 'mb_per_sec': round(mbps, 1)}
+                        for name, (sec, mbps) in results.items()}
+        for name, (sec, mbps) in results.items():
+            print(f"{size:>10}  {name:<20}{sec:>9.3f}{mbps:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# bench/bench_server.py
+"""Нагрузочный бенчмарк сервера чата по loopback.
+
+Запускает ChatServer в отдельном процессе (база, файлы и лог - во временном
+каталоге, рабочие данные сервера не трогаются) и гоняет через него N
+синтетических клиентов по настоящему протоколу: register, message, file,
+list_files и download_file. Измеряет скорость установки подключений (с
+регистрацией, то есть с bcrypt), задержку доставки рассылки всем
+подписчикам (p50/p99), скорость загрузки и скачивания файла, время ответа
+list_files и память процесса сервера. Результаты можно сохранить в JSON,
+чтобы сравнивать их между коммитами.
+
+Пример:
+    python bench/bench_server.py --clients 50 --messages 200 --file-size 64 --json results.json
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(ROOT_DIR, 'server')
+sys.path.insert(0, SERVER_DIR)
+
+from framing import FrameReader, encode_message, encode_binary_frame  # noqa: E402
+
+PASSWORD = 'bench-password'
+CHUNK_SIZE = 1024 * 1024  # Размер чанка загрузки, байт
+RESPONSE_TIMEOUT = 60  # Сколько ждать ответа сервера, сек
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def read_process_status(pid):
+    """Возвращает потоки, текущий и пиковый RSS процесса в МБ из /proc (только Linux)."""
+    fields = {'Threads': 'threads', 'VmRSS': 'rss_mb', 'VmHWM': 'peak_rss_mb'}
+    status = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'Threads':
+                    status['threads'] = int(value)
+                elif key in fields:
+                    status[fields[key]] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return status
+
+def serve(args):
+    """Режим дочернего процесса: запускает ChatServer с данными во временном каталоге."""
+    import config
+    config.USERS_DB = os.path.join(args.serve, 'users.db')
+    config.FILES_DIR = os.path.join(args.serve, 'files')
+    config.BLOBS_DIR = os.path.join(config.FILES_DIR, 'blobs')
+    config.PARTIAL_UPLOADS_DIR = os.path.join(config.FILES_DIR, 'partial')
+    config.LOG_FILE = os.path.join(args.serve, 'server.log')
+    config.LOG_LEVEL = args.log_level
+    if args.bcrypt_rounds:
+        config.BCRYPT_ROUNDS = args.bcrypt_rounds
+    from server import ChatServer  # Импорт после подмены путей: модули сервера читают config при загрузке
+    from logs import setup_logging
+    setup_logging(config.LOG_FILE, config.LOG_LEVEL, config.LOG_MAX_BYTES, config.LOG_BACKUP_COUNT,
+                  config.LOG_RATE_LIMIT, config.LOG_RATE_INTERVAL)
+    ChatServer(args.port, args.udp_port, args.engine, metrics_port=0).start_server()
+
+class BenchClient:
+    """Синтетический клиент: поток чтения учитывает рассылки, остальные ответы кладет в очередь."""
+
+    def __init__(self, port, nickname, features):
+        self.nickname = nickname
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.reader = FrameReader(self.sock, 256 * 1024)
+        self.features = features
+        self.responses = queue.Queue()
+        self.latencies = []  # Задержки доставки сообщений чата, сек
+        self.received = 0
+        self.lock = threading.Lock()
+
+    def register(self):
+        self.sock.sendall(encode_message({'type': 'register', 'nickname': self.nickname,
+                                          'password': PASSWORD, 'features': self.features}))
+        response = json.loads(self.reader.read_frame().header)
+        if response.get('status') != 'success':
+            raise RuntimeError(f"Регистрация {self.nickname} не удалась: {response}")
+        threading.Thread(target=self.read_loop, daemon=True).start()
+
+    def read_loop(self):
+        try:
+            while True:
+                frame = self.reader.read_frame()
+                if not frame:
+                    break
+                if not frame.header:
+                    continue
+                now = time.perf_counter()
+                msg = json.loads(frame.header)
+                if msg['type'] == 'message':
+                    if msg.get('content', '').startswith('bench:'):
+                        with self.lock:
+                            self.latencies.append(now - float(msg['content'][6:]))
+                            self.received += 1
+                elif msg['type'] == 'file_info' and msg.get('transfer') == 'raw':
+                    self.reader.read_raw(msg['length'], lambda data: None)
+                    self.responses.put(('file_received', msg['length'], time.perf_counter()))
+                elif msg['type'] == 'file_chunk':
+                    self.responses.put(('file_chunk', len(frame.payload or b''), now))
+                else:
+                    self.responses.put((msg['type'], msg, now))
+        except OSError:
+            pass
+
+    def send(self, message, payload=None):
+        data = encode_message(message) if payload is None else encode_binary_frame(message, payload)
+        self.sock.sendall(data)
+
+    def wait_for(self, msg_type, predicate=lambda msg: True):
+        deadline = time.monotonic() + RESPONSE_TIMEOUT
+        while True:
+            kind, msg, at = self.responses.get(timeout=max(0.0, deadline - time.monotonic()))
+            if kind == msg_type and predicate(msg):
+                return msg, at
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+def bench_connections(port, count, features, concurrency):
+    prefix = f"b{random.randint(0, 10 ** 6)}_"
+    clients = [None] * count
+    setup_times = []
+
+    def connect(i):
+        started = time.perf_counter()
+        client = BenchClient(port, f"{prefix}{i}", features)
+        client.register()
+        setup_times.append(time.perf_counter() - started)
+        clients[i] = client
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(connect, range(count)))
+    elapsed = time.perf_counter() - started
+    return clients, {
+        'clients': count,
+        'connections_per_sec': round(count / elapsed, 1),
+        'setup_p50_ms': round(percentile(setup_times, 0.5) * 1000, 1),
+        'setup_p99_ms': round(percentile(setup_times, 0.99) * 1000, 1),
+    }
+
+def bench_fanout(clients, messages, interval):
+    """Рассылает messages сообщений от разных клиентов и меряет задержку до каждого получателя."""
+    time.sleep(0.5)  # Даем клиентам дочитать историю и уведомления после входа
+    expected = messages * (len(clients) - 1)
+    started = time.perf_counter()
+    for i in range(messages):
+        clients[i % len(clients)].send({'type': 'message', 'content': f"bench:{time.perf_counter()!r}"})
+        if interval:
+            time.sleep(interval)
+    deadline = time.monotonic() + RESPONSE_TIMEOUT
+    while sum(c.received for c in clients) < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    latencies = [latency for c in clients for latency in c.latencies]
+    delivered = sum(c.received for c in clients)
+    return {
+        'messages': messages,
+        'deliveries': delivered,
+        'deliveries_expected': expected,
+        'deliveries_per_sec': round(delivered / elapsed, 1),
+        'latency_p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'latency_max_ms': round(max(latencies) * 1000, 2) if latencies else None,
+    }
+
+def bench_files(client, size_mb):
+    """Загружает файл чанками, запрашивает list_files и скачивает файл обратно."""
+    data = os.urandom(CHUNK_SIZE)  # Один случайный чанк, повторенный: хеш и диск работают как обычно
+    size = size_mb * CHUNK_SIZE
+    total_chunks = size_mb
+    file_name = f"bench_{random.randint(0, 10 ** 6)}.bin"
+    started = time.perf_counter()
+    for chunk in range(1, total_chunks + 1):
+        client.send({'type': 'file', 'file_name': file_name, 'file_size': f"{size_mb} МБ",
+                     'total_chunks': total_chunks, 'current_chunk': chunk,
+                     'offset': (chunk - 1) * CHUNK_SIZE, 'date': 'bench'}, data)
+    new_file, finished = client.wait_for('new_file', lambda msg: msg['file_name'] == file_name)
+    upload_seconds = finished - started
+
+    started = time.perf_counter()
+    client.send({'type': 'list_files', 'filters': {'name_prefix': file_name}})
+    client.wait_for('files_list')
+    list_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    client.send({'type': 'download_file', 'file_name': file_name, 'file_id': new_file['file_id']})
+    received = 0
+    while received < size:
+        kind, value, at = client.responses.get(timeout=RESPONSE_TIMEOUT)
+        if kind in ('file_received', 'file_chunk'):
+            received += value
+    download_seconds = time.perf_counter() - started
+    return {
+        'file_size_mb': size_mb,
+        'upload_mb_per_sec': round(size_mb / upload_seconds, 1),
+        'download_mb_per_sec': round(size_mb / download_seconds, 1),
+        'list_files_ms': round(list_ms, 2),
+    }
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Сервер завершился при запуске")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Сервер не начал принимать подключения")
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк сервера чата")
+    parser.add_argument('--engine', choices=('threaded', 'asyncio'), default='threaded')
+    parser.add_argument('--clients', type=int, default=50, help="Число синтетических клиентов")
+    parser.add_argument('--concurrency', type=int, default=16, help="Одновременных подключений при входе")
+    parser.add_argument('--messages', type=int, default=200, help="Сообщений чата для замера рассылки")
+    parser.add_argument('--interval', type=float, default=0.005, help="Пауза между сообщениями, сек")
+    parser.add_argument('--file-size', type=int, default=64, help="Размер файла для загрузки и скачивания, МБ")
+    parser.add_argument('--compression', choices=('zlib', 'zstd'), help="Запросить сжатие кадров")
+    parser.add_argument('--bcrypt-rounds', type=int, help="Сложность bcrypt на сервере (по умолчанию из config)")
+    parser.add_argument('--log-level', default='WARNING', help="Уровень лога сервера на время замера")
+    parser.add_argument('--json', help="Сохранить результаты в JSON-файл")
+    parser.add_argument('--serve', help=argparse.SUPPRESS)  # Внутренний режим: каталог данных сервера
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--udp-port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    data_dir = tempfile.mkdtemp(prefix='chat-bench-')
+    port, udp_port = free_port(), free_port(socket.SOCK_DGRAM)
+    command = [sys.executable, os.path.abspath(__file__), '--serve', data_dir, '--engine', args.engine,
+               '--port', str(port), '--udp-port', str(udp_port), '--log-level', args.log_level]
+    if args.bcrypt_rounds:
+        command += ['--bcrypt-rounds', str(args.bcrypt_rounds)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    features = ['binary', 'raw_download'] + ([args.compression] if args.compression else [])
+    clients = []
+    try:
+        wait_for_port(port, process)
+        report = {'engine': args.engine, 'server_idle': read_process_status(process.pid)}
+        clients, report['connections'] = bench_connections(port, args.clients, features, args.concurrency)
+        report['fanout'] = bench_fanout(clients, args.messages, args.interval)
+        report['files'] = bench_files(clients[0], args.file_size)
+        report['server'] = read_process_status(process.pid)
+    finally:
+        for client in clients:
+            if client:
+                client.close()
+        process.terminate()
+        process.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    for section, values in report.items():
+        if isinstance(values, dict):
+            print(f"{section}:")
+            for name, value in values.items():
+                print(f"  {name:<24}{value}")
+        else:
+            print(f"{section}: {values}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench/bench_writes.py
+"""Бенчмарк записи множества коротких кадров в сокет.
+
+Сравнивает отправку каждого кадра отдельным sendall (как раньше делал писатель
+подключения) с пакетной отправкой send_buffers из server/outbound.py, которая
+собирает кадры в вызовы sendmsg (writev). Кадры имитируют рассылку коротких
+сообщений чата; принимающая сторона на loopback-TCP просто вычитывает байты.
+
+Пример:
+    python bench/bench_writes.py --frames 200000 --size 120 --batch 64
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+from outbound import send_buffers  # noqa: E402
+
+def connected_pair():
+    """Возвращает пару TCP-сокетов на loopback с включенным TCP_NODELAY."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    sender = socket.create_connection(listener.getsockname())
+    receiver, _ = listener.accept()
+    listener.close()
+    sender.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sender, receiver
+
+def drain(sock, expected):
+    received = 0
+    while received < expected:
+        chunk = sock.recv(1024 * 1024)
+        if not chunk:
+            break
+        received += len(chunk)
+
+def run(send, frames, batch):
+    """Отправляет кадры пачками по batch и возвращает кадров в секунду."""
+    sender, receiver = connected_pair()
+    reader = threading.Thread(target=drain, args=(receiver, sum(len(f) for f in frames)))
+    reader.start()
+    started = time.perf_counter()
+    for i in range(0, len(frames), batch):
+        send(sender, frames[i:i + batch])
+    reader.join()
+    elapsed = time.perf_counter() - started
+    sender.close()
+    receiver.close()
+    return len(frames) / elapsed
+
+def send_each(sock, batch):
+    for data in batch:
+        sock.sendall(data)
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пакетной отправки кадров")
+    parser.add_argument('--frames', type=int, default=200000)
+    parser.add_argument('--size', type=int, default=120, help="Размер кадра, байт")
+    parser.add_argument('--batch', type=int, default=64, help="Кадров в одной пачке писателя")
+    parser.add_argument('--json', help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    frame = b'{"type": "message", "content": "' + b'x' * max(0, args.size - 34) + b'"}\n'
+    frames = [frame] * args.frames
+    report = {
+        'sendall_per_frame': run(send_each, frames, args.batch),
+        'sendmsg_batched': run(send_buffers, frames, args.batch),
+    }
+
+    for name, rate in report.items():
+        print(f"{name:<20}{rate:>12.0f} кадров/с")
+    print(f"Ускорение: {report['sendmsg_batched'] / report['sendall_per_frame']:.1f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({name: round(rate) for name, rate in report.items()}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
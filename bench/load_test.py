@@ -0,0 +1,171 @@
+# bench/load_test.py
+"""Нагрузочный тест: сколько одновременных подключений выдерживает каждый движок сервера.
+
+Для каждого движка запускается отдельный процесс сервера, к нему открывается
+N TCP-подключений, которые остаются открытыми. Затем каждый клиент отправляет
+запрос входа (несуществующего пользователя, чтобы не тратить время на bcrypt)
+и ждет ответ. Выводятся число обслуженных клиентов, время, а также число
+потоков и потребление памяти процессом сервера.
+
+Пример:
+    python bench/load_test.py --engines threaded asyncio --clients 100 500 2000
+"""
+
+import argparse
+import json
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Сервер запускается в режиме bench_server.py --serve: база, файлы и лог лежат во временном
+# каталоге, сервер метрик отключен, поэтому тест не трогает рабочий каталог и порты сервера
+SERVE_SCRIPT = os.path.join(ROOT_DIR, 'bench', 'bench_server.py')
+
+def raise_open_files_limit():
+    """Поднимает лимит открытых файлов до максимально разрешенного."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+def read_process_status(pid):
+    """Возвращает (потоки, RSS в МБ) процесса из /proc (только Linux)."""
+    threads, rss_mb = None, None
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+                elif line.startswith('VmRSS:'):
+                    rss_mb = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return threads, rss_mb
+
+def wait_for_port(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def start_server(engine, port, udp_port, workdir):
+    data_dir = os.path.join(workdir, engine)
+    os.makedirs(data_dir, exist_ok=True)
+    cmd = [sys.executable, SERVE_SCRIPT, '--serve', data_dir, '--engine', engine,
+           '--port', str(port), '--udp-port', str(udp_port)]
+    proc = subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_for_port('127.0.0.1', port):
+        proc.kill()
+        raise RuntimeError(f"Сервер ({engine}) не запустился на порту {port}")
+    return proc
+
+def run_level(host, port, n_clients, server_pid, timeout, settle):
+    """Открывает n_clients подключений и проверяет, что каждое обслуживается."""
+    sockets = []
+    connect_errors = 0
+    started = time.monotonic()
+    for _ in range(n_clients):
+        try:
+            sock = socket.create_connection((host, port), timeout=timeout)
+            sock.setblocking(False)
+            sockets.append(sock)
+        except OSError:
+            connect_errors += 1
+    connect_time = time.monotonic() - started
+
+    # Все подключения открыты и простаивают: даем серверу принять их и замеряем ресурсы
+    time.sleep(settle)
+    idle_threads, idle_rss = read_process_status(server_pid)
+    login_started = time.monotonic()
+
+    selector = selectors.DefaultSelector()
+    login = (json.dumps({'type': 'login', 'nickname': 'loadtest_nobody', 'password': 'x'}) + '\n').encode()
+    for sock in sockets:
+        try:
+            sock.sendall(login)
+            selector.register(sock, selectors.EVENT_READ)
+        except OSError:
+            connect_errors += 1
+
+    served = 0
+    pending = len(selector.get_map())
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for key, _ in selector.select(timeout=0.5):
+            try:
+                data = key.fileobj.recv(4096)
+            except OSError:
+                data = b''
+            if data and b'\n' in data:
+                served += 1
+            selector.unregister(key.fileobj)
+            pending -= 1
+    served_time = time.monotonic() - login_started
+
+    selector.close()
+    for sock in sockets:
+        sock.close()
+
+    return {
+        'clients': n_clients,
+        'connected': len(sockets),
+        'connect_errors': connect_errors,
+        'served': served,
+        'connect_sec': round(connect_time, 3),
+        'login_sec': round(served_time, 3),
+        'server_threads': idle_threads,
+        'server_rss_mb': round(idle_rss, 1) if idle_rss is not None else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест движков ChatServer")
+    parser.add_argument('--engines', nargs='+', default=['threaded', 'asyncio'])
+    parser.add_argument('--clients', nargs='+', type=int, default=[100, 500, 1000, 2000])
+    parser.add_argument('--port', type=int, default=23456)
+    parser.add_argument('--udp-port', type=int, default=47020)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--settle', type=float, default=1.0,
+                        help="Пауза перед замером ресурсов сервера, сек")
+    parser.add_argument('--json', help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    limit = raise_open_files_limit()
+    if max(args.clients) + 64 > limit:
+        print(f"Внимание: лимит открытых файлов {limit} меньше числа клиентов.")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for i, engine in enumerate(args.engines):
+            # Отдельные порты для каждого движка, чтобы не ждать освобождения TIME_WAIT
+            port = args.port + i
+            proc = start_server(engine, port, args.udp_port + i, workdir)
+            try:
+                results[engine] = [
+                    run_level('127.0.0.1', port, n, proc.pid, args.timeout, args.settle) for n in args.clients
+                ]
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    print(f"{'движок':<10}{'клиентов':>10}{'обслужено':>11}{'сек':>9}{'потоков':>9}{'RSS МБ':>9}")
+    for engine, levels in results.items():
+        for r in levels:
+            print(f"{engine:<10}{r['clients']:>10}{r['served']:>11}{r['login_sec']:>9}"
+                  f"{str(r['server_threads']):>9}{str(r['server_rss_mb']):>9}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
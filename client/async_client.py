@@ -0,0 +1,279 @@
+# client/async_client.py
+
+import asyncio
+import json
+import os
+from chat_client import (ChatProtocol, discover_server, DEFAULT_ROOM, BUSY_MAX_RETRIES, FILE_OFFER_TIMEOUT,
+                         RECEIVE_BUFFER_SIZE, RECONNECT_ATTEMPTS, RECONNECT_INITIAL_DELAY, RECONNECT_MAX_DELAY)
+from framing import (Frame, FrameTooLargeError, encode_message, decode_frame, BINARY_FRAME_MARKER,  # chat_client добавил путь
+                     BINARY_PREFIX, DEFAULT_MAX_MESSAGE_SIZE, DEFAULT_MAX_PAYLOAD_SIZE)
+
+class AsyncChatClient(ChatProtocol):
+    """Клиент Chat Refresh на asyncio без графического интерфейса.
+
+    Один цикл событий держит тысячи таких клиентов (например, в нагрузочных
+    тестах). Сообщения сервера читаются через receive() или async for;
+    файлы отправляются только по основному соединению. Пример:
+
+        client = AsyncChatClient('127.0.0.1', 12345)
+        await client.login('bot', 'password')
+        await client.send_chat('Привет!')
+        async for msg in client:
+            print(msg)
+    """
+
+    def __init__(self, host=None, port=None, features=None):
+        super().__init__(host, port, features)
+        self.stream_reader = None
+        self.stream_writer = None
+        self.send_lock = asyncio.Lock()
+        self.pending_replies = {}  # Ключ запроса: Future с ответом сервера
+        self.upload_tasks = set()  # Задачи продолжения загрузок после переподключения
+
+    async def connect(self):
+        """Открывает TCP-соединение; адрес сервера ищется UDP-обнаружением, если не задан."""
+        if not self.host:
+            loop = asyncio.get_running_loop()
+            self.host, self.port = await loop.run_in_executor(None, discover_server)
+            if not self.host:
+                raise ConnectionError("Не удалось обнаружить сервер.")
+        self.stream_reader, self.stream_writer = await asyncio.open_connection(
+            self.host, self.port, limit=DEFAULT_MAX_MESSAGE_SIZE
+        )
+        self.server_features = set()
+
+    async def authenticate(self, auth_msg):
+        """Подключается и отправляет запрос входа; повторяет его, пока сервер отвечает 'занят'."""
+        for attempt in range(BUSY_MAX_RETRIES + 1):
+            await self.connect()
+            self.stream_writer.write(encode_message(auth_msg))
+            await self.stream_writer.drain()
+            frame = await self.read_frame()
+            if not frame:
+                raise ConnectionError("Нет ответа от сервера.")
+            response = json.loads(frame.header)
+            if response.get('status') != 'busy' or attempt == BUSY_MAX_RETRIES:
+                return response
+            await self.close()
+            await asyncio.sleep(self.busy_delay(response))
+
+    async def login(self, nickname, password):
+        response = await self.authenticate(self.auth_message('login', nickname, password))
+        self.apply_auth_response(response, nickname)
+        return response
+
+    async def register(self, nickname, password):
+        response = await self.authenticate(self.auth_message('register', nickname, password))
+        self.apply_auth_response(response, nickname)
+        return response
+
+    async def resume(self):
+        """Переподключается к серверу по токену сессии. Возвращает True при успехе."""
+        if not self.session_token:
+            return False
+        try:
+            response = await self.authenticate(self.auth_message('resume'))
+        except OSError:
+            return False
+        if response.get('status') != 'success':
+            self.session_token = None
+            return False
+        self.apply_auth_response(response)
+        return True
+
+    async def reconnect(self, attempts=RECONNECT_ATTEMPTS, initial_delay=RECONNECT_INITIAL_DELAY,
+                        max_delay=RECONNECT_MAX_DELAY):
+        """Восстанавливает сессию после обрыва с растущей паузой и продолжает прерванные передачи."""
+        delay = initial_delay
+        for _ in range(attempts):
+            if not self.session_token:
+                return False
+            await asyncio.sleep(delay)
+            if await self.resume():
+                for msg in self.resume_messages():
+                    await self.send(msg)
+                return True
+            delay = min(delay * 2, max_delay)
+        return False
+
+    async def close(self):
+        if self.stream_writer:
+            self.stream_writer.close()
+            try:
+                await self.stream_writer.wait_closed()
+            except OSError:
+                pass
+
+    async def send(self, msg):
+        await self.write(self.encode(msg))
+
+    async def write(self, data):
+        async with self.send_lock:
+            self.stream_writer.write(data)
+            await self.stream_writer.drain()
+
+    async def send_chat(self, content, room=DEFAULT_ROOM):
+        await self.send({'type': 'message', 'content': content, 'room': room})
+
+    async def send_direct(self, recipient, content):
+        await self.send({'type': 'direct', 'to': recipient, 'content': content})
+
+    async def join_room(self, room):
+        await self.send({'type': 'join', 'room': room, 'last_message_id': self.last_message_ids.get(room)})
+
+    async def leave_room(self, room):
+        await self.send({'type': 'leave', 'room': room})
+
+    async def list_rooms(self):
+        await self.send({'type': 'list_rooms'})
+
+    async def list_files(self, cursor=None, limit=None, sort='id', order='asc', filters=None):
+        await self.send(self.list_files_message(cursor, limit, sort, order, filters))
+
+    async def download_file(self, file_info, save_path, progress=None):
+        """Запрашивает файл из списка; по завершении придет событие download_done."""
+        await self.send(self.expect_download(file_info, save_path, progress))
+
+    async def download_archive(self, save_path, file_ids=None, filters=None, progress=None):
+        await self.send(self.expect_archive(save_path, file_ids, filters, progress))
+
+    async def read_frame(self):
+        """Принимает одно сообщение: JSON-строку или бинарный кадр. None - соединение закрыто."""
+        try:
+            first = await self.stream_reader.readexactly(1)
+            if first[0] == BINARY_FRAME_MARKER:
+                prefix = first + await self.stream_reader.readexactly(BINARY_PREFIX.size - 1)
+                _, flags, header_length, payload_length = BINARY_PREFIX.unpack(prefix)
+                if header_length > DEFAULT_MAX_MESSAGE_SIZE or payload_length > DEFAULT_MAX_PAYLOAD_SIZE:
+                    raise FrameTooLargeError("Сервер прислал слишком большой кадр")
+                header = await self.stream_reader.readexactly(header_length)
+                payload = await self.stream_reader.readexactly(payload_length)
+                if flags:
+                    return decode_frame(header, payload, flags, DEFAULT_MAX_PAYLOAD_SIZE)
+                return Frame(header, payload, flags)
+            if first == b'\n':
+                return Frame(b'', None, 0)
+            data = first + await self.stream_reader.readuntil(b'\n')
+            return Frame(data.strip(), None, 0)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        except (asyncio.LimitOverrunError, ValueError):
+            # Строка длиннее лимита или испорченный кадр: дальше поток не разобрать, закрываем соединение
+            self.stream_writer.close()
+            return None
+
+    async def receive(self):
+        """Возвращает следующее сообщение для приложения или None, если соединение закрыто."""
+        while not self.events:
+            try:
+                frame = await self.read_frame() if self.stream_reader else None
+                if frame and frame.header:
+                    msg = json.loads(frame.header)
+                    download = self.handle_message(msg, frame.payload)
+                    if msg['type'] == 'file_info' and msg.get('transfer') == 'raw':
+                        await self.receive_raw_file(msg, download)
+            except OSError:
+                frame = None  # Обрыв соединения (в том числе посреди тела файла)
+            if not frame:
+                self.connection_lost()
+                return self.events.popleft() if self.events else None
+        return self.events.popleft()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        msg = await self.receive()
+        if msg is None:
+            raise StopAsyncIteration
+        return msg
+
+    async def receive_raw_file(self, file_info, download):
+        """Дочитывает тело файла, идущее сырыми байтами за file_info (даже если скачивание отменено)."""
+        remaining = file_info['length']
+        while remaining:
+            try:
+                data = await self.stream_reader.readexactly(min(remaining, RECEIVE_BUFFER_SIZE))
+            except asyncio.IncompleteReadError:
+                raise ConnectionError("Соединение закрыто во время скачивания файла")
+            remaining -= len(data)
+            if self.download is download and download is not None:
+                try:
+                    download.write(data)
+                except Exception as e:
+                    self.abort_download('download')
+                    self.events.append(download.result('error', f"Ошибка при записи файла: {e}"))
+
+    async def request_reply(self, key, msg, timeout):
+        """Отправляет запрос и ждет ответа (его передаст receive()); None, если не дождались."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending_replies[key] = future
+        try:
+            await self.send(msg)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.pending_replies.pop(key, None)
+
+    def resolve_reply(self, key, msg):
+        future = self.pending_replies.get(key)
+        if future and not future.done():
+            future.set_result(msg)
+
+    async def upload_file(self, file_path, room=DEFAULT_ROOM, progress=None, on_status=None):
+        """Отправляет файл по основному соединению и возвращает итог, как ChatClient.upload_file.
+
+        Ответ на file_offer приходит через receive(), поэтому прием сообщений
+        должен идти в другой задаче. Чтение файла и хеширование выполняются
+        в пуле потоков, чтобы не останавливать цикл событий.
+        """
+        loop = asyncio.get_running_loop()
+        offer = await loop.run_in_executor(None, self.offer_message, file_path, room)
+        reply = await self.request_reply(('file_offer', offer['file_name']), offer, FILE_OFFER_TIMEOUT)
+        if reply is not None and reply.get('status') == 'exists':
+            upload = {'file_path': file_path, 'file_name': offer['file_name'], 'on_status': on_status}
+            self.report_upload(upload, 'exists')
+            return 'exists'
+        upload = self.new_upload(file_path, room, progress, on_status)
+        return await self.send_upload_chunks(upload, range(1, upload['total_chunks'] + 1))
+
+    async def send_upload_chunks(self, upload, chunk_numbers):
+        """Отправляет указанные чанки загрузки; при обрыве загрузка продолжится после reconnect()."""
+        loop = asyncio.get_running_loop()
+        chunk_numbers = list(chunk_numbers)
+        try:
+            with open(upload['file_path'], 'rb') as f:
+                for sent, chunk_number in enumerate(chunk_numbers, 1):
+                    header, file_data = await loop.run_in_executor(None, self.read_chunk, f, upload, chunk_number)
+                    frame = await loop.run_in_executor(None, self.encode_chunk, header, file_data, upload['compress'])
+                    await self.write(frame)
+                    if upload.get('progress'):
+                        upload['progress'](upload, sent, len(chunk_numbers))
+        except OSError as e:
+            if not os.path.exists(upload['file_path']):
+                self.pending_uploads.pop(upload['upload_id'], None)
+                raise
+            self.report_upload(upload, 'interrupted', str(e))
+            return 'interrupted'
+        self.report_upload(upload, 'sent')
+        return 'sent'
+
+    def continue_upload(self, msg):
+        """Продолжает загрузку по ответу upload_status в отдельной задаче."""
+        upload, chunks = self.upload_chunks_left(msg)
+        if upload is None:
+            return
+        if chunks is None:
+            coro = self.upload_file(upload['file_path'], upload['room'], upload['progress'], upload['on_status'])
+        else:
+            coro = self.send_upload_chunks(upload, chunks)
+        task = asyncio.get_running_loop().create_task(self.run_upload(upload, coro))
+        self.upload_tasks.add(task)
+        task.add_done_callback(self.upload_tasks.discard)
+
+    async def run_upload(self, upload, coro):
+        try:
+            await coro
+        except Exception as e:
+            self.report_upload(upload, 'failed', str(e))
@@ -0,0 +1,895 @@
+# client/chat_client.py
+
+import hashlib
+import json
+import os
+import queue
+import random
+import secrets
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Кадрирование протокола у клиента и сервера общее: единственная реализация лежит в server/framing.py
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server')
+if SERVER_DIR not in sys.path:
+    sys.path.append(SERVER_DIR)  # В конец, чтобы модули сервера не заслоняли модули клиента
+
+from framing import (FrameReader, encode_message, encode_compressed_message, encode_compressed_binary_frame,  # noqa: E402
+                     available_compressions, choose_compression, FEATURE_BINARY, FEATURE_RAW_DOWNLOAD,
+                     FEATURE_DATA_STREAMS)
+
+# Константы для размеров файлов и буферов
+SMALL_FILE_THRESHOLD = 1024 * 1024  # 1 MB
+MEDIUM_FILE_THRESHOLD = 10 * 1024 * 1024  # 10 MB
+LARGE_FILE_THRESHOLD = 100 * 1024 * 1024  # 100 MB
+
+SMALL_FILE_BUFFER = 512 * 1024  # 512 KB для файлов < 1 MB
+MEDIUM_FILE_BUFFER = 1024 * 1024  # 1 MB для файлов от 1 MB до 10 MB
+LARGE_FILE_BUFFER = 2 * 1024 * 1024  # 2 MB для файлов от 10 MB до 100 MB
+HUGE_FILE_BUFFER = 4 * 1024 * 1024  # 4 MB для файлов > 100 MB
+
+RECEIVE_BUFFER_SIZE = 64 * 1024  # Размер чтения из сокета
+
+# Возможности протокола, которые клиент запрашивает у сервера при входе
+CLIENT_FEATURES = [FEATURE_BINARY, FEATURE_RAW_DOWNLOAD, FEATURE_DATA_STREAMS] + available_compressions()
+
+COMPRESSION_MIN_SIZE = 1024  # Кадры короче этого размера, байт, не сжимаются
+INCOMPRESSIBLE_FILE_TYPES = ('Изображение', 'Видео', 'Архив', 'Музыка')  # Типы с уже сжатыми данными
+
+BUSY_MAX_RETRIES = 5  # Сколько раз повторять вход или регистрацию, если сервер ответил "занят"
+
+DEFAULT_ROOM = 'general'  # Общая комната, в которой состоят все клиенты
+
+DISCOVERY_PORT = 37020  # UDP-порт обнаружения сервера
+DISCOVERY_TIMEOUT = 5  # Сколько ждать ответа на запрос обнаружения, сек
+
+RECONNECT_ATTEMPTS = 5  # Попыток восстановить сессию после обрыва соединения
+RECONNECT_INITIAL_DELAY = 1  # Пауза перед первой попыткой, сек (дальше удваивается)
+RECONNECT_MAX_DELAY = 30  # Максимальная пауза между попытками, сек
+
+FILE_OFFER_TIMEOUT = 5  # Сколько ждать ответа на file_offer, прежде чем отправлять файл целиком, сек
+PARALLEL_UPLOAD_THRESHOLD = 32 * 1024 * 1024  # Файлы от этого размера отправляются по отдельным соединениям
+TRANSFER_STREAMS = 4  # Сколько соединений передачи данных открывать (сервер может разрешить меньше)
+TRANSFER_TOKEN_TIMEOUT = 5  # Сколько ждать токен передачи данных, сек
+
+def discover_server(port=DISCOVERY_PORT, timeout=DISCOVERY_TIMEOUT):
+    """Ищет сервер широковещательным UDP-запросом. Возвращает (ip, tcp_port) или (None, None)."""
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.settimeout(timeout)
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    try:
+        udp_socket.sendto('DISCOVER_SERVER'.encode(), ('<broadcast>', port))
+        while True:
+            data, addr = udp_socket.recvfrom(1024)
+            address = parse_discovery_response(data.decode().strip())
+            if address:
+                return address
+    except socket.timeout:
+        return None, None
+    finally:
+        udp_socket.close()
+
+def parse_discovery_response(response):
+    """Разбирает ответ 'SERVER_IP:...;TCP_PORT:...' в (ip, tcp_port); None для других ответов."""
+    if not response.startswith('SERVER_IP'):
+        return None
+    server_info = dict(item.split(':') for item in response.split(';'))
+    return server_info['SERVER_IP'], int(server_info['TCP_PORT'])
+
+def get_buffer_size(file_size):
+    """Определяет оптимальный размер буфера в зависимости от размера файла."""
+    if file_size < SMALL_FILE_THRESHOLD:
+        return SMALL_FILE_BUFFER
+    elif file_size < MEDIUM_FILE_THRESHOLD:
+        return MEDIUM_FILE_BUFFER
+    elif file_size < LARGE_FILE_THRESHOLD:
+        return LARGE_FILE_BUFFER
+    else:
+        return HUGE_FILE_BUFFER
+
+def get_readable_file_size(size_in_bytes):
+    """Преобразует размер файла из байт в читаемый формат."""
+    for unit in ['Б', 'КБ', 'МБ', 'ГБ', 'ТБ']:
+        if size_in_bytes < 1024:
+            return f"{size_in_bytes:.2f} {unit}".rstrip('0').rstrip('.')  # Убираем лишние нули после точки
+        size_in_bytes /= 1024
+    return f"{size_in_bytes:.2f} ПБ".rstrip('0').rstrip('.')  # Убираем лишние нули после точки
+
+def get_file_type(file_path):
+    """Определяет тип файла по расширению."""
+    _, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+    if ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
+        return 'Изображение'
+    elif ext in ['.mp4', '.avi', '.mov', '.mkv']:
+        return 'Видео'
+    elif ext in ['.pdf', '.docx', '.xlsx', '.pptx', '.txt']:
+        return 'Документ'
+    elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz']:
+        return 'Архив'
+    elif ext in ['.mp3', '.wav', '.aac', '.flac']:
+        return 'Музыка'
+    else:
+        return 'Другой'
+
+def file_sha256(file_path):
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def iter_chunk_numbers(chunk_numbers):
+    """Перебирает номера чанков из списка или, пока она не опустеет, из общей очереди."""
+    if not isinstance(chunk_numbers, queue.Queue):
+        yield from chunk_numbers
+        return
+    while True:
+        try:
+            yield chunk_numbers.get_nowait()
+        except queue.Empty:
+            return
+
+class FileDownload:
+    """Скачиваемый файл (или архив download_all).
+
+    Данные пишутся сразу на диск во временный файл рядом с целевым, который
+    по завершении атомарно переименовывается. progress(получено байт, всего
+    байт или None) вызывается после каждой записи.
+    """
+
+    def __init__(self, save_path, file_name, file_id=None, sender=None, progress=None, archive=False):
+        self.save_path = save_path
+        self.file_name = file_name
+        self.file_id = file_id
+        self.sender = sender
+        self.progress = progress
+        self.archive = archive
+        self.name_on_server = None  # Имя из file_info или archive_info, которым подписаны куски данных
+        self.temp_path = None
+        self.file = None
+        self.received_bytes = 0
+        self.total_bytes = None
+
+    def open(self, total_bytes=None, offset=0):
+        """Открывает временный файл; offset > 0 продолжает прерванное скачивание с этого байта."""
+        self.total_bytes = total_bytes
+        if self.temp_path is None:
+            fd, self.temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.save_path) or '.',
+                prefix=f".{os.path.basename(self.save_path)}.",
+                suffix='.part'
+            )
+            self.file = os.fdopen(fd, 'wb')
+        else:
+            self.file = open(self.temp_path, 'r+b')
+            self.file.seek(offset)
+            self.file.truncate()
+        self.received_bytes = offset
+
+    def write(self, data):
+        self.file.write(data)
+        self.received_bytes += len(data)
+        if self.progress:
+            self.progress(self.received_bytes, self.total_bytes)
+
+    def finish(self):
+        """Переносит временный файл на место целевого."""
+        self.file.close()
+        os.replace(self.temp_path, self.save_path)
+
+    def suspend(self):
+        """Закрывает недокачанный файл, оставляя его для докачки. Возвращает False, если его не сохранить."""
+        try:
+            self.file.close()
+            self.received_bytes = os.path.getsize(self.temp_path)
+            return not self.archive and self.file_id is not None  # Архив собирается на лету, его не докачать
+        except OSError:
+            return False
+
+    def abort(self):
+        """Прерывает скачивание и удаляет временный файл."""
+        try:
+            if self.file:
+                self.file.close()
+            if self.temp_path:
+                os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def result(self, status, message=None, **extra):
+        """Событие download_done для приложения."""
+        event = {'type': 'download_done', 'status': status, 'file_name': self.file_name,
+                 'save_path': self.save_path, 'archive': self.archive, **extra}
+        if message:
+            event['message'] = message
+        return event
+
+class ChatProtocol:
+    """Состояние клиента протокола, общее для блокирующего и asyncio-клиентов.
+
+    Здесь собраны запросы входа, учет комнат и уже показанных сообщений,
+    незавершенные загрузки и скачивания. handle_message() разбирает сообщения
+    сервера и кладет в events то, что нужно отдать приложению; сообщения,
+    которые клиент обрабатывает сам (чанки скачиваемых файлов, ответы на
+    file_offer и transfer_token), приложению не выдаются, а завершение
+    скачивания приходит событием download_done. Транспорт, ожидание ответов
+    и продолжение загрузок реализуют подклассы.
+    """
+
+    def __init__(self, host=None, port=None, features=None):
+        self.host = host
+        self.port = port
+        self.features = list(features if features is not None else CLIENT_FEATURES)
+        self.nickname = None
+        self.server_features = set()  # Возможности протокола, согласованные с сервером
+        self.session_token = None  # Токен для восстановления сессии без повторного ввода пароля
+        self.last_message_ids = {}  # room: номер последнего полученного сообщения (для догрузки истории)
+        self.joined_rooms = {DEFAULT_ROOM}  # Комнаты, на которые подписан клиент
+        self.pending_uploads = {}  # upload_id: описание загрузки, которую можно продолжить после обрыва
+        self.requested_downloads = {}  # file_id: FileDownload, для которого ждем file_info
+        self.download = None  # Скачивание, которое сейчас принимается
+        self.interrupted_download = None  # Скачивание, прерванное обрывом соединения (докачивается после него)
+        self.requested_archive = None  # FileDownload для запрошенного архива download_all
+        self.archive = None  # Архив, который сейчас принимается
+        self.events = deque()  # Сообщения для приложения, еще не выданные receive()
+
+    @property
+    def compression(self):
+        """Алгоритм сжатия, выбранный сервером при входе, или None."""
+        return choose_compression(self.server_features)
+
+    def auth_message(self, kind, nickname=None, password=None):
+        """Первое сообщение соединения: login, register или resume."""
+        if kind == 'resume':
+            return {'type': 'resume', 'token': self.session_token, 'features': self.features,
+                    'last_message_id': self.last_message_ids.get(DEFAULT_ROOM)}
+        return {'type': kind, 'nickname': nickname, 'password': password, 'features': self.features}
+
+    def busy_delay(self, response):
+        """Пауза перед повтором запроса, на который сервер ответил 'занят', сек."""
+        # Небольшой случайный разброс, чтобы клиенты не вернулись все одновременно
+        return response.get('retry_after_ms', 1000) * random.uniform(1.0, 1.5) / 1000
+
+    def apply_auth_response(self, response, nickname=None):
+        if response.get('status') == 'success':
+            self.server_features = set(response.get('features', []))
+            self.nickname = response.get('nickname', nickname)
+            if response.get('session_token'):
+                self.session_token = response['session_token']
+
+    def encode(self, msg):
+        return encode_compressed_message(msg, self.compression, COMPRESSION_MIN_SIZE)
+
+    def encode_chunk(self, header, payload, compress=False):
+        """Кодирует чанк файла: сырые байты в бинарном кадре или hex в file_data."""
+        codec = self.compression if compress else None
+        if FEATURE_BINARY in self.server_features:
+            return encode_compressed_binary_frame(header, payload, codec, COMPRESSION_MIN_SIZE)
+        return encode_compressed_message(dict(header, file_data=payload.hex()), codec, COMPRESSION_MIN_SIZE)
+
+    def list_files_message(self, cursor=None, limit=None, sort='id', order='asc', filters=None):
+        msg = {'type': 'list_files', 'cursor': cursor, 'sort': sort, 'order': order, 'filters': filters or {}}
+        if limit:
+            msg['limit'] = limit
+        return msg
+
+    def expect_download(self, file_info, save_path, progress=None):
+        """Готовит скачивание файла из списка и возвращает запрос download_file."""
+        download = FileDownload(save_path, file_info['file_name'], file_info.get('file_id'),
+                                file_info.get('sender'), progress)
+        self.requested_downloads[download.file_id] = download
+        # file_id однозначно указывает файл, даже если у разных отправителей совпадают имена
+        return {'type': 'download_file', 'file_name': download.file_name,
+                'file_id': download.file_id, 'sender': download.sender}
+
+    def expect_archive(self, save_path, file_ids=None, filters=None, progress=None):
+        """Готовит скачивание архива и возвращает запрос download_all (file_ids или фильтры list_files)."""
+        self.requested_archive = FileDownload(save_path, os.path.basename(save_path), progress=progress, archive=True)
+        if file_ids:
+            return {'type': 'download_all', 'file_ids': list(file_ids)}
+        return {'type': 'download_all', 'filters': filters or {}}
+
+    def new_upload(self, file_path, room, progress=None, on_status=None):
+        """Описание новой возобновляемой загрузки со стабильным upload_id."""
+        file_size = os.path.getsize(file_path)
+        buffer_size = get_buffer_size(file_size)
+        upload = {
+            'upload_id': secrets.token_hex(16),
+            'file_path': file_path,
+            'file_name': os.path.basename(file_path),
+            'file_size': file_size,
+            'buffer_size': buffer_size,
+            'total_chunks': (file_size // buffer_size) + (1 if file_size % buffer_size != 0 else 0),
+            'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'room': room,
+            'compress': get_file_type(file_path) not in INCOMPRESSIBLE_FILE_TYPES,
+            'progress': progress,  # progress(upload, отправлено чанков, всего чанков в этой отправке)
+            'on_status': on_status  # on_status(upload, статус, подробности) - см. ChatClient.upload_file
+        }
+        self.pending_uploads[upload['upload_id']] = upload
+        return upload
+
+    def offer_message(self, file_path, room):
+        """Запрос file_offer с SHA-256 файла: сервер ответит, нужно ли отправлять содержимое."""
+        file_size = os.path.getsize(file_path)
+        return {
+            'type': 'file_offer',
+            'file_name': os.path.basename(file_path),
+            'file_size': get_readable_file_size(file_size),
+            'file_size_bytes': file_size,
+            'sha256': file_sha256(file_path),
+            'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'room': room
+        }
+
+    def read_chunk(self, f, upload, chunk_number):
+        """Читает чанк загрузки из открытого файла и возвращает (заголовок кадра, данные)."""
+        offset = (chunk_number - 1) * upload['buffer_size']
+        f.seek(offset)
+        header = {
+            'type': 'file',
+            'upload_id': upload['upload_id'],
+            'file_name': upload['file_name'],
+            'file_size': get_readable_file_size(upload['file_size']),
+            'total_chunks': upload['total_chunks'],
+            'current_chunk': chunk_number,
+            'offset': offset,
+            'date': upload['date'],
+            'room': upload['room']
+        }
+        return header, f.read(upload['buffer_size'])
+
+    def report_upload(self, upload, status, detail=None):
+        if upload.get('on_status'):
+            upload['on_status'](upload, status, detail)
+
+    def upload_chunks_left(self, msg):
+        """Разбирает ответ upload_status: возвращает (загрузка, номера недостающих чанков).
+
+        Номера равны None, если загрузку нужно начать заново; загрузка - None,
+        если продолжать нечего.
+        """
+        upload = self.pending_uploads.get(msg.get('upload_id'))
+        if not upload:
+            return None, None
+        if msg.get('status') == 'complete':
+            self.pending_uploads.pop(upload['upload_id'], None)
+            self.report_upload(upload, 'complete')
+            return None, None
+        if msg.get('status') == 'partial':
+            chunks = [n for first, last in msg['missing'] for n in range(first, last + 1)]
+            self.report_upload(upload, 'resuming', len(chunks))
+            return upload, chunks
+        # Сервер не знает эту загрузку (например, она устарела): отправляем файл заново
+        self.pending_uploads.pop(upload['upload_id'], None)
+        return upload, None
+
+    def forget_uploads(self, file_name):
+        """Убирает из незавершенных загрузки файла, о сохранении которого сообщил сервер."""
+        for upload_id, upload in list(self.pending_uploads.items()):
+            if upload['file_name'] == file_name:
+                self.pending_uploads.pop(upload_id, None)
+
+    def resume_messages(self):
+        """Запросы после восстановления сессии: подписки на комнаты, докачка и продолжение загрузок."""
+        messages = []
+        # Общую комнату сервер восстанавливает сам, остальные подписки - по запросу
+        for room in self.joined_rooms - {DEFAULT_ROOM}:
+            messages.append({'type': 'join', 'room': room, 'last_message_id': self.last_message_ids.get(room)})
+        download = self.interrupted_download
+        if download:
+            messages.append({'type': 'download_file', 'file_name': download.file_name, 'file_id': download.file_id,
+                             'sender': download.sender, 'offset': download.received_bytes})
+        for upload_id in list(self.pending_uploads):
+            # Сервер ответит upload_status со списком недостающих чанков
+            messages.append({'type': 'upload_status', 'upload_id': upload_id})
+        return messages
+
+    def is_new_message(self, msg, room):
+        """Проверяет, что сообщение чата еще не показывалось (после восстановления сессии)."""
+        message_id = msg.get('id')
+        last_ids = self.last_message_ids
+        if message_id is not None:
+            if room in last_ids and message_id <= last_ids[room]:
+                return False
+            last_ids[room] = message_id
+        return True
+
+    def handle_message(self, msg, payload=None):
+        """Обновляет состояние клиента по сообщению сервера.
+
+        Возвращает FileDownload (или None, если скачивание не ждем), когда
+        за сообщением идут сырые байты файла (file_info с transfer='raw');
+        их должен прочитать транспорт и передать в write().
+        """
+        msg_type = msg.get('type')
+        if msg_type == 'message':
+            if self.is_new_message(msg, msg.get('room', DEFAULT_ROOM)):
+                self.events.append(msg)
+        elif msg_type == 'history':
+            room = msg.get('room', DEFAULT_ROOM)
+            msg['messages'] = [m for m in msg.get('messages', []) if self.is_new_message(m, room)]
+            self.events.append(msg)
+        elif msg_type in ('joined', 'left'):
+            if msg_type == 'joined':
+                self.joined_rooms.add(msg['room'])
+            else:
+                self.joined_rooms.discard(msg['room'])
+            self.events.append(msg)
+        elif msg_type == 'file_offer_result':
+            self.resolve_reply(('file_offer', msg['file_name']), msg)
+        elif msg_type == 'transfer_token':
+            self.resolve_reply(('transfer_token',), msg)
+        elif msg_type == 'upload_status':
+            self.continue_upload(msg)
+        elif msg_type == 'new_file':
+            if msg.get('sender') == self.nickname:
+                self.forget_uploads(msg['file_name'])
+            self.events.append(msg)
+        elif msg_type == 'file_info':
+            self.events.append(msg)
+            return self.start_download(msg)
+        elif msg_type == 'file_chunk':
+            self.write_download(self.download, 'download', msg.get('file_name'), payload, msg.get('file_data'))
+        elif msg_type == 'file_complete':
+            self.finish_download('download', msg.get('file_name'))
+        elif msg_type == 'archive_info':
+            self.start_archive(msg)
+        elif msg_type == 'archive_chunk':
+            self.write_download(self.archive, 'archive', msg.get('archive_name'), payload, msg.get('data'))
+        elif msg_type == 'archive_complete':
+            self.finish_download('archive', msg.get('archive_name'), msg)
+        else:
+            self.events.append(msg)
+        return None
+
+    def start_download(self, file_info):
+        """Начинает (или продолжает после обрыва) скачивание по file_info."""
+        self.abort_download('download')  # Незавершенное предыдущее скачивание больше не придет
+        interrupted = self.interrupted_download
+        if (interrupted and file_info.get('file_id') == interrupted.file_id
+                and file_info.get('offset') == interrupted.received_bytes):
+            download, offset = interrupted, interrupted.received_bytes
+        else:
+            download = self.requested_downloads.pop(file_info.get('file_id'), None)
+            offset = 0
+            if interrupted:
+                interrupted.abort()
+        self.interrupted_download = None
+        if download is None:
+            return None
+        download.name_on_server = file_info['file_name']
+        try:
+            download.open(file_info.get('file_size_bytes'), offset)
+        except OSError as e:
+            download.abort()
+            self.events.append(download.result('error', f"Не удалось создать файл: {e}"))
+            return None
+        self.download = download
+        return download
+
+    def start_archive(self, archive_info):
+        self.abort_download('archive')
+        archive = self.requested_archive
+        self.requested_archive = None
+        if archive is None:
+            return  # Архив никто не запрашивал; его кадры будут пропущены
+        archive.name_on_server = archive_info['archive_name']
+        try:
+            archive.open()
+        except OSError as e:
+            archive.abort()
+            self.events.append(archive.result('error', f"Не удалось создать файл: {e}"))
+            return
+        self.archive = archive
+
+    def write_download(self, download, kind, name, payload, hex_data):
+        """Записывает кусок файла или архива (сырые байты кадра или hex-строку)."""
+        if not download or name != download.name_on_server:
+            return
+        try:
+            download.write(payload if payload is not None else bytes.fromhex(hex_data))
+        except Exception as e:
+            self.abort_download(kind)
+            self.events.append(download.result('error', f"Ошибка при записи файла: {e}"))
+
+    def finish_download(self, kind, name, msg=None):
+        download = getattr(self, kind)
+        if not download or name != download.name_on_server:
+            return
+        setattr(self, kind, None)
+        if msg is not None and msg.get('status') != 'success':
+            download.abort()
+            self.events.append(download.result('error', msg.get('message', 'ошибка сервера')))
+            return
+        try:
+            download.finish()
+            self.events.append(download.result('success', files=(msg or {}).get('files')))
+        except Exception as e:
+            download.abort()
+            self.events.append(download.result('error', f"Не удалось сохранить файл: {e}"))
+
+    def abort_download(self, kind):
+        download = getattr(self, kind)
+        setattr(self, kind, None)
+        if download:
+            download.abort()
+
+    def connection_lost(self):
+        """Сохраняет недокачанный файл для докачки и прерывает прием архива после обрыва соединения."""
+        download = self.download
+        self.download = None
+        if download:
+            if download.suspend():
+                self.interrupted_download = download
+            else:
+                download.abort()
+        if self.archive:
+            self.events.append(self.archive.result('error', "Соединение прервано"))
+            self.abort_download('archive')
+        for download in self.requested_downloads.values():
+            download.abort()
+        self.requested_downloads.clear()
+        self.requested_archive = None
+
+    def resolve_reply(self, key, msg):
+        """Передает ответ сервера запросу, ожидающему его (реализуют подклассы)."""
+
+    def continue_upload(self, msg):
+        """Продолжает загрузку по ответу upload_status (реализуют подклассы)."""
+
+class ChatClient(ChatProtocol):
+    """Блокирующий клиент Chat Refresh без графического интерфейса.
+
+    Приложение читает сообщения сервера в одном потоке через receive() или
+    итератор messages(), а отправлять (в том числе файлы) может из любых
+    потоков: отправка кадров в сокет идет под блокировкой. Пример бота:
+
+        client = ChatClient('127.0.0.1', 12345)
+        client.login('bot', 'password')
+        client.send_chat('Привет!')
+        for msg in client.messages():
+            print(msg)
+    """
+
+    def __init__(self, host=None, port=None, features=None):
+        super().__init__(host, port, features)
+        self.socket = None
+        self.reader = None
+        self.send_lock = threading.Lock()
+        self.pending_replies = {}  # Ключ запроса: {'event', 'msg'} - запросы, ожидающие ответа сервера
+
+    def connect(self):
+        """Открывает TCP-соединение; адрес сервера ищется UDP-обнаружением, если не задан."""
+        if not self.host:
+            self.host, self.port = discover_server()
+            if not self.host:
+                raise ConnectionError("Не удалось обнаружить сервер.")
+        self.socket = socket.create_connection((self.host, self.port))
+        self.reader = FrameReader(self.socket, RECEIVE_BUFFER_SIZE)
+        self.server_features = set()
+
+    def authenticate(self, auth_msg):
+        """Подключается к серверу и отправляет запрос входа, регистрации или восстановления сессии.
+
+        Если сервер занят хешированием паролей других клиентов, он отвечает
+        status='busy' и закрывает соединение; тогда запрос повторяется через
+        указанное сервером время. Возвращает ответ сервера.
+        """
+        for attempt in range(BUSY_MAX_RETRIES + 1):
+            self.connect()
+            self.socket.sendall(encode_message(auth_msg))
+            frame = self.reader.read_frame()
+            if not frame:
+                raise ConnectionError("Нет ответа от сервера.")
+            response = json.loads(frame.header)
+            if response.get('status') != 'busy' or attempt == BUSY_MAX_RETRIES:
+                return response
+            self.socket.close()
+            time.sleep(self.busy_delay(response))
+
+    def login(self, nickname, password):
+        """Входит в чат. Возвращает ответ сервера (status 'success' или 'error' с message)."""
+        response = self.authenticate(self.auth_message('login', nickname, password))
+        self.apply_auth_response(response, nickname)
+        return response
+
+    def register(self, nickname, password):
+        """Регистрирует пользователя; при успехе соединение сразу аутентифицировано."""
+        response = self.authenticate(self.auth_message('register', nickname, password))
+        self.apply_auth_response(response, nickname)
+        return response
+
+    def resume(self):
+        """Переподключается к серверу по токену сессии. Возвращает True при успехе."""
+        if not self.session_token:
+            return False
+        try:
+            response = self.authenticate(self.auth_message('resume'))
+        except OSError:
+            return False  # Сервер недоступен: токен пригодится для следующей попытки
+        if response.get('status') != 'success':
+            self.session_token = None  # Токен отозван или истек: нужен обычный вход
+            return False
+        self.apply_auth_response(response)
+        return True
+
+    def reconnect(self, attempts=RECONNECT_ATTEMPTS, initial_delay=RECONNECT_INITIAL_DELAY,
+                  max_delay=RECONNECT_MAX_DELAY):
+        """Восстанавливает сессию после обрыва с растущей паузой и продолжает прерванные передачи."""
+        delay = initial_delay
+        for _ in range(attempts):
+            if not self.session_token:
+                return False
+            time.sleep(delay)
+            if self.resume():
+                for msg in self.resume_messages():
+                    self.send(msg)
+                return True
+            delay = min(delay * 2, max_delay)
+        return False
+
+    def close(self):
+        if self.socket:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+
+    def send(self, msg):
+        """Отправляет сообщение серверу (сжатое, если сжатие согласовано)."""
+        data = self.encode(msg)
+        with self.send_lock:
+            self.socket.sendall(data)
+
+    def send_chunk(self, header, payload, compress=False, sock=None):
+        """Отправляет чанк файла; sock - соединение передачи данных, по умолчанию основное."""
+        frame = self.encode_chunk(header, payload, compress)
+        if sock is not None:
+            sock.sendall(frame)
+            return
+        with self.send_lock:
+            self.socket.sendall(frame)
+
+    def send_chat(self, content, room=DEFAULT_ROOM):
+        self.send({'type': 'message', 'content': content, 'room': room})
+
+    def send_direct(self, recipient, content):
+        self.send({'type': 'direct', 'to': recipient, 'content': content})
+
+    def join_room(self, room):
+        self.send({'type': 'join', 'room': room, 'last_message_id': self.last_message_ids.get(room)})
+
+    def leave_room(self, room):
+        self.send({'type': 'leave', 'room': room})
+
+    def list_rooms(self):
+        self.send({'type': 'list_rooms'})
+
+    def list_files(self, cursor=None, limit=None, sort='id', order='asc', filters=None):
+        """Запрашивает страницу списка файлов; ответ придет сообщением files_list."""
+        self.send(self.list_files_message(cursor, limit, sort, order, filters))
+
+    def download_file(self, file_info, save_path, progress=None):
+        """Запрашивает файл из списка; по завершении придет событие download_done."""
+        self.send(self.expect_download(file_info, save_path, progress))
+
+    def download_archive(self, save_path, file_ids=None, filters=None, progress=None):
+        """Запрашивает выбранные файлы (или все под фильтрами) одним zip-архивом."""
+        self.send(self.expect_archive(save_path, file_ids, filters, progress))
+
+    def receive(self):
+        """Возвращает следующее сообщение для приложения или None, если соединение закрыто."""
+        while not self.events:
+            try:
+                frame = self.reader.read_frame() if self.reader else None
+                if frame and frame.header:
+                    msg = json.loads(frame.header)
+                    download = self.handle_message(msg, frame.payload)
+                    if msg['type'] == 'file_info' and msg.get('transfer') == 'raw':
+                        self.receive_raw_file(msg, download)
+            except OSError:
+                frame = None  # Обрыв соединения (в том числе посреди тела файла)
+            if not frame:
+                self.connection_lost()
+                return self.events.popleft() if self.events else None
+        return self.events.popleft()
+
+    def messages(self):
+        """Итератор сообщений сервера до закрытия соединения."""
+        while True:
+            msg = self.receive()
+            if msg is None:
+                return
+            yield msg
+
+    def receive_raw_file(self, file_info, download):
+        """Принимает тело файла, идущее сырыми байтами сразу за file_info.
+
+        Байты нужно дочитать из сокета, даже если скачивание отменено, иначе
+        следующие сообщения будут разобраны неверно.
+        """
+        def sink(data):
+            if self.download is download and download is not None:
+                try:
+                    download.write(data)
+                except Exception as e:
+                    self.abort_download('download')
+                    self.events.append(download.result('error', f"Ошибка при записи файла: {e}"))
+
+        if not self.reader.read_raw(file_info['length'], sink):
+            raise ConnectionError("Соединение закрыто во время скачивания файла")
+
+    def request_reply(self, key, msg, timeout):
+        """Отправляет запрос и ждет ответа, который поток приема передаст через resolve_reply.
+
+        Возвращает ответ или None, если он не пришел за timeout секунд.
+        """
+        pending = {'event': threading.Event(), 'msg': None}
+        self.pending_replies[key] = pending
+        try:
+            self.send(msg)
+            pending['event'].wait(timeout)
+            return pending['msg']
+        finally:
+            self.pending_replies.pop(key, None)
+
+    def resolve_reply(self, key, msg):
+        pending = self.pending_replies.get(key)
+        if pending:
+            pending['msg'] = msg
+            pending['event'].set()
+
+    def upload_file(self, file_path, room=DEFAULT_ROOM, progress=None, on_status=None):
+        """Отправляет файл и возвращает итог; блокирует вызывающий поток.
+
+        Итог (он же передается в on_status(загрузка, статус, подробности)):
+        'exists' - такое содержимое уже было на сервере и передавать его не
+        понадобилось; 'sent' - все чанки отправлены; 'interrupted' - соединение
+        оборвалось, загрузка продолжится после reconnect(); 'rerouted' -
+        оборвалось соединение передачи данных, и остаток идет по основному.
+        После переподключения on_status также получает 'resuming' (число
+        недостающих чанков) или 'complete'. Ответ на file_offer читает поток
+        приема, поэтому он должен работать.
+        """
+        offer = self.offer_message(file_path, room)
+        reply = self.request_reply(('file_offer', offer['file_name']), offer, FILE_OFFER_TIMEOUT)
+        # Сервер без поддержки file_offer не ответит: тогда просто отправляем файл
+        if reply is not None and reply.get('status') == 'exists':
+            upload = {'file_path': file_path, 'file_name': offer['file_name'], 'on_status': on_status}
+            self.report_upload(upload, 'exists')
+            return 'exists'
+        upload = self.new_upload(file_path, room, progress, on_status)
+        return self.send_upload_chunks(upload, range(1, upload['total_chunks'] + 1))
+
+    def send_upload_chunks(self, upload, chunk_numbers):
+        """Отправляет указанные чанки загрузки (номера с 1).
+
+        Большие файлы идут по нескольким соединениям передачи данных, чтобы
+        основное соединение оставалось свободным для чата. При обрыве
+        соединения загрузка остается в pending_uploads и после
+        переподключения продолжается с недостающих чанков.
+        """
+        chunk_numbers = list(chunk_numbers)
+        progress = {'sent': 0, 'total': len(chunk_numbers), 'lock': threading.Lock()}
+        streams = []
+        try:
+            if (upload['file_size'] >= PARALLEL_UPLOAD_THRESHOLD and not upload.get('single_stream')
+                    and FEATURE_DATA_STREAMS in self.server_features):
+                streams = self.open_data_streams()
+            if streams:
+                self.send_chunks_parallel(upload, chunk_numbers, streams, progress)
+            else:
+                self.send_chunks(None, upload, chunk_numbers, progress)
+        except OSError as e:
+            if not os.path.exists(upload['file_path']):
+                self.pending_uploads.pop(upload['upload_id'], None)
+                raise
+            if streams:
+                # Оборвалось соединение передачи данных; если основное живо, досылаем через него
+                upload['single_stream'] = True
+                self.report_upload(upload, 'rerouted', str(e))
+                self.send({'type': 'upload_status', 'upload_id': upload['upload_id']})
+                return 'rerouted'
+            self.report_upload(upload, 'interrupted', str(e))
+            return 'interrupted'
+        self.report_upload(upload, 'sent')
+        return 'sent'
+
+    def send_chunks(self, sock, upload, chunk_numbers, progress):
+        """Отправляет чанки загрузки в сокет; chunk_numbers - список или очередь номеров."""
+        with open(upload['file_path'], 'rb') as f:
+            for chunk_number in iter_chunk_numbers(chunk_numbers):
+                header, file_data = self.read_chunk(f, upload, chunk_number)
+                self.send_chunk(header, file_data, upload['compress'], sock)
+                with progress['lock']:
+                    progress['sent'] += 1
+                    sent = progress['sent']
+                if upload.get('progress'):
+                    upload['progress'](upload, sent, progress['total'])
+
+    def send_chunks_parallel(self, upload, chunk_numbers, streams, progress):
+        """Раздает чанки по соединениям передачи данных; сервер собирает файл по смещениям.
+
+        Каждое соединение берет следующий номер из общей очереди, поэтому
+        быстрые соединения отправляют больше. После отправки соединение
+        закрывается на запись и дочитывает ответы сервера, чтобы убедиться,
+        что все чанки обработаны.
+        """
+        work = queue.Queue()
+        for chunk_number in chunk_numbers:
+            work.put(chunk_number)
+        errors = []
+
+        def worker(sock, reader):
+            try:
+                self.send_chunks(sock, upload, work, progress)
+                sock.shutdown(socket.SHUT_WR)
+                while True:
+                    frame = reader.read_frame()
+                    if not frame:
+                        break
+                    reply = json.loads(frame.header)
+                    if reply.get('status') == 'error':
+                        errors.append(OSError(reply.get('message')))
+            except OSError as e:
+                errors.append(e)
+            finally:
+                sock.close()
+
+        threads = [threading.Thread(target=worker, args=stream, daemon=True) for stream in streams]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def open_data_streams(self):
+        """Открывает соединения передачи данных по токену от сервера.
+
+        Возвращает список пар (сокет, FrameReader); пустой, если сервер их не поддерживает.
+        """
+        reply = self.request_reply(('transfer_token',), {'type': 'transfer_token'}, TRANSFER_TOKEN_TIMEOUT)
+        if not reply:
+            return []
+        address = self.socket.getpeername()
+        streams = []
+        for _ in range(min(TRANSFER_STREAMS, reply.get('streams', 1))):
+            try:
+                sock = socket.create_connection(address)
+                sock.sendall(encode_message({'type': 'data_connect', 'token': reply['token'],
+                                             'features': self.features}))
+                reader = FrameReader(sock, RECEIVE_BUFFER_SIZE)
+                frame = reader.read_frame()
+                if not frame or json.loads(frame.header).get('status') != 'success':
+                    sock.close()
+                    break
+                streams.append((sock, reader))
+            except OSError:
+                break
+        return streams
+
+    def continue_upload(self, msg):
+        """Продолжает загрузку по ответу upload_status в отдельном потоке."""
+        upload, chunks = self.upload_chunks_left(msg)
+        if upload is None:
+            return
+        if chunks is None:
+            target, args = self.upload_file, (upload['file_path'], upload['room'],
+                                              upload['progress'], upload['on_status'])
+        else:
+            target, args = self.send_upload_chunks, (upload, chunks)
+        threading.Thread(target=self.run_upload, args=(upload, target, args), daemon=True).start()
+
+    def run_upload(self, upload, target, args):
+        try:
+            target(*args)
+        except Exception as e:
+            self.report_upload(upload, 'failed', str(e))
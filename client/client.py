@@ -1,15 +1,13 @@
 # client.py
-import socket
 import threading
-import json
 import customtkinter as ctk
 from tkinter import messagebox, filedialog, scrolledtext, ttk
 import tkinter as tk
 import os
 from customtkinter import CTkTextbox
 from PIL import Image, ImageTk
-from datetime import datetime
 import random
+from chat_client import ChatClient, DEFAULT_ROOM, get_readable_file_size
 
 # Настройки customtkinter
 ctk.set_appearance_mode("System")  # "System" (light/dark), "Dark", "Light"
@@ -30,16 +28,9 @@ COLORS = {
 # Минимальная длина для никнейма и пароля
 MIN_NICKNAME_LENGTH = 3
 MIN_PASSWORD_LENGTH = 6
-
-# Константы для размеров файлов и буферов
-SMALL_FILE_THRESHOLD = 1024 * 1024  # 1 MB
-MEDIUM_FILE_THRESHOLD = 10 * 1024 * 1024  # 10 MB
-LARGE_FILE_THRESHOLD = 100 * 1024 * 1024  # 100 MB
-
-SMALL_FILE_BUFFER = 512 * 1024  # 512 KB для файлов < 1 MB
-MEDIUM_FILE_BUFFER = 1024 * 1024  # 1 MB для файлов от 1 MB до 10 MB
-LARGE_FILE_BUFFER = 2 * 1024 * 1024  # 2 MB для файлов от 10 MB до 100 MB
-HUGE_FILE_BUFFER = 4 * 1024 * 1024  # 4 MB для файлов > 100 MB
+FILES_PAGE_SIZE = 200  # Сколько файлов запрашивать за одну страницу
+FILES_PREFETCH_THRESHOLD = 0.9  # Догружать следующую страницу, когда прокручено столько таблицы
+ARCHIVE_PROGRESS_STEP = 10 * 1024 * 1024  # Как часто сообщать о ходе скачивания архива, байт
 
 # Список приветственных фраз
 WELCOME_MESSAGES = [
@@ -69,7 +60,7 @@ class App(ctk.CTk):
         # Устанавливаем фон приложения
         self.configure(fg_color=COLORS['app_bg'])
 
-        self.socket = None
+        self.client = ChatClient()  # Протокол чата; адрес сервера ищется UDP-обнаружением
         self.receive_thread = None
 
         # Создаем контейнер для всех фреймов
@@ -109,51 +100,10 @@ class App(ctk.CTk):
 
     def register_success(self, nickname):
         """Обработчик успешной регистрации."""
+        self.client.close()  # Соединение регистрации не используется: пользователь войдет заново
         messagebox.showinfo("Регистрация", "Аккаунт успешно создан! Пожалуйста, войдите в систему.")
         self.show_frame("LoginFrame")
 
-    def connect_to_server(self):
-        """Устанавливает TCP-соединение с сервером."""
-        server_ip, tcp_port = self.discover_server()
-        if server_ip and tcp_port:
-            try:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.connect((server_ip, tcp_port))
-                return True
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось подключиться к серверу: {e}")
-                return False
-        else:
-            messagebox.showerror("Ошибка", "Не удалось обнаружить сервер.")
-            return False
-
-    def discover_server(self):
-        """Реализует UDP-обнаружение сервера."""
-        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udp_socket.settimeout(5)
-        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-
-        message = 'DISCOVER_SERVER'.encode()
-        udp_socket.sendto(message, ('<broadcast>', 37020))
-        print("Отправлен запрос на обнаружение сервера...")
-
-        try:
-            while True:
-                data, addr = udp_socket.recvfrom(1024)
-                response = data.decode().strip()
-                print(f"Получен ответ от {addr}: {response}")
-                if response.startswith('SERVER_IP'):
-                    server_info = dict(item.split(':') for item in response.split(';'))
-                    server_ip = server_info['SERVER_IP']
-                    tcp_port = int(server_info['TCP_PORT'])
-                    print(f"Найден сервер по адресу {server_ip}:{tcp_port}")
-                    return server_ip, tcp_port
-        except socket.timeout:
-            print("Не удалось обнаружить сервер.")
-            return None, None
-        finally:
-            udp_socket.close()
-
 class LoginFrame(ctk.CTkFrame):
     """Экран входа."""
 
@@ -256,16 +206,8 @@ class LoginFrame(ctk.CTkFrame):
 
     def perform_login(self, nickname, password):
         """Отправляет запрос на вход на сервер."""
-        if not self.controller.connect_to_server():
-            return
         try:
-            login_msg = {'type': 'login', 'nickname': nickname, 'password': password}
-            self.controller.socket.send((json.dumps(login_msg) + '\n').encode())
-            response_data = self.receive_response()
-            if not response_data:
-                messagebox.showerror("Ошибка", "Нет ответа от сервера.")
-                return
-            response = json.loads(response_data)
+            response = self.controller.client.login(nickname, password)
             if response['status'] == 'success':
                 self.login_success_callback(nickname)
             else:
@@ -273,22 +215,6 @@ class LoginFrame(ctk.CTkFrame):
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось выполнить вход: {e}")
 
-    def receive_response(self):
-        """Принимает одно полное сообщение, разделенное '\n'."""
-        buffer = ""
-        try:
-            while True:
-                data = self.controller.socket.recv(4096).decode()
-                if not data:
-                    return None
-                buffer += data
-                if '\n' in buffer:
-                    message, buffer = buffer.split('\n', 1)
-                    return message.strip()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при получении ответа: {e}")
-            return None
-
 class RegisterFrame(ctk.CTkFrame):
     """Экран регистрации."""
 
@@ -396,16 +322,8 @@ class RegisterFrame(ctk.CTkFrame):
 
     def perform_register(self, nickname, password):
         """Отправляет запрос на регистрацию на сервер."""
-        if not self.controller.connect_to_server():
-            return
         try:
-            register_msg = {'type': 'register', 'nickname': nickname, 'password': password}
-            self.controller.socket.send((json.dumps(register_msg) + '\n').encode())
-            response_data = self.receive_response()
-            if not response_data:
-                messagebox.showerror("Ошибка", "Нет ответа от сервера.")
-                return
-            response = json.loads(response_data)
+            response = self.controller.client.register(nickname, password)
             if response['status'] == 'success':
                 self.register_success_callback(nickname)
             else:
@@ -413,31 +331,19 @@ class RegisterFrame(ctk.CTkFrame):
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось зарегистрироваться: {e}")
 
-    def receive_response(self):
-        """Принимает одно полное сообщение, разделенное '\n'."""
-        buffer = ""
-        try:
-            while True:
-                data = self.controller.socket.recv(4096).decode()
-                if not data:
-                    return None
-                buffer += data
-                if '\n' in buffer:
-                    message, buffer = buffer.split('\n', 1)
-                    return message.strip()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при получении ответа: {e}")
-            return None
-
 class ChatFrame(ctk.CTkFrame):
-    """Экран чата."""
+    """Экран чата: отображает события ChatClient и передает ему действия пользователя."""
 
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
+        self.client = controller.client
         self.nickname = None
-        self.server_files = {}  # file_name: file_info
-        self.current_download = None  # Для отслеживания текущей загрузки
+        self.server_files = {}  # id строки таблицы: file_info
+        self.files_query = {'sort': 'id', 'order': 'asc', 'filters': {}}  # Текущие сортировка и фильтры таблицы
+        self.files_next_cursor = None  # Курсор следующей страницы списка файлов
+        self.files_loading = False  # Запрос страницы отправлен, ответ еще не пришел
+        self.current_room = DEFAULT_ROOM  # Комната, в которую отправляются сообщения и файлы
         
         self.configure(fg_color=COLORS['app_bg'])
         self.create_widgets()
@@ -502,6 +408,20 @@ class ChatFrame(ctk.CTkFrame):
         )
         refresh_button.grid(row=0, column=0, pady=(10, 5), padx=10, sticky="e")
 
+        # Поиск по началу имени файла
+        self.files_search_entry = ctk.CTkEntry(
+            files_container,
+            placeholder_text="Поиск...",
+            corner_radius=10,
+            fg_color=COLORS['entry_bg'],
+            text_color=COLORS['text_color'],
+            placeholder_text_color=COLORS['placeholder_color'],
+            border_width=0,
+            width=120
+        )
+        self.files_search_entry.grid(row=0, column=0, pady=(10, 5), padx=(0, 120), sticky="e")
+        self.files_search_entry.bind("<Return>", self.apply_files_search)
+
         # Создаем Treeview для списка файлов
         self.files_tree = ttk.Treeview(
             files_container,
@@ -510,12 +430,12 @@ class ChatFrame(ctk.CTkFrame):
             style="Custom.Treeview"
         )
 
-        # Настраиваем заголовки колонок
-        self.files_tree.heading("name", text="Имя файла")
-        self.files_tree.heading("size", text="Размер")
-        self.files_tree.heading("type", text="Тип")
-        self.files_tree.heading("sender", text="Отправитель")
-        self.files_tree.heading("date", text="Дата")
+        # Настраиваем заголовки колонок; щелчок по заголовку меняет сортировку на сервере
+        self.files_tree.heading("name", text="Имя файла", command=lambda: self.sort_files_by('name'))
+        self.files_tree.heading("size", text="Размер", command=lambda: self.sort_files_by('size'))
+        self.files_tree.heading("type", text="Тип", command=lambda: self.sort_files_by('type'))
+        self.files_tree.heading("sender", text="Отправитель", command=lambda: self.sort_files_by('sender'))
+        self.files_tree.heading("date", text="Дата", command=lambda: self.sort_files_by('date'))
 
         # Настраиваем ширину колонок
         self.files_tree.column("name", width=120)
@@ -525,12 +445,12 @@ class ChatFrame(ctk.CTkFrame):
         self.files_tree.column("date", width=100)
 
         # Добавляем скроллбар для таблицы
-        table_scrollbar = ttk.Scrollbar(files_container, orient="vertical", command=self.files_tree.yview)
-        self.files_tree.configure(yscrollcommand=table_scrollbar.set)
+        self.files_scrollbar = ttk.Scrollbar(files_container, orient="vertical", command=self.files_tree.yview)
+        self.files_tree.configure(yscrollcommand=self.on_files_scroll)
 
         # Размещаем Treeview и скроллбар
         self.files_tree.grid(row=1, column=0, sticky="nsew", padx=(10, 0), pady=(5, 10))
-        table_scrollbar.grid(row=1, column=1, sticky="ns", pady=(5, 10), padx=(0, 10))
+        self.files_scrollbar.grid(row=1, column=1, sticky="ns", pady=(5, 10), padx=(0, 10))
 
         # Создаем фрейм для системных сообщений и кнопки
         system_frame = ctk.CTkFrame(files_container, fg_color=COLORS['card_bg'])
@@ -548,9 +468,12 @@ class ChatFrame(ctk.CTkFrame):
         )
         self.system_messages.pack(side="left", fill="both", expand=True, padx=(0, 5))
 
-        # Кнопка скачивания
+        # Кнопки скачивания
+        download_buttons = ctk.CTkFrame(system_frame, fg_color=COLORS['card_bg'])
+        download_buttons.pack(side="right", padx=(5, 0))
+
         download_button = ctk.CTkButton(
-            system_frame,
+            download_buttons,
             text="Скачать",
             command=self.download_selected_file,
             fg_color=COLORS['button_bg'],
@@ -559,31 +482,104 @@ class ChatFrame(ctk.CTkFrame):
             corner_radius=10,
             width=100
         )
-        download_button.pack(side="right", padx=(5, 0))
+        download_button.pack(pady=(0, 5))
+
+        # Скачивание выбранных файлов (или всех под текущими фильтрами) одним архивом
+        download_all_button = ctk.CTkButton(
+            download_buttons,
+            text="Скачать все",
+            command=self.download_all_files,
+            fg_color=COLORS['button_bg'],
+            hover_color=COLORS['button_hover'],
+            text_color=COLORS['text_color'],
+            corner_radius=10,
+            width=100
+        )
+        download_all_button.pack()
+
+    def request_files_list(self, cursor=None):
+        """Запрашивает страницу списка файлов с сервера.
 
-    def request_files_list(self):
-        """Запрашивает список файлов с сервера."""
+        Без курсора запрашивается первая страница, и таблица заполняется заново.
+        """
         try:
-            msg = {'type': 'list_files'}
-            self.controller.socket.send((json.dumps(msg) + '\n').encode())
-            self.append_system_message("Запрос списка файлов отправлен.")
+            self.files_loading = True
+            self.client.list_files(cursor, FILES_PAGE_SIZE, **self.files_query)
+            if cursor is None:
+                self.append_system_message("Запрос списка файлов отправлен.")
         except Exception as e:
+            self.files_loading = False
             self.append_system_message(f"Ошибка при запросе списка файлов: {e}")
             messagebox.showerror("Ошибка", f"Не удалось запросить список файлов: {e}")
 
-    def display_files_list(self, files):
-        """Отображает список файлов в таблице."""
-        # Очищаем текущий список
-        for item in self.files_tree.get_children():
-            self.files_tree.delete(item)
-        
-        # Добавляем новые файлы
-        for file_info in files:
+    def on_files_scroll(self, first, last):
+        """Двигает скроллбар и догружает следующую страницу при прокрутке к концу таблицы."""
+        self.files_scrollbar.set(first, last)
+        if self.files_next_cursor is not None and not self.files_loading and float(last) >= FILES_PREFETCH_THRESHOLD:
+            self.request_files_list(self.files_next_cursor)
+
+    def sort_files_by(self, sort):
+        """Сортирует таблицу по колонке; повторный щелчок меняет направление."""
+        if self.files_query['sort'] == sort:
+            self.files_query['order'] = 'desc' if self.files_query['order'] == 'asc' else 'asc'
+        else:
+            self.files_query['sort'] = sort
+            self.files_query['order'] = 'asc'
+        self.request_files_list()
+
+    def apply_files_search(self, event=None):
+        """Фильтрует таблицу по началу имени файла."""
+        prefix = self.files_search_entry.get().strip()
+        self.files_query['filters'] = {'name_prefix': prefix} if prefix else {}
+        self.request_files_list()
+
+    def display_files_list(self, msg):
+        """Добавляет в таблицу полученную страницу списка файлов."""
+        if (msg.get('sort', 'id'), msg.get('order', 'asc'), msg.get('filters', {})) != (
+                self.files_query['sort'], self.files_query['order'], self.files_query['filters']):
+            return  # Ответ на запрос с прежними сортировкой или фильтром
+        if msg.get('cursor') is None:
+            # Первая страница: очищаем текущий список
+            self.files_tree.delete(*self.files_tree.get_children())
+            self.server_files.clear()
+        for file_info in msg.get('files', []):
             self.add_file_to_table(file_info)
+        self.files_next_cursor = msg.get('next_cursor')
+        self.files_loading = False
 
-    def add_file_to_table(self, file_info):
+    def apply_new_file(self, file_info):
+        """Добавляет в таблицу файл из уведомления new_file, не перезагружая список."""
+        if not self.file_matches_query(file_info):
+            return
+        if self.files_query['sort'] != 'id':
+            return  # Место файла в другой сортировке знает только сервер; он появится при обновлении
+        if self.files_query['order'] == 'desc':
+            self.add_file_to_table(file_info, index=0)
+        elif self.files_next_cursor is None:
+            self.add_file_to_table(file_info)
+        # Иначе файл придет вместе с последней страницей
+
+    def file_matches_query(self, file_info):
+        """Проверяет, проходит ли файл текущие фильтры таблицы."""
+        filters = self.files_query['filters']
+        if filters.get('sender') and file_info.get('sender') != filters['sender']:
+            return False
+        if filters.get('file_type') and file_info.get('file_type') != filters['file_type']:
+            return False
+        if filters.get('name_prefix') and not file_info.get('file_name', '').startswith(filters['name_prefix']):
+            return False
+        if filters.get('date_from') and file_info.get('date', '') < filters['date_from']:
+            return False
+        if filters.get('date_to') and file_info.get('date', '') > filters['date_to']:
+            return False
+        return True
+
+    def add_file_to_table(self, file_info, index='end'):
         """Добавляет файл в таблицу."""
-        self.files_tree.insert('', 'end', values=(
+        item_id = f"file_{file_info['file_id']}" if file_info.get('file_id') is not None else None
+        if item_id and self.files_tree.exists(item_id):
+            return  # Файл уже есть в таблице
+        item = self.files_tree.insert('', index, iid=item_id, values=(
             file_info['file_name'],
             file_info['file_size'],
             file_info['file_type'],
@@ -591,7 +587,7 @@ class ChatFrame(ctk.CTkFrame):
             file_info['date']
         ))
         # Сохраняем информацию о файле
-        self.server_files[file_info['file_name']] = file_info
+        self.server_files[item] = file_info
 
     def download_selected_file(self):
         """Скачивает выбранный файл."""
@@ -601,126 +597,153 @@ class ChatFrame(ctk.CTkFrame):
             return
         
         item = selection[0]
+        file_info = self.server_files.get(item, {})
         file_name = self.files_tree.item(item)['values'][0]
+        save_path = filedialog.asksaveasfilename(
+            initialfile=file_name,
+            defaultextension=os.path.splitext(file_name)[1]
+        )
+        if not save_path:
+            self.append_system_message("Скачивание файла отменено.")
+            return
         
         try:
-            msg = {'type': 'download_file', 'file_name': file_name}
-            self.controller.socket.send((json.dumps(msg) + '\n').encode())
+            self.client.download_file(dict(file_info, file_name=file_name), save_path,
+                                      self.download_progress(file_name))
             self.append_system_message(f"Запрос на скачивание файла {file_name} отправлен.")
         except Exception as e:
             self.append_system_message(f"Ошибка при запросе файла: {e}")
             messagebox.showerror("Ошибка", f"Не удалось запросить файл: {e}")
 
     def download_all_files(self):
-        """Скачивает все файлы."""
+        """Скачивает одним zip-архивом выбранные файлы (если выбрано несколько) или все файлы под текущими фильтрами."""
         if not self.files_tree.get_children():
             messagebox.showinfo("Информация", "Нет доступных файлов для скачивания.")
             return
         
+        selection = self.files_tree.selection()
+        file_ids = [self.server_files[item]['file_id'] for item in selection
+                    if self.server_files.get(item, {}).get('file_id') is not None]
+        save_path = filedialog.asksaveasfilename(initialfile="files.zip", defaultextension=".zip")
+        if not save_path:
+            self.append_system_message("Скачивание файлов отменено.")
+            return
+
         try:
-            msg = {'type': 'download_all'}
-            self.controller.socket.send((json.dumps(msg) + '\n').encode())
-            self.append_system_message("Запрос на скачивание всех файлов отправлен.")
+            self.client.download_archive(save_path, file_ids if len(file_ids) > 1 else None,
+                                         self.files_query['filters'], self.download_progress(save_path))
+            self.append_system_message("Запрос на скачивание файлов архивом отправлен.")
         except Exception as e:
             self.append_system_message(f"Ошибка при запросе файлов: {e}")
             messagebox.showerror("Ошибка", f"Не удалось запросить файлы: {e}")
 
-    def prepare_file_download(self, file_info):
-        """Подготавливает скачивание файла."""
-        save_path = filedialog.asksaveasfilename(
-            initialfile=file_info['file_name'],
-            defaultextension=os.path.splitext(file_info['file_name'])[1]
-        )
-        if save_path:
-            self.current_download = {
-                'file_name': file_info['file_name'],
-                'save_path': save_path,
-                'total_chunks': file_info['total_chunks'],
-                'received_chunks': 0,
-                'file_data': b''
-            }
+    def download_progress(self, name):
+        """Возвращает callback, сообщающий о ходе скачивания каждые 10% (или ARCHIVE_PROGRESS_STEP для архива)."""
+        reported = {'value': 0}
+
+        def progress(received, total):
+            if total:
+                percent = received * 100 // total
+                if percent >= reported['value'] + 10:
+                    reported['value'] = percent
+                    self.append_system_message(f"Получено {percent}% файла {name}")
+            elif received >= reported['value'] + ARCHIVE_PROGRESS_STEP:
+                reported['value'] = received
+                self.append_system_message(f"Получено {get_readable_file_size(received)} "
+                                           f"архива {os.path.basename(name)}")
+
+        return progress
+
+    def show_download_result(self, msg):
+        """Сообщает о завершении скачивания файла или архива."""
+        if msg['status'] != 'success':
+            self.append_system_message(f"Не удалось скачать {msg['file_name']}: {msg.get('message')}")
+        elif msg['archive']:
+            self.append_system_message(f"Архив из {msg.get('files') or 0} файлов сохранён в {msg['save_path']}")
         else:
-            self.current_download = None
-            self.append_system_message("Скачивание файла отменено.")
-
-    def handle_file_chunk(self, msg):
-        """Обрабатывает получение чанка файла."""
-        if not self.current_download or msg['file_name'] != self.current_download['file_name']:
-            return
-        
-        try:
-            chunk_data = bytes.fromhex(msg['file_data'])
-            self.current_download['file_data'] += chunk_data
-            self.current_download['received_chunks'] += 1
-            
-            # Обновляем прогресс
-            progress = (self.current_download['received_chunks'] / self.current_download['total_chunks']) * 100
-            self.append_system_message(f"Получено {progress:.1f}% файла {self.current_download['file_name']}")
-        except Exception as e:
-            self.append_system_message(f"Ошибка при обработке чанка файла: {e}")
-
-    def finalize_file_download(self, msg):
-        """Завершает скачивание файла."""
-        if not self.current_download or msg['file_name'] != self.current_download['file_name']:
-            return
-        
-        try:
-            with open(self.current_download['save_path'], 'wb') as f:
-                f.write(self.current_download['file_data'])
-            self.append_system_message(f"Файл {self.current_download['file_name']} успешно сохранён")
-        except Exception as e:
-            self.append_system_message(f"Ошибка при сохранении файла: {e}")
-            messagebox.showerror("Ошибка", f"Не удалось сохранить файл: {e}")
-        finally:
-            self.current_download = None
+            self.append_system_message(f"Файл {msg['file_name']} успешно сохранён")
 
     def receive_messages(self):
-        """Получает сообщения от сервера."""
-        buffer = ""
+        """Получает сообщения от сервера, восстанавливая сессию после обрыва соединения."""
+        while True:
+            self.receive_until_disconnect()
+            if not self.client.reconnect():
+                break
+            self.append_message("Соединение с сервером восстановлено.")
+            self.request_files_list()
+
+    def receive_until_disconnect(self):
+        """Получает сообщения от сервера до закрытия соединения."""
         try:
-            while True:
-                data = self.controller.socket.recv(4096).decode()
-                if not data:
-                    break
-                buffer += data
-                while '\n' in buffer:
-                    message, buffer = buffer.split('\n', 1)
-                    if not message.strip():
-                        continue
-                    msg = json.loads(message)
-                    
-                    if msg['type'] == 'message':
-                        sender = msg.get('sender', 'Unknown')
-                        content = msg.get('content', '')
-                        self.append_message(f"{sender}: {content}")
-                    
-                    elif msg['type'] == 'files_list':
-                        files = msg.get('files', [])
-                        self.display_files_list(files)
-                    
-                    elif msg['type'] == 'new_file':
-                        self.add_file_to_table(msg)
-                        self.append_message(f"Новый файл на сервере: {msg['file_name']}")
-                    
-                    elif msg['type'] == 'file_info':
-                        self.prepare_file_download(msg)
-                    
-                    elif msg['type'] == 'file_chunk':
-                        self.handle_file_chunk(msg)
-                    
-                    elif msg['type'] == 'file_complete':
-                        self.finalize_file_download(msg)
-                    
+            for msg in self.client.messages():
+                if msg['type'] == 'message':
+                    self.show_chat_message(msg, msg.get('room', DEFAULT_ROOM))
+
+                elif msg['type'] == 'history':
+                    if msg.get('truncated'):
+                        self.append_message("...")
+                    for message in msg.get('messages', []):
+                        self.show_chat_message(message, msg.get('room', DEFAULT_ROOM))
+
+                elif msg['type'] == 'joined':
+                    self.current_room = msg['room']
+                    self.append_system_message(f"Вы вошли в комнату {msg['room']}.")
+
+                elif msg['type'] == 'left':
+                    if self.current_room == msg['room']:
+                        self.current_room = DEFAULT_ROOM
+                    self.append_system_message(f"Вы покинули комнату {msg['room']}.")
+
+                elif msg['type'] == 'direct':
+                    if msg.get('sender') == self.nickname:
+                        # Копия сообщения, отправленного с другого устройства
+                        self.append_message(f"[ЛС для {msg.get('to')}] Вы: {msg.get('content', '')}")
                     else:
-                        self.append_message(f"Получено неизвестное сообщение типа: {msg['type']}")
+                        self.append_message(f"[ЛС от {msg.get('sender')}] {msg.get('content', '')}")
+
+                elif msg['type'] == 'offline_messages':
+                    for message in msg.get('messages', []):
+                        self.append_message(f"[ЛС от {message.get('sender')}] {message.get('content', '')}")
+
+                elif msg['type'] == 'direct_status':
+                    if msg.get('status') == 'queued':
+                        self.append_system_message(f"{msg['to']} не в сети: сообщение будет доставлено при входе.")
+                    elif msg.get('status') == 'rejected':
+                        self.append_system_message(msg.get('message', 'Сообщение не доставлено.'))
+
+                elif msg['type'] == 'rooms_list':
+                    rooms = ", ".join(f"{room} ({count})" for room, count in sorted(msg.get('rooms', {}).items()))
+                    self.append_system_message(f"Комнаты: {rooms}")
+                
+                elif msg['type'] == 'files_list':
+                    self.display_files_list(msg)
+                
+                elif msg['type'] == 'new_file':
+                    self.apply_new_file(msg)
+                    self.append_message(f"Новый файл на сервере: {msg['file_name']}")
+                
+                elif msg['type'] == 'file_info':
+                    if msg.get('offset'):
+                        self.append_system_message(f"Продолжается скачивание файла {msg['file_name']} "
+                                                   f"с {get_readable_file_size(msg['offset'])}.")
+                
+                elif msg['type'] == 'download_done':
+                    self.show_download_result(msg)
+                
+                else:
+                    self.append_message(f"Получено неизвестное сообщение типа: {msg['type']}")
         
         except Exception as e:
             self.append_message(f"Ошибка при получении сообщений: {e}")
         finally:
-            if self.controller.socket:
-                self.controller.socket.close()
+            self.client.close()
             self.append_message("Соединение с сервером закрыто.")
 
+    def show_chat_message(self, msg, room=DEFAULT_ROOM):
+        """Показывает сообщение чата (повторы после восстановления сессии отсеивает ChatClient)."""
+        prefix = f"[{room}] " if room != DEFAULT_ROOM else ""
+        self.append_message(f"{prefix}{msg.get('sender', 'Unknown')}: {msg.get('content', '')}")
+
     def create_chat_display_frame(self, parent):
         """Создает рамку отображения чата."""
         self.chat_display_frame = ctk.CTkFrame(parent, fg_color=COLORS['card_bg'], corner_radius=15)
@@ -826,16 +849,41 @@ class ChatFrame(ctk.CTkFrame):
     def send_message(self, event=None):
         """Отправляет сообщение на сервер."""
         message = self.message_entry.get().strip()
-        if message and self.controller.socket:
+        if message and self.client.socket:
             try:
-                msg = {'type': 'message', 'content': message}
-                self.controller.socket.send((json.dumps(msg) + '\n').encode())
-                self.append_message(f"Вы: {message}")
+                if message.startswith('/'):
+                    self.run_chat_command(message)
+                    self.message_entry.delete(0, 'end')
+                    return
+                self.client.send_chat(message, self.current_room)
+                prefix = f"[{self.current_room}] " if self.current_room != DEFAULT_ROOM else ""
+                self.append_message(f"{prefix}Вы: {message}")
                 self.message_entry.delete(0, 'end')
             except Exception as e:
                 self.append_message(f"Ошибка при отправке сообщения: {e}")
                 messagebox.showerror("Ошибка", f"Не удалось отправить сообщение: {e}")
 
+    def run_chat_command(self, command):
+        """Выполняет команду: /join <комната>, /leave, /room <комната>, /rooms или /msg <ник> <текст>."""
+        name, _, argument = command.partition(' ')
+        argument = argument.strip()
+        if name == '/join' and argument:
+            self.client.join_room(argument)
+        elif name == '/leave':
+            self.client.leave_room(argument or self.current_room)
+        elif name == '/room' and argument in self.client.joined_rooms:
+            self.current_room = argument
+            self.append_system_message(f"Сообщения отправляются в комнату {argument}.")
+        elif name == '/rooms':
+            self.client.list_rooms()
+        elif name == '/msg' and ' ' in argument:
+            recipient, content = argument.split(' ', 1)
+            self.client.send_direct(recipient, content)
+            self.append_message(f"[ЛС для {recipient}] Вы: {content}")
+        else:
+            self.append_system_message("Команды: /join <комната>, /leave [комната], /room <комната>, /rooms, "
+                                       "/msg <ник> <текст>")
+
     def attach_file(self):
         """Позволяет пользователю выбрать файл и отправить его на сервер."""
         file_path = filedialog.askopenfilename()
@@ -852,83 +900,35 @@ class ChatFrame(ctk.CTkFrame):
     def upload_file(self, file_path):
         """Отправляет файл в отдельном потоке."""
         try:
-            file_size = os.path.getsize(file_path)
-            buffer_size = self.get_buffer_size(file_size)
-            total_chunks = (file_size // buffer_size) + (1 if file_size % buffer_size != 0 else 0)
-            
-            with open(file_path, 'rb') as f:
-                chunk_number = 1
-                while True:
-                    file_data = f.read(buffer_size)
-                    if not file_data:
-                        break
-                    
-                    file_data_hex = file_data.hex()
-                    msg = {
-                        'type': 'file',
-                        'file_name': os.path.basename(file_path),
-                        'file_size': self.get_readable_file_size(file_size),
-                        'total_chunks': total_chunks,
-                        'current_chunk': chunk_number,
-                        'file_data': file_data_hex,
-                        'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    self.send_message_to_server(msg)
-                    # Отправляем информацию о прогрессе в системные сообщения
-                    self.append_system_message(
-                        f"Прогресс отправки '{os.path.basename(file_path)}': {chunk_number}/{total_chunks}"
-                    )
-                    chunk_number += 1
-            
-            self.append_message(f"Вы отправили файл: {os.path.basename(file_path)}")
+            self.client.upload_file(file_path, self.current_room, self.show_upload_progress, self.show_upload_status)
         except Exception as e:
             self.append_system_message(f"Ошибка при отправке файла: {e}")
             messagebox.showerror("Ошибка", f"Не удалось отправить файл: {e}")
 
-    def get_buffer_size(self, file_size):
-        """Определяет оптимальный размер буфера в зависимости от размера файла."""
-        if file_size < SMALL_FILE_THRESHOLD:
-            return SMALL_FILE_BUFFER
-        elif file_size < MEDIUM_FILE_THRESHOLD:
-            return MEDIUM_FILE_BUFFER
-        elif file_size < LARGE_FILE_THRESHOLD:
-            return LARGE_FILE_BUFFER
-        else:
-            return HUGE_FILE_BUFFER
-
-    def get_readable_file_size(self, size_in_bytes):
-        """Преобразует размер файла из байт в читаемый формат."""
-        for unit in ['Б', 'КБ', 'МБ', 'ГБ', 'ТБ']:
-            if size_in_bytes < 1024:
-                return f"{size_in_bytes:.2f} {unit}".rstrip('0').rstrip('.')  # Убираем лишние нули после точки
-            size_in_bytes /= 1024
-        return f"{size_in_bytes:.2f} ПБ".rstrip('0').rstrip('.')  # Убираем лишние нули после точки
-
-    def get_file_type(self, file_path):
-        """Определяет тип файла по расширению."""
-        _, ext = os.path.splitext(file_path)
-        ext = ext.lower()
-        if ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
-            return 'Изображение'
-        elif ext in ['.mp4', '.avi', '.mov', '.mkv']:
-            return 'Видео'
-        elif ext in ['.pdf', '.docx', '.xlsx', '.pptx', '.txt']:
-            return 'Документ'
-        elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz']:
-            return 'Архив'
-        elif ext in ['.mp3', '.wav', '.aac', '.flac']:
-            return 'Музыка'
-        else:
-            return 'Другой'
-
-    def send_message_to_server(self, msg):
-        """Отправляет сообщение на сервер."""
-        try:
-            self.controller.socket.send((json.dumps(msg) + '\n').encode())
-        except Exception as e:
-            self.append_message(f"Ошибка при отправке сообщения: {e}")
-            messagebox.showerror("Ошибка", f"Не удалось отправить сообщение: {e}")
+    def show_upload_progress(self, upload, sent, total):
+        self.append_system_message(f"Прогресс отправки '{upload['file_name']}': {sent}/{total}")
+
+    def show_upload_status(self, upload, status, detail=None):
+        """Сообщает об итоге отправки файла (см. ChatClient.upload_file)."""
+        file_name = upload['file_name']
+        if status == 'exists':
+            self.append_message(f"Вы отправили файл: {file_name} (уже был на сервере)")
+        elif status == 'sent':
+            self.append_message(f"Вы отправили файл: {file_name}")
+        elif status == 'rerouted':
+            self.append_system_message(f"Соединение передачи данных прервано ({detail}); "
+                                       f"отправка '{file_name}' продолжится по основному соединению.")
+        elif status == 'interrupted':
+            self.append_system_message(f"Отправка файла '{file_name}' прервана ({detail}); "
+                                       f"она продолжится после восстановления соединения.")
+        elif status == 'complete':
+            self.append_system_message(f"Файл '{file_name}' уже полностью загружен на сервер.")
+        elif status == 'resuming':
+            self.append_system_message(f"Продолжается отправка '{file_name}': "
+                                       f"осталось чанков {detail} из {upload['total_chunks']}.")
+        elif status == 'failed':
+            self.append_system_message(f"Ошибка при отправке файла '{file_name}': {detail}")
 
 if __name__ == "__main__":
     app = App()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
@@ -0,0 +1,59 @@
+# server/archives.py
+
+import os
+import zipfile
+from datetime import datetime
+
+class ChunkedWriter:
+    """Файлоподобный объект только для записи: копит байты и отдает их кусками в emit.
+
+    У него нет tell() и seek(), поэтому zipfile пишет архив потоком, с
+    дескрипторами данных после каждого файла, и не возвращается назад.
+    """
+
+    def __init__(self, emit, chunk_size):
+        self.emit = emit
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.size = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.emit(bytes(self.buffer))
+            self.buffer.clear()
+
+def zip_date_time(date, path):
+    """Время файла для заголовка zip: дата из каталога или время изменения файла."""
+    try:
+        moment = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        moment = datetime.fromtimestamp(os.path.getmtime(path))
+    return max(moment, datetime(1980, 1, 1)).timetuple()[:6]  # zip не хранит даты раньше 1980 года
+
+def stream_zip(entries, emit, chunk_size, block_size=1024 * 1024):
+    """Строит zip-архив на лету, отдавая его в emit кусками около chunk_size байт.
+
+    entries - итерируемое из (имя в архиве, путь к файлу, дата, сжимать ли).
+    Файлы читаются блоками, поэтому память не зависит от размера архива;
+    несжимаемые файлы сохраняются без deflate. Возвращает (число файлов, размер архива).
+    """
+    writer = ChunkedWriter(emit, chunk_size)
+    count = 0
+    with zipfile.ZipFile(writer, 'w') as archive:
+        for arcname, path, date, compress in entries:
+            info = zipfile.ZipInfo(arcname, zip_date_time(date, path))
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            info.file_size = os.path.getsize(path)  # По нему zipfile решает, нужен ли zip64
+            with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                for block in iter(lambda: source.read(block_size), b''):
+                    target.write(block)
+            count += 1
+    writer.flush()
+    return count, writer.size
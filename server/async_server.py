@@ -0,0 +1,176 @@
+# server/async_server.py
+
+import asyncio
+import json
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from config import (ASYNC_WORKER_THREADS, ASYNC_TRANSFER_THREADS, TCP_BACKLOG, MAX_MESSAGE_SIZE, MAX_PAYLOAD_SIZE,
+                    WRITE_LINGER, WRITE_FLUSH_BYTES, TCP_NODELAY)
+from framing import Frame, FrameTooLargeError, BINARY_FRAME_MARKER, BINARY_PREFIX, decode_frame
+from handlers import ClientHandler, TRANSFER_MESSAGES
+from outbound import FileSegment
+from metrics import CONNECTIONS_TOTAL, BYTES_SENT
+
+logger = logging.getLogger(__name__)
+
+class AsyncClientHandler(ClientHandler):
+    """Неблокирующий обработчик клиента для asyncio-движка.
+
+    Чтение из сокета и запись из исходящей очереди выполняются в цикле событий,
+    поэтому ожидающий клиент не занимает поток. Разобранные сообщения
+    обрабатываются теми же методами ClientHandler в общем пуле потоков, чтобы
+    bcrypt и работа с диском не блокировали цикл событий. Скачивания файлов
+    держат поток, пока их кадры ждут места в исходящей очереди, поэтому идут
+    в отдельном ограниченном пуле и не задерживают обработку сообщений чата.
+    """
+
+    def __init__(self, reader, writer, server, loop, executor, transfer_executor):
+        self.loop = loop
+        self.writer_event = asyncio.Event()
+        super().__init__(writer, writer.get_extra_info('peername'), server)
+        self.stream_reader = reader
+        self.executor = executor
+        self.transfer_executor = transfer_executor
+
+    def notify_writer(self):
+        self.loop.call_soon_threadsafe(self.writer_event.set)
+
+    def abort_connection(self):
+        self.loop.call_soon_threadsafe(self.conn.transport.abort)
+
+    async def write_loop_async(self):
+        """Писатель подключения: отправляет кадры из исходящей очереди."""
+        try:
+            while True:
+                batch = self.outbound.get_batch(block=False)
+                if batch is None:
+                    break
+                if not batch:
+                    await self.writer_event.wait()
+                    self.writer_event.clear()
+                    continue
+                if WRITE_LINGER and sum(len(data) for data in batch) < WRITE_FLUSH_BYTES:
+                    # Немного ждем следующих кадров, чтобы отправить их одной записью
+                    await asyncio.sleep(WRITE_LINGER)
+                    batch += self.outbound.get_batch(block=False) or []
+                buffers = []
+                sent = 0
+                for data in batch:
+                    if isinstance(data, FileSegment):
+                        self.conn.writelines(buffers)
+                        buffers = []
+                        await self.send_file_segment_async(data)
+                        sent += data.length
+                    else:
+                        buffers.append(data)
+                        sent += len(data)
+                self.conn.writelines(buffers)
+                await self.conn.drain()
+                BYTES_SENT.inc(sent)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке данных клиенту {self.addr}: {e}")
+            self.outbound.close()
+        finally:
+            self.conn.close()
+
+    async def send_file_segment_async(self, segment):
+        """Отправляет участок файла через loop.sendfile (os.sendfile, если доступен)."""
+        await self.conn.drain()
+        with open(segment.path, 'rb') as f:
+            sent = await self.loop.sendfile(self.conn.transport, f, segment.offset, segment.length)
+        if sent != segment.length:
+            raise EOFError(f"Файл {segment.path} короче ожидаемого")
+
+    async def receive_frame_async(self):
+        """Принимает одно полное сообщение: JSON-строку или бинарный кадр."""
+        try:
+            first = await self.stream_reader.readexactly(1)
+            if first[0] == BINARY_FRAME_MARKER:
+                prefix = first + await self.stream_reader.readexactly(BINARY_PREFIX.size - 1)
+                _, flags, header_length, payload_length = BINARY_PREFIX.unpack(prefix)
+                if header_length > MAX_MESSAGE_SIZE or payload_length > MAX_PAYLOAD_SIZE:
+                    raise FrameTooLargeError(
+                        f"Бинарный кадр слишком велик: заголовок {header_length} байт, данные {payload_length} байт"
+                    )
+                header = await self.stream_reader.readexactly(header_length)
+                payload = await self.stream_reader.readexactly(payload_length)
+                if flags:
+                    # Распаковка нагружает процессор: выполняем ее вне цикла событий
+                    return await self.run_in_worker(decode_frame, header, payload, flags, MAX_PAYLOAD_SIZE)
+                return Frame(header, payload, flags)
+            if first == b'\n':
+                return Frame(b'', None, 0)
+            data = first + await self.stream_reader.readuntil(b'\n')
+            return Frame(data.strip(), None, 0)
+        except asyncio.IncompleteReadError:
+            return None
+        except (FrameTooLargeError, asyncio.LimitOverrunError) as e:
+            await self.run_in_worker(self.reject_oversized_frame, e)
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка при приёме сообщения от {self.addr}: {e}")
+            return None
+
+    async def run_in_worker(self, func, *args, executor=None):
+        """Выполняет блокирующий метод обработчика в пуле потоков (по умолчанию - общем)."""
+        return await self.loop.run_in_executor(executor or self.executor, func, *args)
+
+    async def handle_async(self):
+        logger.info(f"Подключен клиент с адресом: {self.addr}")
+        writer_task = asyncio.create_task(self.write_loop_async())
+        try:
+            auth_frame = await self.receive_frame_async()
+            if not auth_frame or not auth_frame.header:
+                logger.info(f"Клиент {self.addr} отключился до аутентификации.")
+                return
+            if not await self.run_in_worker(self.authenticate, json.loads(auth_frame.header)):
+                return
+
+            # После успешной аутентификации обрабатываем дальнейшие сообщения по очереди,
+            # чтобы сохранить порядок ответов клиенту
+            while True:
+                frame = await self.receive_frame_async()
+                if not frame or not frame.header:
+                    break
+                self.count_frame(frame)
+                msg = json.loads(frame.header)
+                executor = self.transfer_executor if msg.get('type') in TRANSFER_MESSAGES else None
+                await self.run_in_worker(self.dispatch, msg, frame.payload, executor=executor)
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка с клиентом {self.addr}: {e}")
+        except Exception as e:
+            logger.error(f"Ошибка с клиентом {self.addr}: {e}")
+        finally:
+            self.cleanup()
+            await writer_task
+
+async def serve_async(server, host='0.0.0.0'):
+    """Принимает TCP-подключения в цикле событий."""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=ASYNC_WORKER_THREADS, thread_name_prefix='chat-worker')
+    transfer_executor = ThreadPoolExecutor(max_workers=ASYNC_TRANSFER_THREADS, thread_name_prefix='chat-transfer')
+
+    async def on_connect(reader, writer):
+        logger.info(f"Подключение от {writer.get_extra_info('peername')}")
+        CONNECTIONS_TOTAL.inc()
+        sock = writer.get_extra_info('socket')
+        if TCP_NODELAY and sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        handler = AsyncClientHandler(reader, writer, server, loop, executor, transfer_executor)
+        await handler.handle_async()
+
+    tcp_server = await asyncio.start_server(
+        on_connect, host, server.tcp_port, limit=MAX_MESSAGE_SIZE, backlog=TCP_BACKLOG
+    )
+    logger.info(f"TCP-сервер (asyncio) запущен на порту {server.tcp_port}")
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+        transfer_executor.shutdown(wait=False)
+
+def run_async_server(server):
+    """Запускает asyncio-движок сервера (блокирует текущий поток)."""
+    asyncio.run(serve_async(server))
@@ -1,36 +1,149 @@
 # server/auth.py
 
 import bcrypt
+import os
 import sqlite3
 import logging
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from config import BCRYPT_ROUNDS, HASH_WORKERS, HASH_QUEUE_LIMIT, HASH_RETRY_AFTER_MS
 from database import get_user_password_hash, add_user
+from metrics import HASH_SECONDS
 
 logger = logging.getLogger(__name__)
 
-def hash_password(password):
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+HASH_LATENCY_WINDOW = 1000  # Сколько последних замеров хранить для перцентилей
+
+class ServerBusyError(Exception):
+    """Очередь хеширования заполнена; клиенту стоит повторить запрос позже."""
+
+    def __init__(self, retry_after_ms):
+        super().__init__(f"Сервер занят, повторите через {retry_after_ms} мс")
+        self.retry_after_ms = retry_after_ms
+
+def hash_password(password, rounds=BCRYPT_ROUNDS):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
 
 def check_password(password, hashed):
     return bcrypt.checkpw(password.encode(), hashed.encode())
 
+class HashPool:
+    """Пул процессов для bcrypt с ограниченной очередью допуска.
+
+    bcrypt нагружает процессор, поэтому хеши считаются в отдельных процессах
+    по числу ядер, а не в потоках обработчиков под GIL. Одновременно в пуле
+    может находиться не больше queue_limit задач; лишние запросы сразу
+    получают ServerBusyError с оценкой, через сколько стоит повторить.
+    """
+
+    def __init__(self, workers, queue_limit):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = queue_limit
+        # spawn: дочерние процессы не наследуют блокировки потоков сервера
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        self.slots = threading.BoundedSemaphore(queue_limit)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.latencies = deque(maxlen=HASH_LATENCY_WINDOW)
+        self.counters = {'completed': 0, 'rejected': 0, 'failed': 0}
+
+    def warm_up(self):
+        """Запускает рабочие процессы заранее, чтобы первый вход не ждал их старта."""
+        for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def run(self, func, *args):
+        """Выполняет func в пуле и возвращает результат; бросает ServerBusyError при перегрузке."""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.counters['rejected'] += 1
+            raise ServerBusyError(self.retry_after_ms())
+        with self.lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        outcome = 'failed'
+        try:
+            result = self.executor.submit(func, *args).result()
+            outcome = 'completed'
+            return result
+        finally:
+            elapsed = time.perf_counter() - started  # Включая ожидание свободного процесса
+            HASH_SECONDS.labels(outcome).observe(elapsed)
+            elapsed_ms = elapsed * 1000
+            with self.lock:
+                self.in_flight -= 1
+                self.latencies.append(elapsed_ms)
+                self.counters[outcome] += 1
+            self.slots.release()
+
+    def retry_after_ms(self):
+        """Оценивает, за сколько пул разберет текущую очередь."""
+        with self.lock:
+            if not self.latencies:
+                return HASH_RETRY_AFTER_MS
+            average = sum(self.latencies) / len(self.latencies)
+            return max(HASH_RETRY_AFTER_MS, int(average * self.in_flight / self.workers))
+
+    def metrics(self):
+        """Возвращает счетчики и задержку хеширования (мс) по последним замерам."""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            metrics = dict(self.counters, in_flight=self.in_flight, workers=self.workers)
+        if latencies:
+            metrics.update({
+                'latency_p50_ms': round(latencies[len(latencies) // 2], 1),
+                'latency_p99_ms': round(latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)], 1),
+                'latency_max_ms': round(latencies[-1], 1),
+            })
+        return metrics
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+def get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = HashPool(HASH_WORKERS, HASH_QUEUE_LIMIT)
+            logger.info(f"Пул хеширования паролей запущен: процессов {_hash_pool.workers}, "
+                        f"очередь {HASH_QUEUE_LIMIT}, bcrypt rounds {BCRYPT_ROUNDS}.")
+        return _hash_pool
+
+def get_hash_metrics():
+    return get_hash_pool().metrics()
+
 def authenticate_user(nickname, password):
+    """Проверяет пароль пользователя. Бросает ServerBusyError, если пул хеширования перегружен."""
     stored_hash = get_user_password_hash(nickname)
     if stored_hash:
-        result = check_password(password, stored_hash)
+        result = get_hash_pool().run(check_password, password, stored_hash)
         logger.info(f"Аутентификация пользователя {nickname}: {'успешно' if result else 'неудачно'}")
         return result
     logger.warning(f"Попытка аутентификации несуществующего пользователя: {nickname}")
     return False
 
 def register_user(nickname, password):
+    """Регистрирует пользователя. Бросает ServerBusyError, если пул хеширования перегружен."""
+    if get_user_password_hash(nickname):
+        logger.warning(f"Попытка регистрации существующего пользователя: {nickname}")
+        return False  # Не тратим хеширование на заведомо занятый никнейм
     try:
-        password_hash = hash_password(password)
+        password_hash = get_hash_pool().run(hash_password, password, BCRYPT_ROUNDS)
         add_user(nickname, password_hash)
         logger.info(f"Пользователь {nickname} зарегистрирован.")
         return True
     except sqlite3.IntegrityError:
         logger.warning(f"Попытка регистрации существующего пользователя: {nickname}")
         return False
+    except ServerBusyError:
+        raise
     except Exception as e:
         logger.error(f"Ошибка при регистрации пользователя {nickname}: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,73 @@
+# server/blobstore.py
+
+import os
+import shutil
+import logging
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    """Хранилище загруженных файлов по SHA-256 содержимого.
+
+    Каждое уникальное содержимое хранится один раз в файле
+    root/<первые 2 символа хеша>/<хеш>. Загрузка пишется во временный файл
+    root/tmp/..., а после проверки хеша переносится на место blob-а (или
+    удаляется, если такое содержимое уже есть). Сколько записей каталога
+    ссылается на blob, учитывает база данных; lock защищает перенос и удаление
+    blob-ов от гонки с параллельной загрузкой того же содержимого.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.lock = threading.Lock()
+        # Недописанные загрузки прошлого запуска уже не будут завершены
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def exists(self, sha256):
+        return os.path.isfile(self.path(sha256))
+
+    def temp_path(self):
+        """Возвращает путь для временного файла новой загрузки."""
+        return os.path.join(self.tmp_dir, f"{secrets.token_hex(8)}.part")
+
+    def commit(self, temp_path, sha256):
+        """Переносит загруженный файл в хранилище. Вызывать под self.lock.
+
+        Если blob с таким содержимым уже есть, временный файл удаляется.
+        """
+        blob_path = self.path(sha256)
+        if os.path.isfile(blob_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+        return blob_path
+
+    def remove(self, sha256):
+        """Удаляет blob, на который больше не ссылается каталог. Вызывать под self.lock."""
+        try:
+            os.remove(self.path(sha256))
+            logger.info(f"Удален неиспользуемый blob {sha256}.")
+        except OSError:
+            pass
+
+    def remove_orphans(self, referenced):
+        """Удаляет blob-ы, которых нет среди referenced (множество хешей). Возвращает их число."""
+        removed = 0
+        with self.lock:
+            for prefix in os.listdir(self.root):
+                prefix_dir = os.path.join(self.root, prefix)
+                if prefix_dir == self.tmp_dir or not os.path.isdir(prefix_dir):
+                    continue
+                for name in os.listdir(prefix_dir):
+                    if name not in referenced:
+                        os.remove(os.path.join(prefix_dir, name))
+                        removed += 1
+        return removed
@@ -6,13 +6,80 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 USERS_DB = os.path.join(BASE_DIR, 'users.db')
 FILES_DIR = os.path.join(BASE_DIR, 'uploaded_files')
+BLOBS_DIR = os.path.join(FILES_DIR, 'blobs')  # Загрузки, хранящиеся по SHA-256 содержимого
+PARTIAL_UPLOADS_DIR = os.path.join(FILES_DIR, 'partial')  # Незавершенные возобновляемые загрузки
 
 # Порты
 TCP_PORT = 12345
 UDP_PORT = 37020
 
+# Движок сервера: 'threaded' (поток на подключение) или 'asyncio' (цикл событий)
+SERVER_ENGINES = ('threaded', 'asyncio')
+SERVER_ENGINE = 'threaded'
+ASYNC_WORKER_THREADS = 32  # Потоки для блокирующей обработки сообщений в asyncio-движке
+ASYNC_TRANSFER_THREADS = 8  # Отдельные потоки для скачивания файлов, чтобы передачи не занимали пул сообщений
+TCP_BACKLOG = 1024  # Очередь входящих подключений
+
+# Исходящие очереди подключений
+OUTBOUND_QUEUE_MAX_ITEMS = 256  # Максимум кадров в очереди одного клиента
+OUTBOUND_QUEUE_MAX_BYTES = 16 * 1024 * 1024  # Максимум байт в очереди одного клиента
+SLOW_CONSUMER_POLICY = 'drop'  # 'drop', 'disconnect' или 'coalesce'
+WRITE_LINGER = 0.002  # Сколько ждать следующих кадров перед отправкой небольшой пачки, сек (0 - не ждать)
+WRITE_FLUSH_BYTES = 64 * 1024  # Отправлять без ожидания, если в очереди набралось столько байт
+WRITE_MAX_IOV = 64  # Максимум буферов в одном вызове sendmsg (writev)
+TCP_NODELAY = True  # Отключить алгоритм Нейгла: короткие сообщения чата уходят сразу
+OUTBOUND_METRICS_LOG_INTERVAL = 60  # Период записи метрик очередей в лог, сек (0 - отключить)
+
+# Логирование
+LOG_FILE = 'server.log'  # Файл лога (относительно рабочего каталога)
+LOG_LEVEL = 'INFO'  # Можно изменить на DEBUG для более подробных логов
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Размер файла лога, после которого он ротируется
+LOG_BACKUP_COUNT = 5  # Сколько старых файлов лога хранить
+LOG_RATE_LIMIT = 20  # Сколько записей ниже WARNING из одной строки кода пропускать за интервал (0 - без ограничения)
+LOG_RATE_INTERVAL = 1.0  # Интервал ограничения частоты записей, сек
+LOG_MESSAGE_BODIES = False  # Записывать ли в лог текст сообщений чата
+
+# Метрики в формате Prometheus (GET /metrics)
+METRICS_HOST = '127.0.0.1'  # Адрес HTTP-сервера метрик (по умолчанию доступен только локально)
+METRICS_PORT = 9108  # Порт HTTP-сервера метрик (0 - отключить)
+
+# База данных SQLite
+DB_POOL_SIZE = 16  # Максимум открытых соединений в пуле
+DB_CACHE_SIZE_KB = 8 * 1024  # Кеш страниц на одно соединение, КБ
+DB_SYNCHRONOUS = 'NORMAL'  # В режиме WAL NORMAL не теряет целостность, но может потерять последние транзакции при сбое питания
+DB_BUSY_TIMEOUT = 5  # Сколько секунд ждать снятия блокировки записи
+DB_STATEMENT_CACHE_SIZE = 64  # Подготовленных запросов, кешируемых в соединении
+
+# Хеширование паролей
+BCRYPT_ROUNDS = 12  # Сложность bcrypt для новых паролей (каждая единица удваивает время)
+HASH_WORKERS = 0  # Процессов для bcrypt (0 - по числу ядер)
+HASH_QUEUE_LIMIT = 64  # Максимум одновременных запросов хеширования; остальным отвечаем "сервер занят"
+HASH_RETRY_AFTER_MS = 500  # Минимальная пауза перед повтором, которую сервер сообщает клиенту
+
+# Сессии
+SESSION_TOKEN_TTL = 7 * 24 * 3600  # Срок действия токена возобновления сессии, сек
+SESSION_CLEANUP_INTERVAL = 600  # Период удаления истекших токенов, сек
+
+# История сообщений
+HISTORY_DEFAULT_ROOM = 'general'  # Комната, в которую попадают сообщения без явной комнаты
+HISTORY_REPLAY_LIMIT = 100  # Сколько последних сообщений отправлять клиенту после входа
+HISTORY_REPLAY_BATCH = 50  # Сообщений истории в одном кадре
+HISTORY_FLUSH_INTERVAL = 0.05  # Как часто записывать накопленные сообщения в базу, сек
+HISTORY_GROUP_SIZE = 500  # Записать раньше, если накопилось столько сообщений
+ROOM_NAME_MAX_LENGTH = 64  # Максимальная длина имени комнаты
+OFFLINE_QUEUE_MAX_MESSAGES = 1000  # Сколько личных сообщений хранить для пользователя не в сети
+OFFLINE_DELIVERY_BATCH = 100  # Офлайн-сообщений в одном кадре при входе
+
+# Сжатие кадров (zlib, а при установленном zstandard - zstd), согласуется при входе
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_SIZE = 1024  # Кадры короче этого размера, байт, не сжимаются
+INCOMPRESSIBLE_FILE_TYPES = ('Изображение', 'Видео', 'Архив', 'Музыка')  # Типы get_file_type с уже сжатыми данными
+
 # Размеры буфера для разных размеров файлов
 BUFFER_SIZE = 4096  # Базовый размер буфера для обычных операций
+RECEIVE_BUFFER_SIZE = 256 * 1024  # Размер чтения из сокета клиента
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024  # Максимальная длина JSON-сообщения (или заголовка кадра)
+MAX_PAYLOAD_SIZE = 64 * 1024 * 1024  # Максимальный размер данных бинарного кадра
 SMALL_FILE_THRESHOLD = 1024 * 1024  # 1 MB
 MEDIUM_FILE_THRESHOLD = 10 * 1024 * 1024  # 10 MB
 LARGE_FILE_THRESHOLD = 100 * 1024 * 1024  # 100 MB
@@ -22,6 +89,20 @@ MEDIUM_FILE_BUFFER = 1024 * 1024  # 1 MB для файлов от 1 MB до 10 M
 LARGE_FILE_BUFFER = 2 * 1024 * 1024  # 2 MB для файлов от 10 MB до 100 MB
 HUGE_FILE_BUFFER = 4 * 1024 * 1024  # 4 MB для файлов > 100 MB
 
+# Загрузка файлов
+UPLOAD_DURABILITY = 'close'  # fsync загруженного файла: 'none', 'close' (при завершении) или 'chunk' (после каждого чанка)
+UPLOAD_WRITE_BEHIND_CHUNKS = 4  # Сколько чанков может ждать записи на диск, пока читается следующий
+UPLOAD_RESUME_TTL = 7 * 24 * 60 * 60  # Сколько хранить брошенную возобновляемую загрузку, сек
+UPLOAD_IDLE_TIMEOUT = 5 * 60  # Через сколько секунд без чанков закрывать файл загрузки (он остается на диске)
+UPLOAD_CLEANUP_INTERVAL = 60  # Период проверки простаивающих и брошенных загрузок, сек
+TRANSFER_MAX_STREAMS = 4  # Сколько соединений передачи данных можно открыть по одному токену
+TRANSFER_TOKEN_TTL = 60  # Сколько секунд токен передачи данных принимает новые соединения
+LIST_FILES_PAGE_SIZE = 200  # Файлов на странице list_files по умолчанию
+LIST_FILES_MAX_PAGE_SIZE = 1000  # Максимальный размер страницы, который может запросить клиент
+ARCHIVE_CHUNK_SIZE = 1024 * 1024  # Размер кадра архива download_all, байт
+ARCHIVE_MAX_SELECTED_FILES = 1000  # Сколько файлов можно выбрать в download_all списком file_ids
+CATALOG_REBUILD_ON_STARTUP = True  # Сверять каталог файлов в БД с содержимым FILES_DIR при запуске
+
 # Конфигурация Централизованного Справочника
 ENABLE_DIRECTORY_REGISTRATION = False  # Включить/Отключить регистрацию в справочнике
 DIRECTORY_SERVER_IP = 'your.directory.server.ip'  # Замените на IP вашего справочника
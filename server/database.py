@@ -1,35 +1,196 @@
 # server/database.py
 
+import os
+import queue
+import secrets
 import sqlite3
 import logging
-from config import USERS_DB
+import threading
+import time
+from contextlib import contextmanager
+from config import USERS_DB, DB_POOL_SIZE, DB_CACHE_SIZE_KB, DB_SYNCHRONOUS, DB_BUSY_TIMEOUT, DB_STATEMENT_CACHE_SIZE
+from metrics import DB_SECONDS
 
 logger = logging.getLogger(__name__)
 
+FILE_COLUMNS = ('id', 'stored_name', 'file_name', 'sender', 'size', 'file_type', 'date', 'sha256', 'blob')
+# Допустимые сортировки списка файлов: имя в протоколе -> колонка таблицы files
+FILE_SORT_COLUMNS = {'id': 'id', 'name': 'file_name', 'sender': 'sender', 'type': 'file_type',
+                     'size': 'size', 'date': 'date'}
+
+class ConnectionPool:
+    """Пул открытых соединений с SQLite.
+
+    Соединения создаются по мере надобности (не больше size) и возвращаются в
+    пул после использования, поэтому вход и регистрация не открывают файл базы
+    заново. Каждое соединение в каждый момент используется одним потоком.
+    Python кеширует подготовленные запросы внутри соединения, так что
+    повторяющиеся SELECT и INSERT не компилируются заново.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=DB_STATEMENT_CACHE_SIZE)
+        conn.execute('PRAGMA journal_mode=WAL')  # Читатели не блокируют писателя
+        conn.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        return conn
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            can_create = self.created < self.size
+            if can_create:
+                self.created += 1
+        if not can_create:
+            return self.idle.get()  # Все соединения заняты: ждем освободившееся
+        try:
+            return self._connect()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    def release(self, conn):
+        self.idle.put(conn)
+
+    def close(self):
+        """Закрывает свободные соединения пула."""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Возвращает пул соединений, создавая его при первом обращении.
+
+    Путь к базе берется из USERS_DB в этот момент, поэтому подменять его
+    (как в бенчмарках) нужно до первого запроса.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(USERS_DB, DB_POOL_SIZE)
+        return _pool
+
+@contextmanager
+def connection():
+    """Выдает соединение из пула на время одной транзакции.
+
+    При выходе без ошибок транзакция фиксируется, при исключении - откатывается.
+    """
+    started = time.perf_counter()
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.release(conn)
+        DB_SECONDS.observe(time.perf_counter() - started)
+
 def init_db():
     try:
-        conn = sqlite3.connect(USERS_DB)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nickname TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nickname TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL
+                )
+            ''')
+            # Каталог загруженных файлов: имя на диске, исходное имя и метаданные
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    stored_name TEXT UNIQUE NOT NULL,
+                    file_name TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    file_type TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    sha256 TEXT
+                )
+            ''')
+            # blob - SHA-256 содержимого в хранилище blob-ов; NULL у файлов, лежащих прямо в FILES_DIR
+            if 'blob' not in {row[1] for row in cursor.execute('PRAGMA table_info(files)')}:
+                cursor.execute('ALTER TABLE files ADD COLUMN blob TEXT')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_blob ON files (blob)')
+            # Содержимое в хранилище blob-ов и число записей каталога, которые на него ссылаются
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    refcount INTEGER NOT NULL
+                )
+            ''')
+            # Токены возобновления сессии (сам токен не хранится, только его идентификатор)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    token_id TEXT PRIMARY KEY,
+                    nickname TEXT NOT NULL,
+                    expires_at INTEGER NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_nickname ON sessions (nickname)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+            # Параметры сервера, которые должны переживать перезапуск
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL
+                )
+            ''')
+            # Журнал сообщений чата
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    room TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    date TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_room_id ON messages (room, id)')
+            # Личные сообщения, ожидающие получателя не в сети
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS offline_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    date TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_offline_recipient ON offline_messages (recipient, id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_name ON files (file_name, sender)')
+            # Индексы для постраничной выдачи: (колонка сортировки или фильтра, id)
+            for column in FILE_SORT_COLUMNS.values():
+                if column != 'id':
+                    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_files_{column}_id ON files ({column}, id)')
         logger.info("База данных инициализирована.")
     except Exception as e:
         logger.error(f"Ошибка при инициализации базы данных: {e}")
 
 def get_user_password_hash(nickname):
     try:
-        conn = sqlite3.connect(USERS_DB)
-        cursor = conn.cursor()
-        cursor.execute('SELECT password_hash FROM users WHERE nickname = ?', (nickname,))
-        row = cursor.fetchone()
-        conn.close()
+        with connection() as conn:
+            row = conn.execute('SELECT password_hash FROM users WHERE nickname = ?', (nickname,)).fetchone()
         if row:
             return row[0]
         return None
@@ -39,15 +200,274 @@ def get_user_password_hash(nickname):
 
 def add_user(nickname, password_hash):
     try:
-        conn = sqlite3.connect(USERS_DB)
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO users (nickname, password_hash) VALUES (?, ?)', (nickname, password_hash))
-        conn.commit()
-        conn.close()
+        with connection() as conn:
+            conn.execute('INSERT INTO users (nickname, password_hash) VALUES (?, ?)', (nickname, password_hash))
         logger.info(f"Пользователь {nickname} добавлен в базу данных.")
     except sqlite3.IntegrityError:
         logger.warning(f"Попытка добавить существующего пользователя: {nickname}")
         raise
     except Exception as e:
         logger.error(f"Ошибка при добавлении пользователя {nickname}: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def get_session_secret():
+    """Возвращает ключ подписи токенов сессий, создавая его при первом запуске."""
+    with connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('session_secret', ?)",
+                     (secrets.token_bytes(32),))
+        return bytes(conn.execute("SELECT value FROM settings WHERE key = 'session_secret'").fetchone()[0])
+
+def add_session(token_id, nickname, expires_at):
+    try:
+        with connection() as conn:
+            conn.execute('INSERT INTO sessions (token_id, nickname, expires_at) VALUES (?, ?, ?)',
+                         (token_id, nickname, expires_at))
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении сессии пользователя {nickname}: {e}")
+        raise
+
+def revoke_session(token_id):
+    try:
+        with connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE token_id = ?', (token_id,))
+    except Exception as e:
+        logger.error(f"Ошибка при отзыве сессии: {e}")
+
+def revoke_user_sessions(nickname):
+    try:
+        with connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE nickname = ?', (nickname,))
+    except Exception as e:
+        logger.error(f"Ошибка при отзыве сессий пользователя {nickname}: {e}")
+
+def load_active_sessions(now):
+    """Возвращает действующие сессии: token_id -> (nickname, expires_at)."""
+    try:
+        with connection() as conn:
+            rows = conn.execute('SELECT token_id, nickname, expires_at FROM sessions WHERE expires_at >= ?',
+                                (now,)).fetchall()
+        return {token_id: (nickname, expires_at) for token_id, nickname, expires_at in rows}
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке сессий: {e}")
+        return {}
+
+def delete_expired_sessions(now):
+    try:
+        with connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE expires_at < ?', (now,))
+    except Exception as e:
+        logger.error(f"Ошибка при удалении истекших сессий: {e}")
+
+MESSAGE_COLUMNS = ('id', 'room', 'sender', 'content', 'date')
+
+def insert_messages(messages):
+    """Записывает пачку сообщений одной транзакцией."""
+    with connection() as conn:
+        conn.executemany(
+            'INSERT OR IGNORE INTO messages (id, room, sender, content, date) VALUES (?, ?, ?, ?, ?)',
+            [tuple(m[column] for column in MESSAGE_COLUMNS) for m in messages]
+        )
+
+def get_messages(room, since_id, max_id, limit):
+    """Возвращает до limit последних сообщений комнаты с since_id < id <= max_id по возрастанию id."""
+    try:
+        with connection() as conn:
+            rows = conn.execute(
+                f'SELECT {", ".join(MESSAGE_COLUMNS)} FROM messages '
+                'WHERE room = ? AND id > ? AND id <= ? ORDER BY id DESC LIMIT ?',
+                (room, since_id, max_id, limit)
+            ).fetchall()
+        return [dict(zip(MESSAGE_COLUMNS, row)) for row in reversed(rows)]
+    except Exception as e:
+        logger.error(f"Ошибка при получении истории сообщений комнаты {room}: {e}")
+        return []
+
+def get_last_message_id():
+    with connection() as conn:
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0]
+
+def add_offline_message(recipient, sender, content, date):
+    try:
+        with connection() as conn:
+            conn.execute('INSERT INTO offline_messages (recipient, sender, content, date) VALUES (?, ?, ?, ?)',
+                         (recipient, sender, content, date))
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении офлайн-сообщения для {recipient}: {e}")
+        raise
+
+def count_offline_messages(recipient):
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM offline_messages WHERE recipient = ?', (recipient,)).fetchone()[0]
+
+def get_offline_messages(recipient):
+    """Возвращает офлайн-сообщения пользователя в порядке поступления (не удаляя их)."""
+    with connection() as conn:
+        rows = conn.execute('SELECT id, sender, content, date FROM offline_messages WHERE recipient = ? ORDER BY id',
+                            (recipient,)).fetchall()
+    return [{'id': message_id, 'sender': sender, 'content': content, 'date': date}
+            for message_id, sender, content, date in rows]
+
+def delete_offline_messages(recipient, last_id):
+    """Удаляет доставленные офлайн-сообщения пользователя с номерами до last_id включительно."""
+    with connection() as conn:
+        conn.execute('DELETE FROM offline_messages WHERE recipient = ? AND id <= ?', (recipient, last_id))
+
+def _file_row_to_dict(row):
+    return dict(zip(FILE_COLUMNS, row))
+
+def add_file_record(stored_name, file_name, sender, size, file_type, date, sha256, blob=None):
+    """Добавляет (или обновляет) запись о файле в каталоге.
+
+    blob - хеш содержимого в хранилище blob-ов; его счетчик ссылок
+    увеличивается. Если запись с тем же stored_name ссылалась на другой blob,
+    его счетчик уменьшается. Возвращает (id записи, хеш blob-а, на который
+    больше никто не ссылается, или None); такой blob вызывающий удаляет сам.
+    """
+    try:
+        with connection() as conn:
+            row = conn.execute('SELECT blob FROM files WHERE stored_name = ?', (stored_name,)).fetchone()
+            old_blob = row[0] if row else None
+            conn.execute('''
+                INSERT INTO files (stored_name, file_name, sender, size, file_type, date, sha256, blob)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (stored_name) DO UPDATE SET
+                    file_name = excluded.file_name, sender = excluded.sender, size = excluded.size,
+                    file_type = excluded.file_type, date = excluded.date, sha256 = excluded.sha256,
+                    blob = excluded.blob
+            ''', (stored_name, file_name, sender, size, file_type, date, sha256, blob))
+            if blob is not None:
+                conn.execute('''
+                    INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, 1)
+                    ON CONFLICT (sha256) DO UPDATE SET refcount = refcount + 1
+                ''', (blob, size))
+            unused_blob = None
+            if old_blob is not None:
+                conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (old_blob,))
+                if conn.execute('DELETE FROM blobs WHERE sha256 = ? AND refcount <= 0', (old_blob,)).rowcount:
+                    unused_blob = old_blob
+            file_id = conn.execute('SELECT id FROM files WHERE stored_name = ?', (stored_name,)).fetchone()[0]
+            return file_id, unused_blob
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении файла {stored_name} в каталог: {e}")
+        raise
+
+def get_blob_size(sha256):
+    """Возвращает размер blob-а, известного каталогу, или None."""
+    with connection() as conn:
+        row = conn.execute('SELECT size FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+    return row[0] if row else None
+
+def get_blob_hashes():
+    """Возвращает множество хешей всех blob-ов, на которые ссылается каталог."""
+    with connection() as conn:
+        return {row[0] for row in conn.execute('SELECT sha256 FROM blobs')}
+
+def get_file_page(filters=None, sort='id', descending=False, after=None, limit=200):
+    """Возвращает страницу каталога файлов и курсор следующей страницы.
+
+    filters - словарь с необязательными ключами sender, file_type, name_prefix,
+    date_from и date_to. Страницы выбираются по ключу (колонка сортировки, id),
+    поэтому стоимость запроса не зависит от номера страницы. after - курсор
+    из предыдущего ответа, next_cursor равен None на последней странице.
+    """
+    filters = filters or {}
+    column = FILE_SORT_COLUMNS[sort]
+    conditions, params = [], []
+    if filters.get('sender'):
+        conditions.append('sender = ?')
+        params.append(filters['sender'])
+    if filters.get('file_type'):
+        conditions.append('file_type = ?')
+        params.append(filters['file_type'])
+    if filters.get('name_prefix'):
+        conditions.append('file_name >= ? AND file_name < ?')
+        params += [filters['name_prefix'], filters['name_prefix'] + '\U0010ffff']
+    if filters.get('date_from'):
+        conditions.append('date >= ?')
+        params.append(filters['date_from'])
+    if filters.get('date_to'):
+        conditions.append('date <= ?')
+        params.append(filters['date_to'])
+    if after is not None:
+        conditions.append(f'({column}, id) {"<" if descending else ">"} (?, ?)')
+        params += list(after)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    direction = 'DESC' if descending else 'ASC'
+    try:
+        with connection() as conn:
+            rows = conn.execute(
+                f'SELECT {", ".join(FILE_COLUMNS)} FROM files {where} '
+                f'ORDER BY {column} {direction}, id {direction} LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+    except Exception as e:
+        logger.error(f"Ошибка при получении каталога файлов: {e}")
+        return [], None
+    records = [_file_row_to_dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = records[-1]
+        next_cursor = [last[column], last['id']]
+    return records, next_cursor
+
+def find_file_record(file_name=None, sender=None, file_id=None):
+    """Находит файл по id или по исходному имени (и отправителю).
+
+    Если файлов с таким именем несколько, возвращается последний загруженный.
+    """
+    try:
+        columns = ", ".join(FILE_COLUMNS)
+        with connection() as conn:
+            if file_id is not None:
+                cursor = conn.execute(f'SELECT {columns} FROM files WHERE id = ?', (file_id,))
+            elif sender is not None:
+                cursor = conn.execute(
+                    f'SELECT {columns} FROM files WHERE file_name = ? AND sender = ? ORDER BY id DESC LIMIT 1',
+                    (file_name, sender)
+                )
+            else:
+                cursor = conn.execute(f'SELECT {columns} FROM files WHERE file_name = ? ORDER BY id DESC LIMIT 1',
+                                      (file_name,))
+            row = cursor.fetchone()
+        return _file_row_to_dict(row) if row else None
+    except Exception as e:
+        logger.error(f"Ошибка при поиске файла {file_name} в каталоге: {e}")
+        return None
+
+def rebuild_file_catalog(files_dir, describe_file, blob_exists=None):
+    """Сверяет каталог с содержимым files_dir и хранилища blob-ов.
+
+    Записи об исчезнувших файлах удаляются, новые файлы из files_dir
+    добавляются; describe_file(stored_name, file_path) возвращает словарь
+    метаданных нового файла. blob_exists(sha256) проверяет, есть ли blob на
+    диске; счетчики ссылок blob-ов пересчитываются по каталогу.
+    """
+    try:
+        with connection() as conn:
+            known = {row[0] for row in conn.execute('SELECT stored_name FROM files WHERE blob IS NULL')}
+            on_disk = {f for f in os.listdir(files_dir) if os.path.isfile(os.path.join(files_dir, f))}
+
+            removed = known - on_disk
+            conn.executemany('DELETE FROM files WHERE stored_name = ?', [(name,) for name in removed])
+            if blob_exists is not None:
+                missing = [row for row in conn.execute('SELECT DISTINCT blob FROM files WHERE blob IS NOT NULL')
+                           if not blob_exists(row[0])]
+                conn.executemany('DELETE FROM files WHERE blob = ?', missing)
+                if missing:
+                    logger.warning(f"Не найдено blob-ов на диске: {len(missing)}; их записи удалены из каталога.")
+            conn.execute('DELETE FROM blobs')
+            conn.execute('''
+                INSERT INTO blobs (sha256, size, refcount)
+                SELECT blob, MAX(size), COUNT(*) FROM files WHERE blob IS NOT NULL GROUP BY blob
+            ''')
+            added = sorted(on_disk - known, key=lambda name: os.path.getmtime(os.path.join(files_dir, name)))
+            for stored_name in added:
+                info = describe_file(stored_name, os.path.join(files_dir, stored_name))
+                conn.execute('''
+                    INSERT INTO files (stored_name, file_name, sender, size, file_type, date, sha256)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (stored_name, info['file_name'], info['sender'], info['size'], info['file_type'],
+                      info['date'], info['sha256']))
+        logger.info(f"Каталог файлов сверен с диском: добавлено {len(added)}, удалено {len(removed)}.")
+    except Exception as e:
+        logger.error(f"Ошибка при перестроении каталога файлов: {e}")
@@ -0,0 +1,235 @@
+# server/framing.py
+
+import json
+import struct
+import zlib
+from collections import namedtuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Обычные сообщения протокола - JSON-строки, разделенные '\n' (всегда начинаются с '{').
+# Бинарный кадр начинается с нулевого байта, за ним флаги, длина JSON-заголовка
+# и длина данных, затем сам заголовок и сырые байты данных без hex-кодирования.
+BINARY_FRAME_MARKER = 0x00
+BINARY_PREFIX = struct.Struct('!BBIQ')  # маркер, флаги, длина заголовка, длина данных
+
+# Флаги бинарного кадра
+FLAG_ZLIB = 0x01  # Данные кадра сжаты zlib
+FLAG_ZSTD = 0x02  # Данные кадра сжаты zstd
+FLAG_MESSAGE = 0x04  # Данные кадра - JSON-сообщение целиком, заголовок пуст
+COMPRESSION_FLAGS = {'zlib': FLAG_ZLIB, 'zstd': FLAG_ZSTD}
+COMPRESSION_LEVELS = {'zlib': 6, 'zstd': 3}
+
+# Возможности протокола, которые клиент может запросить при входе
+FEATURE_BINARY = 'binary'
+FEATURE_RAW_DOWNLOAD = 'raw_download'  # Тело скачиваемого файла идет сырыми байтами после file_info
+FEATURE_ZLIB = 'zlib'  # Сжатие кадров; сервер выбирает один алгоритм из запрошенных
+FEATURE_ZSTD = 'zstd'
+FEATURE_DATA_STREAMS = 'data_streams'  # Дополнительные соединения для чанков больших файлов (data_connect)
+
+# Ограничения по умолчанию на размер JSON-строки (или заголовка) и данных бинарного кадра
+DEFAULT_MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+DEFAULT_MAX_PAYLOAD_SIZE = 64 * 1024 * 1024
+
+Frame = namedtuple('Frame', ['header', 'payload', 'flags'])
+
+def encode_message(message):
+    """Кодирует сообщение в JSON-строку, завершенную '\\n'."""
+    return (json.dumps(message) + '\n').encode()
+
+def encode_binary_prefix(header, payload_length, flags=0):
+    """Кодирует префикс и заголовок бинарного кадра (без данных)."""
+    header_bytes = json.dumps(header).encode()
+    return BINARY_PREFIX.pack(BINARY_FRAME_MARKER, flags, len(header_bytes), payload_length) + header_bytes
+
+def encode_binary_frame(header, payload, flags=0):
+    """Кодирует бинарный кадр целиком."""
+    return encode_binary_prefix(header, len(payload), flags) + payload
+
+def available_compressions():
+    """Алгоритмы сжатия, доступные в этой установке, в порядке предпочтения."""
+    return [FEATURE_ZSTD, FEATURE_ZLIB] if zstandard else [FEATURE_ZLIB]
+
+def choose_compression(features):
+    """Выбирает лучший доступный алгоритм сжатия из features или None."""
+    for codec in available_compressions():
+        if codec in features:
+            return codec
+    return None
+
+def compress_payload(data, codec):
+    """Сжимает данные кадра. Возвращает (данные, флаги); без выигрыша - (data, 0)."""
+    if codec == FEATURE_ZSTD:
+        packed = zstandard.ZstdCompressor(level=COMPRESSION_LEVELS[codec]).compress(data)
+    elif codec == FEATURE_ZLIB:
+        packed = zlib.compress(data, COMPRESSION_LEVELS[codec])
+    else:
+        return data, 0
+    if len(packed) >= len(data):
+        return data, 0  # Данные уже сжаты (или слишком случайны): шлем как есть
+    return packed, COMPRESSION_FLAGS[codec]
+
+def decompress_payload(payload, flags, max_size):
+    """Распаковывает данные кадра, не позволяя им вырасти больше max_size."""
+    if flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise ValueError("Получен кадр, сжатый zstd, но модуль zstandard не установлен")
+        if zstandard.frame_content_size(payload) > max_size:
+            raise FrameTooLargeError(f"Распакованные данные длиннее {max_size} байт")
+        return zstandard.ZstdDecompressor().decompress(payload, max_output_size=max_size)
+    if flags & FLAG_ZLIB:
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(payload, max_size)
+        if decompressor.unconsumed_tail:
+            raise FrameTooLargeError(f"Распакованные данные длиннее {max_size} байт")
+        return data
+    return payload
+
+def encode_compressed_message(message, codec, min_size):
+    """Кодирует сообщение, сжимая его в бинарный кадр, если оно не короче min_size.
+
+    Без согласованного сжатия (codec=None) или без выигрыша от сжатия
+    возвращает обычную JSON-строку.
+    """
+    data = encode_message(message)
+    if codec is None or len(data) < min_size:
+        return data
+    packed, flags = compress_payload(data, codec)
+    if not flags:
+        return data
+    return BINARY_PREFIX.pack(BINARY_FRAME_MARKER, flags | FLAG_MESSAGE, 0, len(packed)) + packed
+
+def encode_compressed_binary_frame(header, payload, codec, min_size):
+    """Кодирует бинарный кадр, сжимая данные, если их не меньше min_size."""
+    flags = 0
+    if codec is not None and len(payload) >= min_size:
+        payload, flags = compress_payload(payload, codec)
+    return encode_binary_frame(header, payload, flags)
+
+def decode_frame(header, payload, flags, max_payload_size):
+    """Распаковывает сжатый кадр; сжатое JSON-сообщение становится обычной строкой."""
+    if flags & (FLAG_ZLIB | FLAG_ZSTD):
+        payload = decompress_payload(payload, flags, max_payload_size)
+        flags &= ~(FLAG_ZLIB | FLAG_ZSTD)
+    if flags & FLAG_MESSAGE:
+        return Frame(bytes(payload).strip(), None, 0)
+    return Frame(header, payload, flags)
+
+class FrameTooLargeError(ValueError):
+    """Кадр превышает допустимый размер."""
+
+class FrameReader:
+    """Читает из сокета JSON-строки и бинарные кадры.
+
+    Принятые байты накапливаются в одном bytearray, а '\\n' ищется только в
+    новых данных, поэтому разбор строки длиной n стоит O(n), а не O(n^2).
+    Размеры строк и бинарных кадров ограничены, чтобы клиент не мог занять
+    всю память одним сообщением.
+    """
+
+    def __init__(self, sock, bufsize, max_message_size=DEFAULT_MAX_MESSAGE_SIZE,
+                 max_payload_size=DEFAULT_MAX_PAYLOAD_SIZE):
+        self.sock = sock
+        self.max_message_size = max_message_size
+        self.max_payload_size = max_payload_size
+        self.buffer = bytearray()
+        self.chunk = bytearray(bufsize)  # Переиспользуемый буфер для recv_into
+        self.chunk_view = memoryview(self.chunk)
+        self.scanned = 0  # Сколько байт буфера уже проверено на '\n'
+
+    def _fill(self):
+        n = self.sock.recv_into(self.chunk)
+        if not n:
+            return False
+        self.buffer += self.chunk_view[:n]
+        return True
+
+    def _consume(self, size):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.scanned = 0
+        return data
+
+    def _read_exact(self, size):
+        while len(self.buffer) < size:
+            if not self._fill():
+                return None
+        return self._consume(size)
+
+    def _read_payload(self, size):
+        """Читает данные кадра сразу в заранее выделенный буфер через recv_into."""
+        payload = bytearray(size)
+        view = memoryview(payload)
+        received = min(len(self.buffer), size)
+        view[:received] = self.buffer[:received]
+        del self.buffer[:received]
+        while received < size:
+            n = self.sock.recv_into(view[received:], size - received)
+            if n == 0:
+                return None
+            received += n
+        return payload
+
+    def read_raw(self, length, sink):
+        """Читает ровно length сырых байт, передавая их в sink(memoryview) по частям.
+
+        sink должен обработать данные сразу: буфер переиспользуется.
+        Возвращает False, если соединение закрылось раньше.
+        """
+        remaining = length
+        if self.buffer:
+            taken = min(len(self.buffer), remaining)
+            with memoryview(self.buffer) as view:
+                sink(view[:taken])
+            del self.buffer[:taken]
+            self.scanned = 0
+            remaining -= taken
+        while remaining:
+            n = self.sock.recv_into(self.chunk, min(remaining, len(self.chunk)))
+            if not n:
+                return False
+            sink(self.chunk_view[:n])
+            remaining -= n
+        return True
+
+    def _read_line(self):
+        while True:
+            index = self.buffer.find(b'\n', self.scanned)
+            if index >= 0:
+                line = self._consume(index + 1)
+                return line.strip()
+            self.scanned = len(self.buffer)
+            if self.scanned > self.max_message_size:
+                raise FrameTooLargeError(f"Сообщение длиннее {self.max_message_size} байт")
+            if not self._fill():
+                return None
+
+    def read_frame(self):
+        """Возвращает следующий Frame или None, если соединение закрыто.
+
+        Для JSON-строки header - байты строки без '\\n', payload - None.
+        """
+        if not self.buffer and not self._fill():
+            return None
+        if self.buffer[0] != BINARY_FRAME_MARKER:
+            line = self._read_line()
+            return Frame(line, None, 0) if line is not None else None
+
+        prefix = self._read_exact(BINARY_PREFIX.size)
+        if prefix is None:
+            return None
+        _, flags, header_length, payload_length = BINARY_PREFIX.unpack(prefix)
+        if header_length > self.max_message_size or payload_length > self.max_payload_size:
+            raise FrameTooLargeError(
+                f"Бинарный кадр слишком велик: заголовок {header_length} байт, данные {payload_length} байт"
+            )
+        header = self._read_exact(header_length)
+        if header is None:
+            return None
+        payload = self._read_payload(payload_length)
+        if payload is None:
+            return None
+        return decode_frame(header, payload, flags, self.max_payload_size)
@@ -2,252 +2,855 @@
 
 import json
 import logging
-from auth import authenticate_user, register_user
+from auth import authenticate_user, register_user, ServerBusyError
 from config import (FILES_DIR, BUFFER_SIZE, SMALL_FILE_THRESHOLD, MEDIUM_FILE_THRESHOLD, 
                    LARGE_FILE_THRESHOLD, SMALL_FILE_BUFFER, MEDIUM_FILE_BUFFER, 
                    LARGE_FILE_BUFFER, HUGE_FILE_BUFFER)
+from config import (OUTBOUND_QUEUE_MAX_ITEMS, OUTBOUND_QUEUE_MAX_BYTES, SLOW_CONSUMER_POLICY,
+                    RECEIVE_BUFFER_SIZE, MAX_MESSAGE_SIZE, MAX_PAYLOAD_SIZE,
+                    UPLOAD_DURABILITY, UPLOAD_WRITE_BEHIND_CHUNKS,
+                    LIST_FILES_PAGE_SIZE, LIST_FILES_MAX_PAGE_SIZE,
+                    HISTORY_DEFAULT_ROOM, HISTORY_REPLAY_LIMIT, HISTORY_REPLAY_BATCH, ROOM_NAME_MAX_LENGTH,
+                    OFFLINE_QUEUE_MAX_MESSAGES, OFFLINE_DELIVERY_BATCH, WRITE_LINGER, WRITE_FLUSH_BYTES, WRITE_MAX_IOV,
+                    COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, INCOMPRESSIBLE_FILE_TYPES, TRANSFER_MAX_STREAMS,
+                    ARCHIVE_CHUNK_SIZE, ARCHIVE_MAX_SELECTED_FILES)
+from framing import (FrameReader, FrameTooLargeError, encode_compressed_message, encode_compressed_binary_frame,
+                     choose_compression, FEATURE_BINARY, FEATURE_RAW_DOWNLOAD, FEATURE_DATA_STREAMS)
+from outbound import OutboundQueue, FileSegment, send_buffers
+from uploads import UploadSession
+from archives import stream_zip
+from logs import describe_content
+from metrics import FRAMES_RECEIVED, BYTES_RECEIVED, BYTES_SENT, CHAT_MESSAGES, TRANSFER_BYTES
+from database import (add_file_record, get_blob_size, get_file_page, find_file_record, FILE_SORT_COLUMNS, get_user_password_hash,
+                      add_offline_message, count_offline_messages, get_offline_messages, delete_offline_messages)
+from utils import get_readable_file_size, get_file_type, is_byte_offset
+import socket
 import os
+import string
 import threading
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Возможности протокола, которые сервер готов включить по запросу клиента
+SUPPORTED_FEATURES = {FEATURE_BINARY, FEATURE_RAW_DOWNLOAD, FEATURE_DATA_STREAMS}
+
+# Сообщения, допустимые в соединении передачи данных (открытом по data_connect)
+DATA_CONNECTION_MESSAGES = ('file', 'upload_status', 'download_file')
+# Сообщения, обработка которых длится всю передачу файла (ответ ждет места в исходящей очереди)
+TRANSFER_MESSAGES = ('download_file', 'download_all')
+
+# Фильтры, которые клиент может передать в list_files
+LIST_FILES_FILTERS = ('sender', 'file_type', 'name_prefix', 'date_from', 'date_to')
+
 class ClientHandler:
     def __init__(self, conn, addr, server):
         self.conn = conn
         self.addr = addr
         self.server = server
         self.nickname = None
-        self.buffer = ""
-        self.lock = threading.Lock()
-        self.files_being_received = {}  # file_name: {'total_chunks': int, 'received_chunks': int, 'file_path': str}
+        self.reader = None
+        self.outbound = OutboundQueue(
+            OUTBOUND_QUEUE_MAX_ITEMS, OUTBOUND_QUEUE_MAX_BYTES, SLOW_CONSUMER_POLICY,
+            stats=server.outbound_stats, on_ready=self.notify_writer, on_abort=self.abort_connection
+        )
+        self.features = set()  # Возможности протокола, согласованные при входе
+        self.compression = None  # Алгоритм сжатия кадров, согласованный при входе
+        self.files_being_received = {}  # file_name: UploadSession
+        self.rooms = set()  # Комнаты, на которые подписан клиент (меняется под server.clients_lock)
+        self.data_connection = False  # Соединение только для чанков файлов, без чата и рассылок
     
     def handle(self):
         logger.info(f"Подключен клиент с адресом: {self.addr}")
+        self.reader = FrameReader(self.conn, RECEIVE_BUFFER_SIZE, MAX_MESSAGE_SIZE, MAX_PAYLOAD_SIZE)
+        threading.Thread(target=self.write_loop, daemon=True).start()
         try:
-            auth_data = self.receive_message()
-            if not auth_data:
+            auth_frame = self.receive_frame()
+            if not auth_frame or not auth_frame.header:
                 logger.info(f"Клиент {self.addr} отключился до аутентификации.")
-                self.conn.close()
                 return
-            auth_msg = json.loads(auth_data)
+            if not self.authenticate(json.loads(auth_frame.header)):
+                return
+
+            # После успешной аутентификации обрабатываем дальнейшие сообщения
+            while True:
+                frame = self.receive_frame()
+                if not frame or not frame.header:
+                    break
+                self.count_frame(frame)
+                self.dispatch(json.loads(frame.header), frame.payload)
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка с клиентом {self.addr}: {e}")
+        except Exception as e:
+            logger.error(f"Ошибка с клиентом {self.addr}: {e}")
+        finally:
+            self.cleanup()
+
+    def authenticate(self, auth_msg):
+        """Обрабатывает первое сообщение клиента (вход или регистрация).
+
+        Возвращает True, если клиент успешно аутентифицирован.
+        """
+        requested = set(auth_msg.get('features', []))
+        self.features = requested & SUPPORTED_FEATURES
+        if COMPRESSION_ENABLED:
+            # Из запрошенных алгоритмов включаем один; он же попадет в features ответа
+            self.compression = choose_compression(requested)
+            if self.compression:
+                self.features.add(self.compression)
+        try:
             if auth_msg['type'] == 'login':
                 self.handle_login(auth_msg)
             elif auth_msg['type'] == 'register':
                 self.handle_register(auth_msg)
+            elif auth_msg['type'] == 'resume':
+                self.handle_resume(auth_msg)
+            elif auth_msg['type'] == 'data_connect':
+                self.handle_data_connect(auth_msg)
             else:
                 self.send_response({'type': 'response', 'status': 'error', 'message': 'Неверный тип запроса'})
-                self.conn.close()
-                return
+        except ServerBusyError as e:
+            # Пул хеширования перегружен: клиент переподключится через retry_after_ms
+            logger.warning(f"Клиент {self.addr} получил отказ: пул хеширования паролей занят.")
+            self.send_response({'type': 'response', 'status': 'busy', 'message': 'Сервер занят, повторите попытку позже',
+                                'retry_after_ms': e.retry_after_ms})
+        return self.nickname is not None
 
-            # После успешной аутентификации обрабатываем дальнейшие сообщения
+    def dispatch(self, msg, payload=None):
+        """Передает сообщение аутентифицированного клиента нужному обработчику.
+
+        payload - сырые данные бинарного кадра, если сообщение пришло в нем.
+        """
+        if self.data_connection and msg['type'] not in DATA_CONNECTION_MESSAGES:
+            self.send_response({'type': 'response', 'status': 'error',
+                                'message': 'Сообщение недопустимо в соединении передачи данных'})
+            return
+        if msg['type'] == 'message':
+            self.handle_chat_message(msg)
+        elif msg['type'] == 'file':
+            self.handle_file_upload(msg, payload)
+        elif msg['type'] == 'file_offer':
+            self.handle_file_offer(msg)
+        elif msg['type'] == 'upload_status':
+            self.handle_upload_status(msg)
+        elif msg['type'] == 'transfer_token':
+            self.handle_transfer_token()
+        elif msg['type'] == 'list_files':
+            self.handle_list_files(msg)
+        elif msg['type'] == 'download_file':
+            self.handle_download_file(msg)
+        elif msg['type'] == 'download_all':
+            self.handle_download_all(msg)
+        elif msg['type'] == 'logout':
+            self.handle_logout(msg)
+        elif msg['type'] == 'direct':
+            self.handle_direct_message(msg)
+        elif msg['type'] == 'join':
+            self.handle_join(msg)
+        elif msg['type'] == 'leave':
+            self.handle_leave(msg)
+        elif msg['type'] == 'list_rooms':
+            self.send_response({'type': 'rooms_list', 'rooms': self.server.get_rooms()})
+        else:
+            self.send_response({'type': 'response', 'status': 'error', 'message': 'Неизвестный тип сообщения'})
+
+    def count_frame(self, frame):
+        FRAMES_RECEIVED.inc()
+        BYTES_RECEIVED.inc(len(frame.header) + (len(frame.payload) if frame.payload is not None else 0))
+
+    def cleanup(self):
+        """Удаляет клиента из списка подключенных и закрывает соединение.
+
+        Соединение закрывает писатель после отправки уже поставленных в очередь кадров.
+        """
+        logger.info(f"Клиент {self.addr} отключен.")
+        self.server.remove_client(self)
+        self.outbound.close()
+        # Незавершенные загрузки не дойдут до конца: удаляем недописанные файлы
+        for session in self.files_being_received.values():
+            session.abort()
+        self.files_being_received.clear()
+
+    def write_loop(self):
+        """Писатель подключения: отправляет кадры из исходящей очереди."""
+        try:
             while True:
-                data = self.receive_message()
-                if not data:
+                batch = self.outbound.get_batch()
+                if batch is None:
                     break
-                msg = json.loads(data)
-                if msg['type'] == 'message':
-                    self.handle_chat_message(msg)
-                elif msg['type'] == 'file':
-                    self.handle_file_upload(msg)
-                elif msg['type'] == 'list_files':
-                    self.handle_list_files()
-                elif msg['type'] == 'download_file':
-                    self.handle_download_file(msg)
-                else:
-                    self.send_response({'type': 'response', 'status': 'error', 'message': 'Неизвестный тип сообщения'})
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка с клиентом {self.addr}: {e}")
+                if WRITE_LINGER and sum(len(data) for data in batch) < WRITE_FLUSH_BYTES:
+                    # Немного ждем следующих кадров, чтобы отправить их одним системным вызовом
+                    self.outbound.wait_for_bytes(WRITE_FLUSH_BYTES, WRITE_LINGER)
+                    batch += self.outbound.get_batch(block=False) or []
+                self.send_batch(batch)
         except Exception as e:
-            logger.error(f"Ошибка с клиентом {self.addr}: {e}")
+            logger.error(f"Ошибка при отправке данных клиенту {self.addr}: {e}")
+            self.outbound.close()
         finally:
-            logger.info(f"Клиент {self.addr} отключен.")
-            with self.server.clients_lock:
-                if self.conn in self.server.clients:
-                    del self.server.clients[self.conn]
+            self.abort_connection()
             self.conn.close()
 
-    def receive_message(self):
-        """Принимает одно полное сообщение, разделенное '\n'."""
+    def send_batch(self, batch):
+        """Отправляет кадры пачки: подряд идущие байты - одним sendmsg, участки файлов - через sendfile."""
+        buffers = []
+        sent = 0
+        for data in batch:
+            if isinstance(data, FileSegment):
+                send_buffers(self.conn, buffers, WRITE_MAX_IOV)
+                buffers = []
+                self.send_file_segment(data)
+                sent += data.length
+            else:
+                buffers.append(data)
+                sent += len(data)
+        send_buffers(self.conn, buffers, WRITE_MAX_IOV)
+        BYTES_SENT.inc(sent)
+
+    def send_file_segment(self, segment):
+        """Отправляет участок файла напрямую из файла в сокет (без копирования в Python)."""
+        with open(segment.path, 'rb') as f:
+            if hasattr(os, 'sendfile'):
+                offset, remaining = segment.offset, segment.length
+                while remaining:
+                    sent = os.sendfile(self.conn.fileno(), f.fileno(), offset, remaining)
+                    if sent == 0:
+                        raise EOFError(f"Файл {segment.path} короче ожидаемого")
+                    offset += sent
+                    remaining -= sent
+            elif self.conn.sendfile(f, segment.offset, segment.length) != segment.length:
+                raise EOFError(f"Файл {segment.path} короче ожидаемого")
+
+    def notify_writer(self):
+        """Будит писателя после постановки кадра (потоковому писателю не требуется)."""
+
+    def abort_connection(self):
+        """Прерывает соединение, разблокируя чтение и запись в сокет."""
         try:
-            while True:
-                data = self.conn.recv(self.server.BUFFER_SIZE).decode()
-                if not data:
-                    return None
-                self.buffer += data
-                if '\n' in self.buffer:
-                    message, self.buffer = self.buffer.split('\n', 1)
-                    return message.strip()
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def enqueue(self, data):
+        """Ставит готовый кадр рассылки в очередь без ожидания.
+
+        Если очередь заполнена, применяется политика для медленных клиентов.
+        """
+        return self.outbound.put(data, block=False)
+
+    def receive_frame(self):
+        """Принимает одно полное сообщение: JSON-строку или бинарный кадр."""
+        try:
+            return self.reader.read_frame()
+        except FrameTooLargeError as e:
+            self.reject_oversized_frame(e)
+            return None
         except Exception as e:
             logger.error(f"Ошибка при приёме сообщения от {self.addr}: {e}")
             return None
 
+    def reject_oversized_frame(self, error):
+        """Сообщает клиенту о слишком большом кадре; после этого соединение закрывается."""
+        logger.warning(f"Клиент {self.addr} прислал слишком большой кадр: {error}")
+        self.send_response({'type': 'response', 'status': 'error', 'message': 'Сообщение слишком велико'})
+
     def send_response(self, message):
-        """Отправляет сообщение клиенту, добавляя '\n' как разделитель."""
-        try:
-            self.conn.send((json.dumps(message) + '\n').encode())
-            logger.debug(f"Отправлено сообщение клиенту {self.addr}: {message}")
-        except Exception as e:
-            logger.error(f"Ошибка при отправке сообщения клиенту {self.addr}: {e}")
+        """Отправляет сообщение клиенту, добавляя '\n' как разделитель.
+
+        Ждет места в исходящей очереди, поэтому ответы клиенту не теряются.
+        Возвращает False, если соединение уже закрыто.
+        """
+        if self.outbound.put(self.encode_message(message), block=True):
+            logger.debug(f"Отправлено сообщение {message.get('type')} клиенту {self.addr}")
+            return True
+        logger.error(f"Ошибка при отправке сообщения клиенту {self.addr}: соединение закрыто")
+        return False
+
+    def encode_message(self, message):
+        """Кодирует сообщение для этого клиента, сжимая его, если сжатие согласовано."""
+        return encode_compressed_message(message, self.compression, COMPRESSION_MIN_SIZE)
+
+    def send_binary(self, header, payload, compress=False):
+        """Отправляет клиенту бинарный кадр с заголовком и сырыми данными.
+
+        При compress=True данные сжимаются согласованным алгоритмом.
+        """
+        codec = self.compression if compress else None
+        if self.outbound.put(encode_compressed_binary_frame(header, payload, codec, COMPRESSION_MIN_SIZE), block=True):
+            logger.debug(f"Отправлен бинарный кадр {header.get('type')} клиенту {self.addr}")
+        else:
+            logger.error(f"Ошибка при отправке данных клиенту {self.addr}: соединение закрыто")
 
     def handle_login(self, auth_msg):
         nickname = auth_msg['nickname']
         password = auth_msg['password']
         if authenticate_user(nickname, password):
-            response = {'type': 'response', 'status': 'success', 'message': 'Успешный вход'}
-            with self.server.clients_lock:
-                self.server.clients[self.conn] = nickname
-            self.nickname = nickname
+            self.send_response(self.auth_success_response(nickname, 'Успешный вход'))
+            self.add_to_clients(nickname, auth_msg.get('last_message_id'))
             logger.info(f"Пользователь {nickname} вошел в систему.")
         else:
-            response = {'type': 'response', 'status': 'error', 'message': 'Неверные учетные данные'}
-        self.send_response(response)
-        if response['status'] != 'success':
-            self.conn.close()
+            self.send_response({'type': 'response', 'status': 'error', 'message': 'Неверные учетные данные'})
 
     def handle_register(self, auth_msg):
         nickname = auth_msg['nickname']
         password = auth_msg['password']
         if register_user(nickname, password):
-            response = {'type': 'response', 'status': 'success', 'message': 'Успешная регистрация'}
-            with self.server.clients_lock:
-                self.server.clients[self.conn] = nickname
-            self.nickname = nickname
+            self.send_response(self.auth_success_response(nickname, 'Успешная регистрация'))
+            self.add_to_clients(nickname)
             logger.info(f"Пользователь {nickname} зарегистрирован.")
         else:
-            response = {'type': 'response', 'status': 'error', 'message': 'Пользователь уже существует'}
-        self.send_response(response)
-        if response['status'] != 'success':
-            self.conn.close()
+            self.send_response({'type': 'response', 'status': 'error', 'message': 'Пользователь уже существует'})
+
+    def handle_resume(self, auth_msg):
+        """Восстанавливает сессию по токену, выданному при входе, без проверки пароля."""
+        nickname = self.server.sessions.verify(auth_msg.get('token', ''))
+        if nickname:
+            self.send_response({'type': 'response', 'status': 'success', 'message': 'Сессия восстановлена',
+                                'nickname': nickname, 'features': sorted(self.features)})
+            self.add_to_clients(nickname, auth_msg.get('last_message_id'))
+            logger.info(f"Пользователь {nickname} восстановил сессию.")
+        else:
+            self.send_response({'type': 'response', 'status': 'error', 'message': 'Сессия недействительна или истекла'})
+
+    def handle_data_connect(self, auth_msg):
+        """Открывает соединение передачи данных по токену, выданному в основном соединении.
+
+        Такое соединение не попадает в рассылки и комнаты и принимает только
+        чанки файлов и запросы скачивания.
+        """
+        nickname = self.server.transfer_tokens.verify(auth_msg.get('token', ''))
+        if nickname:
+            self.nickname = nickname
+            self.data_connection = True
+            self.send_response({'type': 'response', 'status': 'success', 'message': 'Соединение для данных открыто',
+                                'nickname': nickname, 'features': sorted(self.features)})
+            logger.info(f"Пользователь {nickname} открыл соединение передачи данных {self.addr}.")
+        else:
+            self.send_response({'type': 'response', 'status': 'error', 'message': 'Токен передачи недействителен'})
+
+    def handle_transfer_token(self):
+        """Выдает токен для дополнительных соединений передачи данных."""
+        token, expires_at = self.server.transfer_tokens.issue(self.nickname)
+        self.send_response({'type': 'transfer_token', 'token': token, 'expires': expires_at,
+                            'streams': TRANSFER_MAX_STREAMS})
+
+    def handle_logout(self, msg):
+        """Отзывает токен сессии клиента (или все его токены, если all=True)."""
+        if msg.get('all'):
+            self.server.sessions.revoke_user(self.nickname)
+        elif msg.get('token'):
+            self.server.sessions.revoke(msg['token'])
+        self.send_response({'type': 'response', 'status': 'success', 'message': 'Сессия завершена'})
+        logger.info(f"Пользователь {self.nickname} завершил сессию.")
+
+    def auth_success_response(self, nickname, message):
+        """Ответ на успешный вход или регистрацию с новым токеном сессии."""
+        token, expires_at = self.server.sessions.issue(nickname)
+        return {'type': 'response', 'status': 'success', 'message': message, 'features': sorted(self.features),
+                'session_token': token, 'session_expires': expires_at}
+
+    def add_to_clients(self, nickname, last_message_id=None):
+        """Отправляет клиенту историю сообщений и добавляет его в рассылку.
+
+        Вызывается после постановки ответа на вход в очередь, чтобы рассылки
+        не опередили его. last_message_id - номер последнего сообщения, которое
+        клиент уже видел; без него отправляются последние HISTORY_REPLAY_LIMIT.
+        """
+        self.nickname = nickname
+        with self.server.direct_lock:
+            # Пока клиент не подписан на комнату, рассылки до него не доходят
+            self.server.add_client(self, nickname)
+            offline_messages = self.claim_offline_messages()
+        self.queue_history(HISTORY_DEFAULT_ROOM, last_message_id)
+        if offline_messages:
+            self.send_offline_messages(offline_messages)
+
+    def claim_offline_messages(self):
+        """Забирает офлайн-сообщения для доставки этому подключению. Вызывается под direct_lock.
+
+        Пока одно подключение пользователя доставляет очередь, другие ее не
+        берут, чтобы сообщения не пришли дважды. Новые личные сообщения с этого
+        момента идут в подключения напрямую.
+        """
+        if self.nickname in self.server.offline_deliveries:
+            return []
+        try:
+            messages = get_offline_messages(self.nickname)
+        except Exception as e:
+            logger.error(f"Ошибка при получении офлайн-сообщений для {self.nickname}: {e}")
+            return []
+        if messages:
+            self.server.offline_deliveries.add(self.nickname)
+        return messages
+
+    def send_offline_messages(self, messages):
+        """Доставляет личные сообщения, пришедшие, пока пользователь был не в сети.
+
+        Сообщения идут кадрами по OFFLINE_DELIVERY_BATCH вне общих блокировок,
+        а из базы удаляются только после постановки в очередь клиента.
+        """
+        try:
+            for start in range(0, len(messages), OFFLINE_DELIVERY_BATCH):
+                batch = messages[start:start + OFFLINE_DELIVERY_BATCH]
+                if not self.send_response({
+                    'type': 'offline_messages',
+                    'to': self.nickname,
+                    'messages': [{k: m[k] for k in ('sender', 'content', 'date')} for m in batch],
+                    'complete': start + OFFLINE_DELIVERY_BATCH >= len(messages)
+                }):
+                    break
+                delete_offline_messages(self.nickname, batch[-1]['id'])
+            else:
+                logger.info(f"Пользователю {self.nickname} доставлено офлайн-сообщений: {len(messages)}")
+        except Exception as e:
+            logger.error(f"Ошибка при доставке офлайн-сообщений для {self.nickname}: {e}")
+        finally:
+            with self.server.direct_lock:
+                self.server.offline_deliveries.discard(self.nickname)
+
+    def handle_direct_message(self, msg):
+        """Отправляет личное сообщение всем подключениям получателя или в его офлайн-очередь."""
+        recipient = msg.get('to')
+        content = msg.get('content', '')
+        if not recipient or get_user_password_hash(recipient) is None:
+            self.send_response({'type': 'response', 'status': 'error', 'message': f'Пользователь {recipient} не найден'})
+            return
+        direct_msg = {'type': 'direct', 'sender': self.nickname, 'to': recipient, 'content': content,
+                      'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        rejected = False
+        with self.server.direct_lock:
+            # Под блокировкой только решение и запись в очередь: ответ отправителю ждет места
+            # в его исходящей очереди, а direct_lock нужен при каждом входе
+            delivered = self.server.send_to_user(recipient, direct_msg)
+            if not delivered:
+                rejected = count_offline_messages(recipient) >= OFFLINE_QUEUE_MAX_MESSAGES
+                if not rejected:
+                    add_offline_message(recipient, self.nickname, content, direct_msg['date'])
+        if rejected:
+            self.send_response({'type': 'direct_status', 'to': recipient, 'status': 'rejected',
+                                'message': f'Очередь сообщений пользователя {recipient} переполнена'})
+            return
+        # Копия на другие устройства отправителя, чтобы переписка была видна везде
+        if recipient != self.nickname:
+            self.server.send_to_user(self.nickname, direct_msg, exclude=self)
+        CHAT_MESSAGES.labels('direct').inc()
+        self.send_response({'type': 'direct_status', 'to': recipient, 'status': 'delivered' if delivered else 'queued'})
+        logger.info(f"Личное сообщение от {self.nickname} для {recipient} {'доставлено' if delivered else 'в очереди'}")
+
+    def handle_join(self, msg):
+        """Подписывает клиента на комнату и отправляет ее историю."""
+        room = msg.get('room')
+        if not self.is_valid_room_name(room):
+            self.send_response({'type': 'response', 'status': 'error', 'message': 'Недопустимое имя комнаты'})
+            return
+        # Ответ до блокировки: рассылки комнаты начнутся только после подписки
+        self.send_response({'type': 'joined', 'room': room})
+        self.queue_history(room, msg.get('last_message_id'))
+        logger.info(f"Пользователь {self.nickname} вошел в комнату {room}")
+
+    def handle_leave(self, msg):
+        """Отписывает клиента от комнаты."""
+        room = msg.get('room')
+        if room not in self.rooms:
+            self.send_response({'type': 'response', 'status': 'error', 'message': f'Вы не состоите в комнате {room}'})
+            return
+        self.server.leave_room(self, room)
+        self.send_response({'type': 'left', 'room': room})
+        logger.info(f"Пользователь {self.nickname} покинул комнату {room}")
+
+    def is_valid_room_name(self, room):
+        return isinstance(room, str) and 0 < len(room.strip()) == len(room) <= ROOM_NAME_MAX_LENGTH
+
+    def queue_history(self, room, since_id):
+        """Ставит историю комнаты в очередь без ожидания и подписывает клиента на комнату.
+
+        История и подписка идут под history.lock (база читается до нее), так
+        что каждое сообщение комнаты клиент получает один раз: из истории или
+        рассылкой, и по порядку. Ждать места в очереди под этой блокировкой
+        нельзя: медленный клиент остановил бы чат во всех комнатах. Поэтому
+        при переполнении действует политика для медленных клиентов, как при рассылке.
+        """
+        def deliver(messages, truncated):
+            for start in range(0, len(messages), HISTORY_REPLAY_BATCH):
+                batch = messages[start:start + HISTORY_REPLAY_BATCH]
+                frame = self.encode_message({
+                    'type': 'history',
+                    'room': room,
+                    'messages': [{k: m[k] for k in ('id', 'sender', 'content', 'date')} for m in batch],
+                    'truncated': truncated and start == 0,  # Более ранние сообщения не поместились
+                    'complete': start + HISTORY_REPLAY_BATCH >= len(messages)
+                })
+                if not self.enqueue(frame):
+                    logger.warning(f"История комнаты {room} не поставлена в очередь клиента {self.addr} (медленный клиент)")
+                    break
+            self.server.join_room(self, room)
+
+        try:
+            self.server.history.replay(room, since_id, HISTORY_REPLAY_LIMIT, deliver)
+        except Exception as e:
+            logger.error(f"Ошибка при получении истории для клиента {self.addr}: {e}")
+            self.server.join_room(self, room)
 
     def handle_chat_message(self, msg):
         content = msg['content']
+        room = msg.get('room', HISTORY_DEFAULT_ROOM)
         sender = self.nickname if self.nickname else 'Unknown'
-        broadcast_msg = {'type': 'message', 'sender': sender, 'content': content}
-        self.server.broadcast(broadcast_msg, sender=sender)
-        logger.info(f"Сообщение от {sender}: {content}")
+        if room not in self.rooms:
+            self.send_response({'type': 'response', 'status': 'error', 'message': f'Вы не состоите в комнате {room}'})
+            return
+        history = self.server.history
+        # Номер в журнале и рассылка под одной блокировкой: входящий клиент получит
+        # сообщение либо в истории, либо рассылкой, но не дважды и не вне порядка
+        with history.lock:
+            record = history.append(room, sender, content)
+            broadcast_msg = {'type': 'message', 'id': record['id'], 'room': room, 'sender': sender,
+                             'content': content, 'date': record['date']}
+            self.server.broadcast(broadcast_msg, sender=sender, room=room)
+        CHAT_MESSAGES.labels('room').inc()
+        logger.info(f"Сообщение от {sender} в комнату {room}: {describe_content(content)}")
 
-    def handle_file_upload(self, msg):
-        """Обрабатывает загрузку файла от клиента."""
+    def handle_file_upload(self, msg, payload=None):
+        """Обрабатывает загрузку файла от клиента.
+
+        Данные чанка приходят либо сырыми байтами бинарного кадра (payload),
+        либо hex-строкой в поле file_data для клиентов без бинарного режима.
+        Файл пишется во временный файл и по завершении переносится в
+        хранилище blob-ов под своим SHA-256. Если клиент передал upload_id,
+        загрузка возобновляемая: она переживает обрыв соединения, и чанки
+        можно досылать с любого подключения того же пользователя.
+        """
         file_name = msg['file_name']
-        file_size = msg.get('file_size', '0 Б')  # Размер файла
         total_chunks = msg.get('total_chunks', 1)
         current_chunk = msg.get('current_chunk', 1)
-        file_data_hex = msg['file_data']
+        offset = msg.get('offset')  # Смещение чанка в файле; старые клиенты его не передают
+        upload_id = msg.get('upload_id')
         sender = self.nickname if self.nickname else 'Unknown'
-        date = msg.get('date', 'Unknown')
-
-        logger.info(f"Получен файл {file_name} от {sender} (Чанк {current_chunk}/{total_chunks})")
-
-        if file_name not in self.files_being_received:
-            # Инициализируем запись нового файла
-            safe_file_name = self.get_safe_filename(sender, file_name)
-            file_path = os.path.join(FILES_DIR, safe_file_name)
-            self.files_being_received[file_name] = {
-                'total_chunks': total_chunks,
-                'received_chunks': 0,
-                'file_path': file_path,
-                'file_size': file_size,
-                'file_type': self.get_file_type(file_path),
-                'sender': sender,
-                'date': date
-            }
 
-        file_info = self.files_being_received[file_name]
+        session = None
         try:
-            with self.lock:
-                # Открываем файл в режиме добавления или создания
-                mode = 'ab' if current_chunk > 1 else 'wb'
-                with open(file_info['file_path'], mode) as f:
-                    f.write(bytes.fromhex(file_data_hex))
-            file_info['received_chunks'] += 1
-            logger.info(f"Чанк {current_chunk} файла {file_name} сохранен.")
-
-            if file_info['received_chunks'] == file_info['total_chunks']:
-                logger.info(f"Файл {file_name} от {sender} полностью сохранен.")
-                # Рассылка информации о новом файле всем клиентам
-                new_file_msg = {
-                    'type': 'new_file',
-                    'file_name': file_name,
-                    'file_size': file_info['file_size'],
-                    'file_type': file_info['file_type'],
-                    'sender': file_info['sender'],
-                    'date': file_info['date']
-                }
-                self.server.broadcast(new_file_msg, sender=None)  # Отправить всем клиентам
-
-                # Удаление информации о полученном файле
-                del self.files_being_received[file_name]
+            data = payload if payload is not None else bytes.fromhex(msg['file_data'])
+            if upload_id is not None:
+                if self.server.uploads.completed_file(upload_id, sender) is not None:
+                    # Повтор чанка уже завершенной загрузки (например, по второму соединению)
+                    logger.info(f"Чанк {current_chunk} завершенной загрузки {upload_id} от {sender} пропущен.")
+                    return
+                session = self.server.uploads.open(upload_id, sender, total_chunks, self.upload_info(msg))
+                completed = session.write(data, offset, current_chunk)
+            else:
+                session = self.files_being_received.get(file_name)
+                if session is None or current_chunk == 1:
+                    if session is not None:
+                        session.abort()  # Клиент начал отправку этого файла заново
+                    session = self.start_upload_session(total_chunks, self.upload_info(msg))
+                    self.files_being_received[file_name] = session
+                session.write(data, offset)
+                completed = session.is_complete()
+                if completed:
+                    del self.files_being_received[file_name]
+            logger.info(f"Чанк {current_chunk}/{total_chunks} файла {file_name} от {sender} принят.")
+
+            if completed:
+                file_id = self.complete_upload(session)
+                if upload_id is not None:
+                    self.server.uploads.finish(upload_id, file_id)
         except Exception as e:
             logger.error(f"Ошибка при сохранении чанка файла {file_name}: {e}")
-            self.send_response({'type': 'response', 'status': 'error', 'message': f'Ошибка при сохранении файла {file_name}'})
-            del self.files_being_received[file_name]
+            self.send_response({'type': 'response', 'status': 'error', 'message': f'Ошибка при сохранении файла {file_name}',
+                                'upload_id': upload_id})
+            if upload_id is not None:
+                # Записанные чанки остаются на диске: клиент сможет продолжить загрузку.
+                # Полную загрузку не трогаем: ее завершает поток, принявший последний чанк
+                if session is not None and not session.is_complete():
+                    self.server.uploads.release(upload_id)
+                return
+            failed = self.files_being_received.pop(file_name, None) or session
+            if failed is not None:
+                failed.abort()
+
+    def complete_upload(self, session):
+        """Переносит полностью принятый файл в хранилище blob-ов и объявляет его комнате."""
+        session.close()
+        sha256 = session.sha256()
+        size = os.path.getsize(session.file_path)
+        blobs = self.server.blobs
+        with blobs.lock:
+            blobs.commit(session.file_path, sha256)
+            file_id = self.add_blob_record(sha256, size, session.info)
+        TRANSFER_BYTES.labels('upload').observe(size)
+        logger.info(f"Файл {session.info['file_name']} от {session.info['sender']} полностью сохранен (blob {sha256}).")
+        # Рассылка информации о новом файле подписчикам комнаты (включая отправителя)
+        new_file_msg = {'type': 'new_file', 'file_id': file_id, **session.info}
+        self.server.broadcast(new_file_msg, sender=None, room=session.info['room'])
+        return file_id
+
+    def handle_upload_status(self, msg):
+        """Сообщает клиенту, каких чанков возобновляемой загрузки не хватает."""
+        upload_id = msg.get('upload_id')
+        file_id = self.server.uploads.completed_file(upload_id, self.nickname)
+        if file_id is not None:
+            # Последний чанк дошел, но клиент мог не успеть получить new_file до обрыва
+            self.send_response({'type': 'upload_status', 'upload_id': upload_id, 'status': 'complete',
+                                'file_id': file_id})
+            return
+        session = self.server.uploads.get(upload_id, self.nickname)
+        if session is None:
+            # Загрузка не найдена (завершена, удалена или чужая): клиенту нужно начать заново
+            self.send_response({'type': 'upload_status', 'upload_id': upload_id, 'status': 'unknown'})
+            return
+        self.send_response({'type': 'upload_status', 'upload_id': upload_id, 'status': 'partial',
+                            'file_name': session.info['file_name'], 'total_chunks': session.total_chunks,
+                            'missing': session.missing_chunks()})
+
+    def handle_file_offer(self, msg):
+        """Проверяет по SHA-256, есть ли уже на сервере файл с таким содержимым.
+
+        Если есть, файл сразу добавляется в каталог без передачи данных и
+        клиент получает status 'exists'; иначе - 'upload', и клиент
+        отправляет файл чанками.
+        """
+        file_name = msg['file_name']
+        sha256 = str(msg.get('sha256', '')).lower()
+        info = self.upload_info(msg)
+        file_id = None
+        if len(sha256) == 64 and all(c in string.hexdigits for c in sha256):
+            blobs = self.server.blobs
+            with blobs.lock:
+                size = get_blob_size(sha256)
+                if size is not None and size == msg.get('file_size_bytes') and blobs.exists(sha256):
+                    file_id = self.add_blob_record(sha256, size, info)
+        self.send_response({'type': 'file_offer_result', 'file_name': file_name, 'sha256': sha256,
+                            'status': 'upload' if file_id is None else 'exists'})
+        if file_id is not None:
+            logger.info(f"Файл {file_name} от {self.nickname} уже есть на сервере (blob {sha256}), передача не нужна.")
+            self.server.broadcast({'type': 'new_file', 'file_id': file_id, **info}, sender=None, room=info['room'])
 
-    def handle_list_files(self):
-        """Обрабатывает запрос клиента на список файлов."""
+    def upload_info(self, msg):
+        """Метаданные загружаемого файла для каталога и уведомления new_file."""
+        room = msg.get('room', HISTORY_DEFAULT_ROOM)  # Комната, которой будет объявлен файл
+        # Соединение передачи данных само не состоит в комнатах: проверяем подписки пользователя
+        if room not in self.rooms and not (self.data_connection and self.server.user_in_room(self.nickname, room)):
+            room = HISTORY_DEFAULT_ROOM
+        return {
+            'file_name': msg['file_name'],
+            'file_size': msg.get('file_size', '0 Б'),
+            'file_type': self.get_file_type(msg['file_name']),
+            'sender': self.nickname if self.nickname else 'Unknown',
+            'date': msg.get('date', 'Unknown'),
+            'room': room
+        }
+
+    def start_upload_session(self, total_chunks, info):
+        """Открывает временный файл хранилища blob-ов для новой загрузки."""
+        return UploadSession(self.server.blobs.temp_path(), total_chunks, UPLOAD_DURABILITY,
+                             UPLOAD_WRITE_BEHIND_CHUNKS, **info)
+
+    def add_blob_record(self, sha256, size, info):
+        """Добавляет в каталог запись о файле из хранилища blob-ов. Вызывать под server.blobs.lock.
+
+        Повторная отправка того же содержимого под тем же именем тем же
+        пользователем обновляет прежнюю запись, а не создает новую.
+        """
+        stored_name = f"{sha256}/{info['sender']}/{info['file_name']}"
+        file_id, unused_blob = add_file_record(stored_name, info['file_name'], info['sender'], size,
+                                               info['file_type'], info['date'], sha256, blob=sha256)
+        if unused_blob:
+            self.server.blobs.remove(unused_blob)
+        return file_id
+
+    def handle_list_files(self, msg):
+        """Обрабатывает запрос клиента на страницу списка файлов.
+
+        Необязательные поля: cursor (из предыдущего ответа), limit, sort, order
+        ('asc' или 'desc') и filters (sender, file_type, name_prefix, date_from, date_to).
+        """
         try:
-            files = self.get_files_list()
-            response = {'type': 'files_list', 'files': files}
+            sort = msg.get('sort', 'id')
+            if sort not in FILE_SORT_COLUMNS:
+                self.send_response({'type': 'response', 'status': 'error', 'message': f'Неизвестная сортировка: {sort}'})
+                return
+            limit = max(1, min(int(msg.get('limit', LIST_FILES_PAGE_SIZE)), LIST_FILES_MAX_PAGE_SIZE))
+            descending = msg.get('order') == 'desc'
+            cursor = msg.get('cursor')
+            filters = {k: v for k, v in (msg.get('filters') or {}).items() if k in LIST_FILES_FILTERS}
+            records, next_cursor = get_file_page(filters, sort, descending, cursor, limit)
+            response = {
+                'type': 'files_list',
+                'files': [self.file_record_to_info(record) for record in records],
+                'cursor': cursor,  # По нему клиент отличает первую страницу от следующих
+                'next_cursor': next_cursor,
+                'sort': sort,
+                'order': 'desc' if descending else 'asc',
+                'filters': filters
+            }
             self.send_response(response)
-            logger.info(f"Отправлен список файлов клиенту {self.addr}")
+            logger.info(f"Отправлена страница списка файлов ({len(records)}) клиенту {self.addr}")
         except Exception as e:
             logger.error(f"Ошибка при отправке списка файлов клиенту {self.addr}: {e}")
             self.send_response({'type': 'response', 'status': 'error', 'message': 'Не удалось получить список файлов'})
 
     def handle_download_file(self, msg):
-        """Обрабатывает запрос клиента на скачивание файла."""
+        """Обрабатывает запрос клиента на скачивание файла.
+
+        Необязательные offset и length запрашивают диапазон байт файла.
+        """
         file_name = msg['file_name']
-        safe_file_name = self.get_safe_filename_from_server(file_name)
-        file_path = os.path.join(FILES_DIR, safe_file_name)
+        record = find_file_record(file_name, msg.get('sender'), msg.get('file_id'))
+        file_path = self.record_path(record) if record else None
 
-        if not os.path.exists(file_path):
+        if not file_path or not os.path.exists(file_path):
             self.send_response({'type': 'response', 'status': 'error', 'message': f'Файл {file_name} не найден на сервере'})
             logger.warning(f"Файл {file_name} не найден для скачивания клиентом {self.addr}")
             return
 
         # Получение информации о файле
         file_size_bytes = os.path.getsize(file_path)
+        offset = msg.get('offset', 0)
+        length = msg.get('length', file_size_bytes - offset) if is_byte_offset(offset, file_size_bytes) else None
+        if not is_byte_offset(offset, file_size_bytes) or not is_byte_offset(length, file_size_bytes - offset):
+            self.send_response({'type': 'response', 'status': 'error', 'message': f'Неверный диапазон для файла {file_name}'})
+            logger.warning(f"Неверный диапазон offset={offset!r}, length={length!r} файла {file_name} от клиента {self.addr}")
+            return
         buffer_size = self.get_buffer_size(file_size_bytes)
-        total_chunks = (file_size_bytes // buffer_size) + (1 if file_size_bytes % buffer_size != 0 else 0)
+        total_chunks = (length // buffer_size) + (1 if length % buffer_size != 0 else 0)
+        compress = self.compression is not None and record['file_type'] not in INCOMPRESSIBLE_FILE_TYPES
+        # sendfile отдает байты файла как есть, поэтому сжимаемые файлы идут чанками
+        raw = FEATURE_RAW_DOWNLOAD in self.features and not compress
 
         # Отправка информации о файле
         file_info = {
             'type': 'file_info',
             'file_name': file_name,
             'file_size': self.get_readable_file_size(file_size_bytes),
-            'file_type': self.get_file_type(file_path),
+            'file_type': record['file_type'],
+            'file_id': record['id'],
             'total_chunks': total_chunks,
+            'file_size_bytes': file_size_bytes,
+            'offset': offset,
+            'length': length,
+            'transfer': 'raw' if raw else 'chunks',
             'sender': 'Server',
             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
+
+        if raw:
+            # Тело файла уходит сырыми байтами сразу за file_info; его отправит писатель через sendfile.
+            # Оба ставятся в очередь вместе, чтобы между ними не вклинилась рассылка
+            if not self.outbound.put_group([self.encode_message(file_info), FileSegment(file_path, offset, length)]):
+                logger.error(f"Ошибка при отправке файла {file_name} клиенту {self.addr}: соединение закрыто")
+                return
+            self.send_response({'type': 'file_complete', 'file_name': file_name})
+            TRANSFER_BYTES.labels('download').observe(length)
+            logger.info(f"Файл {file_name} ({length} байт) поставлен в очередь отправки клиенту {self.addr}")
+            return
+
         self.send_response(file_info)
 
         # Отправка файла в чанках
         try:
             with open(file_path, 'rb') as f:
+                f.seek(offset)
+                remaining = length
                 chunk_number = 1
-                while True:
-                    file_data = f.read(buffer_size)
+                while remaining:
+                    file_data = f.read(min(buffer_size, remaining))
                     if not file_data:
                         break
-                    file_data_hex = file_data.hex()
+                    remaining -= len(file_data)
                     chunk_msg = {
                         'type': 'file_chunk',
                         'file_name': file_name,
                         'chunk_number': chunk_number,
-                        'total_chunks': total_chunks,
-                        'file_data': file_data_hex
+                        'total_chunks': total_chunks
                     }
-                    self.send_response(chunk_msg)
+                    if FEATURE_BINARY in self.features:
+                        self.send_binary(chunk_msg, file_data, compress)
+                    else:
+                        chunk_msg['file_data'] = file_data.hex()
+                        self.send_response(chunk_msg)
                     logger.info(f"Отправлен файл {file_name} Чанк {chunk_number}/{total_chunks} клиенту {self.addr}")
                     chunk_number += 1
             # Завершение отправки файла
             self.send_response({'type': 'file_complete', 'file_name': file_name})
+            TRANSFER_BYTES.labels('download').observe(length)
             logger.info(f"Файл {file_name} полностью отправлен клиенту {self.addr}")
         except Exception as e:
             logger.error(f"Ошибка при отправке файла {file_name} клиенту {self.addr}: {e}")
             self.send_response({'type': 'response', 'status': 'error', 'message': f'Ошибка при отправке файла {file_name}'})
 
+    def handle_download_all(self, msg):
+        """Отправляет файлы каталога одним zip-архивом, который собирается на лету.
+
+        Необязательные поля: file_ids (id выбранных файлов) или filters (как в
+        list_files). Архив идет кадрами archive_chunk между archive_info и
+        archive_complete; временный архив не создается, а ограниченная исходящая
+        очередь не дает ему накопиться в памяти. Несжимаемые файлы сохраняются без deflate.
+        """
+        archive_name = f"files_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        file_ids = msg.get('file_ids')
+        if file_ids is not None and (not isinstance(file_ids, list) or len(file_ids) > ARCHIVE_MAX_SELECTED_FILES):
+            self.send_response({'type': 'response', 'status': 'error',
+                                'message': f'Можно выбрать не больше {ARCHIVE_MAX_SELECTED_FILES} файлов'})
+            return
+        filters = {k: v for k, v in (msg.get('filters') or {}).items() if k in LIST_FILES_FILTERS}
+        records = self.iter_selected_records(file_ids) if file_ids is not None else self.iter_catalog_records(filters)
+
+        self.send_response({'type': 'archive_info', 'archive_name': archive_name, 'format': 'zip',
+                            'file_ids': file_ids, 'filters': filters})
+
+        def emit(data):
+            if self.outbound.closed:
+                raise ConnectionError("соединение закрыто")  # Дальше собирать архив незачем
+            chunk_msg = {'type': 'archive_chunk', 'archive_name': archive_name}
+            if FEATURE_BINARY in self.features:
+                self.send_binary(chunk_msg, data)  # Содержимое архива уже сжато, где это имело смысл
+            else:
+                chunk_msg['data'] = data.hex()
+                self.send_response(chunk_msg)
+
+        try:
+            count, size = stream_zip(self.archive_entries(records), emit, ARCHIVE_CHUNK_SIZE)
+            self.send_response({'type': 'archive_complete', 'status': 'success', 'archive_name': archive_name,
+                                'files': count, 'size': size})
+            TRANSFER_BYTES.labels('archive').observe(size)
+            logger.info(f"Архив {archive_name} ({count} файлов, {size} байт) отправлен клиенту {self.addr}")
+        except Exception as e:
+            logger.error(f"Ошибка при отправке архива {archive_name} клиенту {self.addr}: {e}")
+            self.send_response({'type': 'archive_complete', 'status': 'error', 'archive_name': archive_name,
+                                'message': 'Ошибка при формировании архива'})
+
+    def iter_catalog_records(self, filters):
+        """Перебирает записи каталога, подходящие под фильтры, постранично по id."""
+        cursor = None
+        while True:
+            records, cursor = get_file_page(filters, 'id', False, cursor, LIST_FILES_MAX_PAGE_SIZE)
+            yield from records
+            if cursor is None:
+                return
+
+    def iter_selected_records(self, file_ids):
+        for file_id in dict.fromkeys(file_ids):
+            record = find_file_record(file_id=file_id)
+            if record:
+                yield record
+
+    def archive_entries(self, records):
+        """Превращает записи каталога в элементы архива вида отправитель/имя файла.
+
+        Совпадающие имена различаются id файла, отсутствующие на диске файлы пропускаются.
+        """
+        used_names = set()
+        for record in records:
+            file_path = self.record_path(record)
+            if not os.path.isfile(file_path):
+                logger.warning(f"Файл {record['file_name']} (id {record['id']}) не найден и не попадет в архив")
+                continue
+            arcname = f"{record['sender']}/{os.path.basename(record['file_name'])}"
+            if arcname in used_names:
+                base, ext = os.path.splitext(arcname)
+                arcname = f"{base} ({record['id']}){ext}"
+            used_names.add(arcname)
+            compress = record['file_type'] not in INCOMPRESSIBLE_FILE_TYPES
+            yield arcname, file_path, record['date'], compress
+
     def get_buffer_size(self, file_size):
         """Определяет оптимальный размер буфера в зависимости от размера файла."""
         if file_size < SMALL_FILE_THRESHOLD:
@@ -259,71 +862,27 @@ class ClientHandler:
         else:
             return HUGE_FILE_BUFFER
 
-    def get_safe_filename(self, sender, file_name):
-        """Генерирует безопасное имя файла, избегая конфликтов."""
-        # Можно добавить проверку на безопасность, убрать опасные символы и т.д.
-        # Здесь просто добавим префикс с ником отправителя
-        safe_name = f"{sender}_{file_name}"
-        return safe_name
-
-    def get_safe_filename_from_server(self, file_name):
-        """Получает безопасное имя файла на сервере."""
-        # Предполагается, что файлы на сервере хранятся как {sender}_{file_name}
-        # Если известно имя отправителя, можно искать соответствующий файл
-        # Для простоты, если несколько файлов с одинаковыми именами, это может вызвать проблемы
-        # Здесь предполагаем, что имена уникальны
-        for f in os.listdir(FILES_DIR):
-            if f.endswith(f"_{file_name}"):
-                return f
-        # Если файл не найден, вернуть оригинальное имя
-        return file_name
-
-    def get_files_list(self):
-        """Возвращает список файлов на сервере с метаданными."""
-        files = []
-        for f in os.listdir(FILES_DIR):
-            file_path = os.path.join(FILES_DIR, f)
-            if os.path.isfile(file_path):
-                file_size_bytes = os.path.getsize(file_path)
-                file_size = self.get_readable_file_size(file_size_bytes)
-                file_type = self.get_file_type(file_path)
-                # Получение даты создания или модификации
-                mod_time = os.path.getmtime(file_path)
-                date = datetime.fromtimestamp(mod_time).strftime("%Y-%m-%d %H:%M:%S")
-                # Получатель файла из имени, предположим формат: {sender}_{file_name}
-                parts = f.split('_', 1)
-                sender = parts[0] if len(parts) > 1 else 'Unknown'
-                original_file_name = parts[1] if len(parts) > 1 else f
-                files.append({
-                    'file_name': original_file_name,
-                    'file_size': file_size,
-                    'file_type': file_type,
-                    'sender': sender,
-                    'date': date
-                })
-        return files
+    def record_path(self, record):
+        """Путь к содержимому файла из каталога: blob или файл прямо в FILES_DIR."""
+        if record['blob']:
+            return self.server.blobs.path(record['blob'])
+        return os.path.join(FILES_DIR, record['stored_name'])
+
+    def file_record_to_info(self, record):
+        """Преобразует запись каталога в описание файла для клиента."""
+        return {
+            'file_id': record['id'],
+            'file_name': record['file_name'],
+            'file_size': self.get_readable_file_size(record['size']),
+            'file_type': record['file_type'],
+            'sender': record['sender'],
+            'date': record['date']
+        }
 
     def get_readable_file_size(self, size_in_bytes):
         """Преобразует размер файла из байт в читаемый формат."""
-        for unit in ['Б', 'КБ', 'МБ', 'ГБ', 'ТБ']:
-            if size_in_bytes < 1024:
-                return f"{size_in_bytes:.2f} {unit}".rstrip('0').rstrip('.')  # Убираем лишние нули после точки
-            size_in_bytes /= 1024
-        return f"{size_in_bytes:.2f} ПБ".rstrip('0').rstrip('.')  # Убираем лишние нули после точки
+        return get_readable_file_size(size_in_bytes)
 
     def get_file_type(self, file_path):
         """Определяет тип файла по расширению."""
-        _, ext = os.path.splitext(file_path)
-        ext = ext.lower()
-        if ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
-            return 'Изображение'
-        elif ext in ['.mp4', '.avi', '.mov', '.mkv']:
-            return 'Видео'
-        elif ext in ['.pdf', '.docx', '.xlsx', '.pptx', '.txt']:
-            return 'Документ'
-        elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz']:
-            return 'Архив'
-        elif ext in ['.mp3', '.wav', '.aac', '.flac']:
-            return 'Музыка'
-        else:
-            return 'Другой'
\ No newline at end of file
+        return get_file_type(file_path)
@@ -0,0 +1,111 @@
+# server/history.py
+
+import logging
+import threading
+import time
+from datetime import datetime
+from database import insert_messages, get_messages, get_last_message_id
+
+logger = logging.getLogger(__name__)
+
+REPLAY_READ_ATTEMPTS = 3  # Сколько раз дочитывать историю из базы без блокировки, пока идет запись
+
+class MessageHistory:
+    """Журнал сообщений чата в SQLite с групповой записью.
+
+    append() только присваивает сообщению номер и кладет его в список
+    незаписанных, поэтому рассылка не ждет диска. Отдельный поток раз в
+    flush_interval (или при накоплении group_size сообщений) записывает
+    накопленное одной транзакцией. При выборке истории незаписанные
+    сообщения берутся из памяти, а записанные - из базы по индексу (room, id).
+
+    lock - RLock: обработчики держат его, чтобы номер сообщения и его
+    рассылка (или выдача истории и подписка клиента) шли атомарно. Чтение
+    базы при выдаче истории идет вне этой блокировки.
+    """
+
+    def __init__(self, flush_interval, group_size):
+        self.flush_interval = flush_interval
+        self.group_size = group_size
+        self.lock = threading.RLock()
+        self.flush_cond = threading.Condition(self.lock)
+        self.last_id = get_last_message_id()
+        self.flushed_id = self.last_id  # Сообщения с номером до flushed_id включительно уже в базе
+        self.unflushed = []  # Сообщения, еще не записанные в базу, по возрастанию id
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def append(self, room, sender, content):
+        """Добавляет сообщение в журнал и возвращает его запись (со столбцом id)."""
+        with self.lock:
+            self.last_id += 1
+            record = {
+                'id': self.last_id,
+                'room': room,
+                'sender': sender,
+                'content': content,
+                'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self.unflushed.append(record)
+            if len(self.unflushed) >= self.group_size:
+                self.flush_cond.notify()
+        return record
+
+    def replay(self, room, since_id, limit, deliver):
+        """Передает deliver(messages, truncated) до limit последних сообщений комнаты с номером больше since_id.
+
+        truncated - True, если более старые сообщения после since_id не
+        поместились в limit. Записанные сообщения читаются из базы без
+        блокировки; под lock берутся только незаписанные и вызывается deliver,
+        чтобы обработчик поставил историю в очередь и подписал клиента раньше
+        следующей рассылки. Если поток записи успел сбросить в базу новые
+        сообщения, дочитывается только этот промежуток.
+        """
+        since_id = since_id or 0
+        read_id = since_id  # Записанные сообщения до read_id включительно уже прочитаны
+        stored = []
+        for attempt in range(REPLAY_READ_ATTEMPTS):
+            flushed_id = self.flushed_id
+            if flushed_id > read_id:
+                stored += get_messages(room, read_id, flushed_id, limit + 1)
+                read_id = flushed_id
+            with self.lock:
+                if self.flushed_id <= read_id or attempt == REPLAY_READ_ATTEMPTS - 1:
+                    if self.flushed_id > read_id:
+                        # Запись не отстает от чтения: дочитываем последний промежуток под блокировкой
+                        stored += get_messages(room, read_id, self.flushed_id, limit + 1)
+                        read_id = self.flushed_id
+                    pending = [m for m in self.unflushed if m['room'] == room and m['id'] > read_id]
+                    messages = stored + pending
+                    deliver(messages[-limit:], len(messages) > limit)
+                    return
+
+    def flush(self):
+        """Записывает все накопленные сообщения (например, перед остановкой сервера)."""
+        with self.lock:
+            batch = list(self.unflushed)
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        insert_messages(batch)
+        with self.lock:
+            last_id = batch[-1]['id']
+            if last_id > self.flushed_id:
+                # Пачку мог успеть записать и flush(), поэтому убираем по номерам, а не по длине
+                self.unflushed = [m for m in self.unflushed if m['id'] > last_id]
+                self.flushed_id = last_id
+
+    def _write_loop(self):
+        while True:
+            with self.lock:
+                if len(self.unflushed) < self.group_size:
+                    self.flush_cond.wait(self.flush_interval)
+                batch = list(self.unflushed)
+            if not batch:
+                continue
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Ошибка при записи истории сообщений: {e}")
+                time.sleep(self.flush_interval)  # Повторим запись той же пачки на следующем проходе
@@ -0,0 +1,81 @@
+# server/logs.py
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import LOG_MESSAGE_BODIES
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает частоту записей ниже WARNING из одного места кода.
+
+    Из каждой строки с вызовом логгера пропускается не больше limit записей за
+    interval секунд (например, строки о каждом чанке файла); остальные
+    отбрасываются, а первая запись следующего окна сообщает, сколько их было.
+    Предупреждения и ошибки проходят всегда.
+    """
+
+    def __init__(self, limit, interval):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.windows = {}  # (файл, строка): [начало окна, записей в окне, пропущено]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.limit:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self.windows[key] = [now, 1, 0]
+            elif window[1] < self.limit:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} (пропущено похожих записей: {suppressed})"
+            record.args = None
+        return True
+
+def setup_logging(log_file, level, max_bytes, backup_count, rate_limit, rate_interval):
+    """Настраивает логирование сервера через очередь и возвращает запущенный QueueListener.
+
+    Потоки сервера только кладут запись в очередь, а запись в файл (с ротацией
+    по размеру) и в консоль выполняет отдельный поток слушателя, поэтому
+    обработчики не ждут диска и не держат блокировки на время вывода.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit, rate_interval))
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)  # Дописываем оставшиеся в очереди записи при выходе
+    return listener
+
+def describe_content(content):
+    """Текст сообщения для лога: сам текст только при LOG_MESSAGE_BODIES, иначе его длина."""
+    if LOG_MESSAGE_BODIES:
+        return content
+    return f"<{len(content)} симв.>"
@@ -0,0 +1,199 @@
+# server/metrics.py
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм задержек, сек
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Границы гистограмм размеров передач, байт
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # От 1 КБ до 1 ТБ
+# Границы гистограммы числа получателей рассылки
+FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Counter:
+    """Монотонный счетчик. inc() - одно сложение под собственной блокировкой."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин (как histogram в Prometheus)."""
+
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - +Inf
+        self.sum = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            samples.append((f"{name}_bucket", labels + (('le', str(bound)),), cumulative))
+        samples.append((f"{name}_sum", labels, total))
+        samples.append((f"{name}_count", labels, cumulative))
+        return samples
+
+class MetricFamily:
+    """Метрика с именем и описанием; для каждого набора значений меток - свой экземпляр."""
+
+    def __init__(self, name, kind, help, labelnames, factory):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = labelnames
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.factory())
+        return child
+
+    def samples(self):
+        with self.lock:
+            children = list(self.children.items())
+        samples = []
+        for values, child in children:
+            samples += child.samples(self.name, tuple(zip(self.labelnames, values)))
+        return samples
+
+class CallbackMetric:
+    """Метрика, значение которой вычисляется при каждом опросе.
+
+    func возвращает число или, если заданы labelnames, словарь
+    {кортеж значений меток: число}.
+    """
+
+    def __init__(self, name, kind, help, labelnames, func):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = labelnames
+        self.func = func
+
+    def samples(self):
+        value = self.func()
+        if not self.labelnames:
+            return [(self.name, (), value)]
+        return [(self.name, tuple(zip(self.labelnames, values)), v) for values, v in value.items()]
+
+class MetricsRegistry:
+    """Реестр метрик сервера, отдаваемых в текстовом формате Prometheus.
+
+    Счетчики и гистограммы обновляются на горячем пути (одна короткая
+    блокировка на замер), а глубины очередей, число потоков и подобное
+    вычисляются только при опросе через callback.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}  # name: MetricFamily или CallbackMetric
+
+    def counter(self, name, help, labelnames=()):
+        """Возвращает счетчик (или семейство счетчиков, если заданы метки)."""
+        return self._register(MetricFamily(name, 'counter', help, labelnames, Counter))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        """Возвращает гистограмму (или семейство гистограмм, если заданы метки)."""
+        return self._register(MetricFamily(name, 'histogram', help, labelnames, lambda: Histogram(buckets)))
+
+    def callback(self, name, kind, help, func, labelnames=()):
+        """Регистрирует метрику, вычисляемую при опросе; повторная регистрация заменяет прежнюю."""
+        with self.lock:
+            self.metrics[name] = CallbackMetric(name, kind, help, labelnames, func)
+
+    def _register(self, family):
+        with self.lock:
+            family = self.metrics.setdefault(family.name, family)
+        return family if family.labelnames else family.labels()
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате Prometheus 0.0.4."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.error(f"Ошибка при вычислении метрики {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape(label_value)}"' for key, label_value in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+REGISTRY = MetricsRegistry()
+
+# Метрики горячего пути; остальные регистрирует ChatServer через callback
+CONNECTIONS_TOTAL = REGISTRY.counter('chatrefresh_connections_total', 'Принятые TCP-подключения')
+FRAMES_RECEIVED = REGISTRY.counter('chatrefresh_frames_received_total', 'Принятые от клиентов кадры')
+BYTES_RECEIVED = REGISTRY.counter('chatrefresh_received_bytes_total', 'Байты принятых кадров (после распаковки)')
+BYTES_SENT = REGISTRY.counter('chatrefresh_sent_bytes_total', 'Байты, отправленные клиентам писателями подключений')
+CHAT_MESSAGES = REGISTRY.counter('chatrefresh_chat_messages_total', 'Сообщения чата по видам', ('kind',))
+BROADCAST_SECONDS = REGISTRY.histogram('chatrefresh_broadcast_seconds',
+                                       'Время постановки рассылки в очереди всех получателей')
+BROADCAST_RECIPIENTS = REGISTRY.histogram('chatrefresh_broadcast_recipients', 'Число получателей рассылки',
+                                          FANOUT_BUCKETS)
+TRANSFER_BYTES = REGISTRY.histogram('chatrefresh_transfer_bytes', 'Размер завершенных передач файлов',
+                                    SIZE_BUCKETS, ('direction',))
+HASH_SECONDS = REGISTRY.histogram('chatrefresh_password_hash_seconds',
+                                  'Время bcrypt с ожиданием свободного процесса', labelnames=('outcome',))
+DB_SECONDS = REGISTRY.histogram('chatrefresh_db_transaction_seconds',
+                                'Время транзакции SQLite с ожиданием соединения из пула')
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Запрос метрик от {self.client_address}: {format % args}")
+
+def start_metrics_server(host, port, registry=REGISTRY):
+    """Запускает HTTP-сервер метрик (GET /metrics) в фоновом потоке и возвращает его."""
+    handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+    http_server = ThreadingHTTPServer((host, port), handler)
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    logger.info(f"Метрики доступны по адресу http://{host}:{http_server.server_port}/metrics")
+    return http_server
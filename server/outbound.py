@@ -0,0 +1,191 @@
+# server/outbound.py
+
+import socket
+import threading
+from collections import deque
+
+# Политики для медленных клиентов, чья очередь исходящих сообщений заполнена
+POLICY_DROP = 'drop'              # Отбросить новое сообщение
+POLICY_DISCONNECT = 'disconnect'  # Отключить клиента
+POLICY_COALESCE = 'coalesce'      # Склеить накопленные сообщения в одну запись, пока хватает лимита байт
+SLOW_CONSUMER_POLICIES = (POLICY_DROP, POLICY_DISCONNECT, POLICY_COALESCE)
+
+class FileSegment:
+    """Участок файла, который писатель отправит через sendfile, не читая его в память."""
+
+    def __init__(self, path, offset, length):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return 0  # Данные участка не занимают память очереди
+
+class OutboundStats:
+    """Общие для сервера счетчики исходящих очередей."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {'enqueued': 0, 'dropped': 0, 'coalesced': 0, 'disconnected': 0}
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+class OutboundQueue:
+    """Ограниченная очередь исходящих кадров одного подключения.
+
+    Кадры (готовые байты) кладутся в очередь из любых потоков, а забирает их
+    единственный писатель подключения. Ответы самому клиенту ставятся с
+    ожиданием места (block=True), рассылки - без ожидания, с применением
+    политики для медленных клиентов.
+    """
+
+    def __init__(self, max_items, max_bytes, policy, stats=None, on_ready=None, on_abort=None):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Неизвестная политика для медленных клиентов: {policy}")
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.stats = stats or OutboundStats()
+        self.on_ready = on_ready  # Вызывается после постановки кадра (для asyncio-писателя)
+        self.on_abort = on_abort  # Вызывается при отключении клиента по политике
+        self.items = deque()
+        self.size = 0
+        self.closed = False
+        self.aborted = False
+        self.cond = threading.Condition()
+
+    def depth(self):
+        return len(self.items)
+
+    def pending_bytes(self):
+        return self.size
+
+    def _is_full(self, length):
+        if not self.items:
+            return False  # Один кадр больше лимита допускается в пустую очередь
+        return len(self.items) >= self.max_items or self.size + length > self.max_bytes
+
+    def _append(self, data):
+        self.items.append(data)
+        self.size += len(data)
+        self.stats.add('enqueued')
+        self.cond.notify_all()
+
+    def put(self, data, block=False):
+        """Ставит кадр в очередь. Возвращает False, если кадр не принят."""
+        with self.cond:
+            if block:
+                while not self.closed and self._is_full(len(data)):
+                    self.cond.wait()
+            if self.closed:
+                return False
+            if self._is_full(len(data)):
+                if not self._apply_policy(data):
+                    return False
+            else:
+                self._append(data)
+        if self.on_ready:
+            self.on_ready()
+        return True
+
+    def put_group(self, items):
+        """Ставит кадры подряд, дожидаясь места под все сразу. Возвращает False, если очередь закрыта.
+
+        Рассылки других потоков не попадут между ними: клиент, прочитав
+        file_info с transfer='raw', сразу читает сырое тело файла.
+        """
+        length = sum(len(item) for item in items)
+        with self.cond:
+            while not self.closed and self._is_full(length):
+                self.cond.wait()
+            if self.closed:
+                return False
+            for item in items:
+                self._append(item)
+        if self.on_ready:
+            self.on_ready()
+        return True
+
+    def _apply_policy(self, data):
+        """Обрабатывает переполнение очереди. Вызывается под self.cond."""
+        if (self.policy == POLICY_COALESCE and self.size + len(data) <= self.max_bytes
+                and all(isinstance(item, bytes) for item in self.items)):
+            # Лимит байт позволяет: склеиваем накопленное в одну запись
+            merged = b''.join(self.items)
+            self.items.clear()
+            self.items.append(merged)
+            self.stats.add('coalesced')
+            self._append(data)
+            return True
+        if self.policy == POLICY_DISCONNECT:
+            self.closed = True
+            self.aborted = True
+            self.items.clear()
+            self.size = 0
+            self.stats.add('disconnected')
+            self.cond.notify_all()
+            if self.on_abort:
+                self.on_abort()
+            return False
+        self.stats.add('dropped')
+        return False
+
+    def get_batch(self, block=True):
+        """Забирает все накопленные кадры.
+
+        Возвращает список кадров, пустой список (если block=False и очередь пуста)
+        или None, когда очередь закрыта и писателю пора закрыть соединение.
+        """
+        with self.cond:
+            while block and not self.items and not self.closed:
+                self.cond.wait()
+            if self.aborted or (self.closed and not self.items):
+                return None
+            batch = list(self.items)
+            self.items.clear()
+            self.size = 0
+            self.cond.notify_all()
+            return batch
+
+    def wait_for_bytes(self, min_bytes, timeout):
+        """Ждет, пока в очереди наберется min_bytes, очередь закроется или истечет timeout."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.closed or self.size >= min_bytes, timeout)
+
+    def close(self):
+        """Закрывает очередь: уже поставленные кадры будут отправлены."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.on_ready:
+            self.on_ready()
+
+def send_buffers(sock, buffers, max_iov=64):
+    """Отправляет буферы целиком, собирая их в вызовы sendmsg (writev) по max_iov штук.
+
+    sendmsg может отправить только часть данных; оставшееся досылается,
+    поэтому данные не обрезаются. Без sendmsg (Windows) буферы склеиваются
+    и отправляются через sendall.
+    """
+    if not hasattr(socket.socket, 'sendmsg'):
+        sock.sendall(b''.join(buffers))
+        return
+    pending = deque(memoryview(b) for b in buffers if len(b))
+    while pending:
+        iov = [pending[i] for i in range(min(max_iov, len(pending)))]
+        sent = sock.sendmsg(iov)
+        # Убираем отправленные буферы и обрезаем частично отправленный
+        while sent:
+            head = pending[0]
+            if sent >= len(head):
+                sent -= len(head)
+                pending.popleft()
+            else:
+                pending[0] = head[sent:]
+                sent = 0
@@ -3,42 +3,61 @@
 import socket
 import threading
 import os
-import json
 import logging
-from config import (TCP_PORT, UDP_PORT, BUFFER_SIZE, FILES_DIR, 
+import argparse
+import time
+from config import (TCP_PORT, UDP_PORT, BUFFER_SIZE, FILES_DIR, SERVER_ENGINES, SERVER_ENGINE, TCP_BACKLOG,
+                   BLOBS_DIR, PARTIAL_UPLOADS_DIR,
                    ENABLE_DIRECTORY_REGISTRATION, DIRECTORY_SERVER_IP, 
                    DIRECTORY_SERVER_PORT, USE_UPNP,
                    SMALL_FILE_THRESHOLD, MEDIUM_FILE_THRESHOLD,
                    LARGE_FILE_THRESHOLD, SMALL_FILE_BUFFER,
-                   MEDIUM_FILE_BUFFER, LARGE_FILE_BUFFER, HUGE_FILE_BUFFER)
-from database import init_db
+                   MEDIUM_FILE_BUFFER, LARGE_FILE_BUFFER, HUGE_FILE_BUFFER,
+                   OUTBOUND_METRICS_LOG_INTERVAL, CATALOG_REBUILD_ON_STARTUP,
+                   SESSION_TOKEN_TTL, SESSION_CLEANUP_INTERVAL,
+                   UPLOAD_DURABILITY, UPLOAD_WRITE_BEHIND_CHUNKS, UPLOAD_RESUME_TTL,
+                   UPLOAD_IDLE_TIMEOUT, UPLOAD_CLEANUP_INTERVAL, TRANSFER_TOKEN_TTL, TRANSFER_MAX_STREAMS,
+                   HISTORY_FLUSH_INTERVAL, HISTORY_GROUP_SIZE, HISTORY_DEFAULT_ROOM, TCP_NODELAY,
+                   METRICS_HOST, METRICS_PORT, LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+                   LOG_RATE_LIMIT, LOG_RATE_INTERVAL)
+from database import init_db, rebuild_file_catalog, get_blob_hashes
+from blobstore import BlobStore
+from uploads import UploadRegistry
+from auth import get_hash_pool, get_hash_metrics
+from sessions import SessionStore, TransferTokens
+from history import MessageHistory
 from handlers import ClientHandler
-from utils import get_server_ip
-
-# Настройка логирования с поддержкой UTF-8
-logging.basicConfig(
-    level=logging.INFO,  # Можно изменить на DEBUG для более подробных логов
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[
-        logging.FileHandler("server.log", encoding='utf-8'),  # Указана кодировка utf-8
-        logging.StreamHandler()
-    ]
-)
+from outbound import OutboundStats
+from metrics import REGISTRY, CONNECTIONS_TOTAL, BROADCAST_SECONDS, BROADCAST_RECIPIENTS, start_metrics_server
+from utils import get_server_ip, describe_stored_file
+from logs import setup_logging
 
 # Получаем логгер для текущего модуля
 logger = logging.getLogger(__name__)
 
 class ChatServer:
-    def __init__(self, tcp_port, udp_port):
+    def __init__(self, tcp_port, udp_port, engine=SERVER_ENGINE, metrics_port=METRICS_PORT):
+        if engine not in SERVER_ENGINES:
+            raise ValueError(f"Неизвестный движок сервера: {engine}")
         self.tcp_port = tcp_port
         self.udp_port = udp_port
-        self.clients = {}  # conn: nickname
-        self.clients_lock = threading.Lock()
+        self.engine = engine
+        self.metrics_port = metrics_port
+        self.clients = {}  # handler: nickname
+        self.connections_by_nickname = {}  # nickname: множество обработчиков (у пользователя может быть несколько устройств)
+        self.rooms = {HISTORY_DEFAULT_ROOM: set()}  # room: множество обработчиков-подписчиков
+        self.clients_lock = threading.Lock()  # Защищает clients, connections_by_nickname и rooms
+        # Держится при проверке "в сети ли получатель" вместе с записью в офлайн-очередь
+        # и при входе вместе с выдачей этой очереди, чтобы личное сообщение не потерялось между ними
+        self.direct_lock = threading.Lock()
+        self.offline_deliveries = set()  # Пользователи, чью офлайн-очередь сейчас доставляет одно из подключений
+        self.outbound_stats = OutboundStats()
         self.BUFFER_SIZE = BUFFER_SIZE
         self.init_environment()
+        self.register_metrics()
         if ENABLE_DIRECTORY_REGISTRATION:
             self.register_with_directory()
-        logger.info("ChatServer инициализирован.")
+        logger.info(f"ChatServer инициализирован (движок: {self.engine}).")
 
     def init_environment(self):
         # Создание директории для хранения файлов, если она не существует
@@ -50,6 +69,44 @@ class ChatServer:
         # Инициализация базы данных
         init_db()
         logger.info("Инициализация базы данных завершена.")
+        self.blobs = BlobStore(BLOBS_DIR)
+        self.uploads = UploadRegistry(PARTIAL_UPLOADS_DIR, UPLOAD_DURABILITY, UPLOAD_WRITE_BEHIND_CHUNKS,
+                                      UPLOAD_RESUME_TTL, UPLOAD_IDLE_TIMEOUT)
+        if CATALOG_REBUILD_ON_STARTUP:
+            rebuild_file_catalog(FILES_DIR, describe_stored_file, self.blobs.exists)
+            removed = self.blobs.remove_orphans(get_blob_hashes())
+            if removed:
+                logger.info(f"Удалено blob-ов без записей в каталоге: {removed}.")
+        self.sessions = SessionStore(SESSION_TOKEN_TTL)
+        self.transfer_tokens = TransferTokens(TRANSFER_TOKEN_TTL, TRANSFER_MAX_STREAMS)
+        self.history = MessageHistory(HISTORY_FLUSH_INTERVAL, HISTORY_GROUP_SIZE)
+        # Рабочие процессы bcrypt запускаем заранее: сразу после старта возможна волна входов
+        get_hash_pool().warm_up()
+
+    def register_metrics(self):
+        """Регистрирует метрики, которые вычисляются при опросе: клиенты, очереди, потоки."""
+        REGISTRY.callback('chatrefresh_clients', 'gauge', 'Аутентифицированные подключения',
+                          lambda: len(self.clients))
+        REGISTRY.callback('chatrefresh_users', 'gauge', 'Пользователи в сети', lambda: len(self.connections_by_nickname))
+        REGISTRY.callback('chatrefresh_rooms', 'gauge', 'Комнаты', lambda: len(self.rooms))
+        REGISTRY.callback('chatrefresh_threads', 'gauge', 'Потоки процесса сервера', threading.active_count)
+        REGISTRY.callback('chatrefresh_outbound_queue_frames', 'gauge', 'Кадры в исходящих очередях клиентов',
+                          lambda: self.get_outbound_metrics()['queue_depth_total'])
+        REGISTRY.callback('chatrefresh_outbound_queue_frames_max', 'gauge', 'Самая длинная исходящая очередь',
+                          lambda: self.get_outbound_metrics()['queue_depth_max'])
+        REGISTRY.callback('chatrefresh_outbound_queue_bytes', 'gauge', 'Байты в исходящих очередях клиентов',
+                          lambda: self.get_outbound_metrics()['queue_bytes_total'])
+        REGISTRY.callback('chatrefresh_outbound_frames_total', 'counter', 'События исходящих очередей',
+                          lambda: {(event,): value for event, value in self.outbound_stats.snapshot().items()},
+                          ('event',))
+        REGISTRY.callback('chatrefresh_password_hash_in_flight', 'gauge', 'Запросы bcrypt в пуле хеширования',
+                          lambda: get_hash_metrics()['in_flight'])
+        REGISTRY.callback('chatrefresh_password_hash_rejected_total', 'counter',
+                          'Запросы bcrypt, отклоненные из-за перегрузки пула', lambda: get_hash_metrics()['rejected'])
+        REGISTRY.callback('chatrefresh_history_unflushed', 'gauge', 'Сообщения, ожидающие записи в историю',
+                          lambda: len(self.history.unflushed))
+        REGISTRY.callback('chatrefresh_uploads_active', 'gauge', 'Открытые сессии загрузки',
+                          lambda: len(self.uploads.sessions))
 
     def udp_broadcast_listener(self):
         """Слушает UDP-запросы на обнаружение сервера."""
@@ -71,22 +128,125 @@ class ChatServer:
 
     def handle_client_connection(self, conn, addr):
         logger.info(f"Начата обработка клиента {addr}")
+        CONNECTIONS_TOTAL.inc()
+        if TCP_NODELAY:
+            # Короткие сообщения не ждут подтверждения предыдущих; склейку делает писатель
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         handler = ClientHandler(conn, addr, self)
         handler_thread = threading.Thread(target=handler.handle, daemon=True)
         handler_thread.start()
 
-    def broadcast(self, message, sender=None):
-        """Отправляет сообщение всем подключенным клиентам, кроме отправителя."""
+    def broadcast(self, message, sender=None, room=None):
+        """Отправляет сообщение подписчикам комнаты (или всем клиентам), кроме отправителя.
+
+        Сообщение сериализуется один раз для каждого алгоритма сжатия и ставится
+        в исходящие очереди клиентов без ожидания; отправку выполняют писатели
+        подключений. Для комнаты перебираются только ее подписчики, а не все
+        подключения сервера.
+        """
+        started = time.perf_counter()
+        encoded = {}
+        with self.clients_lock:
+            handlers = self.clients if room is None else self.rooms.get(room, ())
+            recipients = [(handler, self.clients[handler]) for handler in handlers
+                          if handler in self.clients and self.clients[handler] != sender]
+        for handler, nickname in recipients:
+            if not handler.enqueue(self.encode_for(handler, message, encoded)):
+                logger.warning(f"Сообщение клиенту {nickname} не поставлено в очередь (медленный клиент)")
+        BROADCAST_RECIPIENTS.observe(len(recipients))
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+
+    def encode_for(self, handler, message, encoded):
+        """Кодирует сообщение для клиента; encoded кеширует результат по алгоритму сжатия."""
+        data = encoded.get(handler.compression)
+        if data is None:
+            data = encoded[handler.compression] = handler.encode_message(message)
+        return data
+
+    def join_room(self, handler, room):
+        """Подписывает клиента на комнату, создавая ее при необходимости."""
+        with self.clients_lock:
+            self.rooms.setdefault(room, set()).add(handler)
+            handler.rooms.add(room)
+
+    def leave_room(self, handler, room):
+        """Отписывает клиента от комнаты; опустевшая комната (кроме общей) удаляется."""
+        with self.clients_lock:
+            self._leave_room_locked(handler, room)
+
+    def _leave_room_locked(self, handler, room):
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(handler)
+            if not members and room != HISTORY_DEFAULT_ROOM:
+                del self.rooms[room]
+        handler.rooms.discard(room)
+
+    def add_client(self, handler, nickname):
+        """Добавляет аутентифицированного клиента в рассылку и в индекс по никнейму."""
+        with self.clients_lock:
+            self.clients[handler] = nickname
+            self.connections_by_nickname.setdefault(nickname, set()).add(handler)
+
+    def remove_client(self, handler):
+        """Убирает клиента из списка подключенных, индекса по никнейму и всех его комнат."""
+        with self.clients_lock:
+            nickname = self.clients.pop(handler, None)
+            connections = self.connections_by_nickname.get(nickname)
+            if connections is not None:
+                connections.discard(handler)
+                if not connections:
+                    del self.connections_by_nickname[nickname]
+            for room in list(handler.rooms):
+                self._leave_room_locked(handler, room)
+
+    def user_in_room(self, nickname, room):
+        """Проверяет, подписано ли на комнату хотя бы одно подключение пользователя."""
+        with self.clients_lock:
+            return any(handler in self.rooms.get(room, ()) for handler in self.connections_by_nickname.get(nickname, ()))
+
+    def get_user_connections(self, nickname):
+        """Возвращает подключения пользователя."""
         with self.clients_lock:
-            for client_conn, nickname in list(self.clients.items()):
-                if nickname != sender:
-                    try:
-                        client_conn.send((json.dumps(message) + '\n').encode())
-                        logger.info(f"Отправлено сообщение клиенту {nickname}")
-                    except Exception as e:
-                        logger.error(f"Ошибка при отправке сообщения клиенту {nickname}: {e}")
-                        client_conn.close()
-                        del self.clients[client_conn]
+            return list(self.connections_by_nickname.get(nickname, ()))
+
+    def send_to_user(self, nickname, message, exclude=None):
+        """Ставит сообщение в очереди всех подключений пользователя.
+
+        Возвращает число подключений, принявших сообщение.
+        """
+        encoded = {}
+        delivered = 0
+        for handler in self.get_user_connections(nickname):
+            if handler is not exclude and handler.enqueue(self.encode_for(handler, message, encoded)):
+                delivered += 1
+        return delivered
+
+    def get_rooms(self):
+        """Возвращает комнаты и число их подписчиков."""
+        with self.clients_lock:
+            return {room: len(members) for room, members in self.rooms.items()}
+
+    def get_outbound_metrics(self):
+        """Возвращает метрики исходящих очередей: глубину и счетчики потерь."""
+        with self.clients_lock:
+            handlers = list(self.clients)
+        depths = [handler.outbound.depth() for handler in handlers]
+        metrics = self.outbound_stats.snapshot()
+        metrics.update({
+            'queues': len(depths),
+            'queue_depth_total': sum(depths),
+            'queue_depth_max': max(depths, default=0),
+            'queue_bytes_total': sum(handler.outbound.pending_bytes() for handler in handlers),
+        })
+        return metrics
+
+    def outbound_metrics_logger(self):
+        """Периодически записывает в лог метрики исходящих очередей и хеширования паролей."""
+        while True:
+            time.sleep(OUTBOUND_METRICS_LOG_INTERVAL)
+            logger.info(f"Метрики исходящих очередей: {self.get_outbound_metrics()}")
+            logger.info(f"Метрики хеширования паролей: {get_hash_metrics()}")
 
     def register_with_directory(self):
         """Регистрирует сервер в централизованном справочнике."""
@@ -100,11 +260,34 @@ class ChatServer:
         udp_thread.start()
         logger.info("Поток UDP-обнаружения запущен.")
 
-        # Настраиваем TCP-сервер
+        threading.Thread(target=self.sessions.cleanup_loop, args=(SESSION_CLEANUP_INTERVAL,), daemon=True).start()
+        threading.Thread(target=self.uploads.cleanup_loop, args=(UPLOAD_CLEANUP_INTERVAL,), daemon=True).start()
+
+        if OUTBOUND_METRICS_LOG_INTERVAL:
+            threading.Thread(target=self.outbound_metrics_logger, daemon=True).start()
+
+        if self.metrics_port:
+            try:
+                start_metrics_server(METRICS_HOST, self.metrics_port)
+            except OSError as e:
+                logger.error(f"Не удалось запустить сервер метрик на порту {self.metrics_port}: {e}")
+
+        try:
+            if self.engine == 'asyncio':
+                from async_server import run_async_server
+                run_async_server(self)
+            else:
+                self.serve_threaded()
+        finally:
+            self.history.flush()  # Не теряем сообщения, ожидающие групповой записи
+
+    def serve_threaded(self):
+        """Принимает TCP-подключения, запуская отдельный поток на каждого клиента."""
         try:
             tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             tcp_socket.bind(('0.0.0.0', self.tcp_port))
-            tcp_socket.listen()
+            tcp_socket.listen(TCP_BACKLOG)
             logger.info(f"TCP-сервер запущен на порту {self.tcp_port}")
         except Exception as e:
             logger.critical(f"Не удалось запустить TCP-сервер: {e}")
@@ -119,5 +302,18 @@ class ChatServer:
                 logger.error(f"Ошибка при принятии подключения: {e}")
 
 if __name__ == "__main__":
-    server = ChatServer(tcp_port=TCP_PORT, udp_port=UDP_PORT)
-    server.start_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Сервер Chat Refresh")
+    parser.add_argument('--engine', choices=SERVER_ENGINES, default=SERVER_ENGINE,
+                        help="Движок обработки подключений")
+    parser.add_argument('--port', type=int, default=TCP_PORT, help="TCP-порт")
+    parser.add_argument('--udp-port', type=int, default=UDP_PORT, help="UDP-порт обнаружения")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT, help="Порт HTTP-сервера метрик (0 - отключить)")
+    args = parser.parse_args()
+
+    # Запись в файл (с ротацией) и в консоль идет в отдельном потоке через очередь.
+    # Только при запуске: процессы пула хеширования (spawn) заново импортируют этот модуль
+    # и не должны открывать и ротировать тот же файл лога
+    setup_logging(LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_RATE_LIMIT, LOG_RATE_INTERVAL)
+
+    server = ChatServer(tcp_port=args.port, udp_port=args.udp_port, engine=args.engine, metrics_port=args.metrics_port)
+    server.start_server()
@@ -0,0 +1,143 @@
+# server/sessions.py
+
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+import threading
+import time
+from database import (get_session_secret, add_session, revoke_session, revoke_user_sessions,
+                      load_active_sessions, delete_expired_sessions)
+
+logger = logging.getLogger(__name__)
+
+class SessionStore:
+    """Токены возобновления сессии.
+
+    После входа клиент получает подписанный токен с ограниченным сроком
+    действия. При переподключении он отправляет resume с токеном, и сервер
+    проверяет его одной HMAC-подписью вместо bcrypt. Действующие токены
+    хранятся в памяти (устаревшие вычищаются по сроку) и дублируются в SQLite,
+    чтобы пережить перезапуск сервера; отозванный токен удаляется из памяти
+    и больше не принимается.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.secret = get_session_secret()
+        self.lock = threading.Lock()
+        self.sessions = load_active_sessions(time.time())  # token_id: (nickname, expires_at)
+        logger.info(f"Загружено действующих сессий: {len(self.sessions)}.")
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload, hashlib.sha256).hexdigest()
+
+    def issue(self, nickname):
+        """Выдает новый токен пользователю. Возвращает (токен, время истечения)."""
+        token_id = secrets.token_hex(16)
+        expires_at = int(time.time() + self.ttl)
+        payload = f"{token_id}:{expires_at}:{nickname}".encode()
+        add_session(token_id, nickname, expires_at)
+        with self.lock:
+            self.sessions[token_id] = (nickname, expires_at)
+        token = base64.urlsafe_b64encode(payload).decode() + '.' + self._sign(payload)
+        return token, expires_at
+
+    def _parse(self, token):
+        """Проверяет подпись токена и возвращает (token_id, expires_at, nickname) или None."""
+        try:
+            encoded, signature = token.rsplit('.', 1)
+            payload = base64.urlsafe_b64decode(encoded.encode())
+            signature = signature.encode()  # compare_digest не сравнивает строки с не-ASCII символами
+        except (ValueError, AttributeError):
+            return None
+        if not hmac.compare_digest(self._sign(payload).encode(), signature):
+            return None
+        token_id, expires_at, nickname = payload.decode().split(':', 2)
+        return token_id, int(expires_at), nickname
+
+    def verify(self, token):
+        """Возвращает никнейм владельца действующего токена или None."""
+        parsed = self._parse(token)
+        if parsed is None:
+            return None
+        token_id, expires_at, nickname = parsed
+        if expires_at < time.time():
+            return None
+        with self.lock:
+            session = self.sessions.get(token_id)
+        if session is None or session[0] != nickname:
+            return None  # Токен отозван или вычищен
+        return nickname
+
+    def revoke(self, token):
+        """Отзывает токен (например, при выходе пользователя)."""
+        parsed = self._parse(token)
+        if parsed is None:
+            return False
+        token_id = parsed[0]
+        with self.lock:
+            self.sessions.pop(token_id, None)
+        revoke_session(token_id)
+        return True
+
+    def revoke_user(self, nickname):
+        """Отзывает все токены пользователя."""
+        with self.lock:
+            for token_id in [t for t, (owner, _) in self.sessions.items() if owner == nickname]:
+                del self.sessions[token_id]
+        revoke_user_sessions(nickname)
+
+    def purge_expired(self):
+        """Удаляет истекшие токены из памяти и базы."""
+        now = time.time()
+        with self.lock:
+            expired = [t for t, (_, expires_at) in self.sessions.items() if expires_at < now]
+            for token_id in expired:
+                del self.sessions[token_id]
+        delete_expired_sessions(now)
+        return len(expired)
+
+    def cleanup_loop(self, interval):
+        """Периодически вычищает истекшие токены."""
+        while True:
+            time.sleep(interval)
+            removed = self.purge_expired()
+            if removed:
+                logger.info(f"Удалено истекших сессий: {removed}.")
+
+class TransferTokens:
+    """Короткоживущие токены для соединений передачи данных.
+
+    Клиент получает токен по основному, уже аутентифицированному соединению
+    и открывает с ним до max_streams дополнительных соединений, по которым
+    идут чанки больших файлов. Так массовая передача не задерживает
+    сообщения чата в основном соединении, а повторный вход с bcrypt не нужен.
+    """
+
+    def __init__(self, ttl, max_streams):
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self.lock = threading.Lock()
+        self.tokens = {}  # token: [nickname, expires_at, использовано соединений]
+
+    def issue(self, nickname):
+        """Выдает токен пользователю. Возвращает (токен, время истечения)."""
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        expires_at = now + self.ttl
+        with self.lock:
+            for expired in [t for t, (_, expires, _) in self.tokens.items() if expires < now]:
+                del self.tokens[expired]
+            self.tokens[token] = [nickname, expires_at, 0]
+        return token, expires_at
+
+    def verify(self, token):
+        """Принимает очередное соединение по токену. Возвращает никнейм владельца или None."""
+        with self.lock:
+            entry = self.tokens.get(token)
+            if entry is None or entry[1] < time.time() or entry[2] >= self.max_streams:
+                return None
+            entry[2] += 1
+            return entry[0]
@@ -0,0 +1,364 @@
+# server/uploads.py
+
+import os
+import re
+import json
+import time
+import hashlib
+import queue
+import threading
+import logging
+from collections import OrderedDict
+from config import MAX_PAYLOAD_SIZE
+from utils import hash_file, is_byte_offset
+
+logger = logging.getLogger(__name__)
+
+# Политики надежности записи загружаемых файлов
+DURABILITY_NONE = 'none'    # Не вызывать fsync (данные сбросит ОС)
+DURABILITY_CLOSE = 'close'  # fsync один раз при завершении загрузки
+DURABILITY_CHUNK = 'chunk'  # fsync после каждого чанка
+DURABILITY_POLICIES = (DURABILITY_NONE, DURABILITY_CLOSE, DURABILITY_CHUNK)
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{16,64}$')  # Идентификатор возобновляемой загрузки (hex)
+COMPLETED_UPLOADS_KEPT = 1000  # Сколько завершенных загрузок помнить для ответа на upload_status
+
+class UploadSession:
+    """Сессия загрузки одного файла.
+
+    Файл открывается один раз и остается открытым до конца загрузки. Чанки
+    пишутся по явным смещениям отдельным потоком через ограниченную очередь,
+    поэтому чтение следующего чанка из сокета идет параллельно с записью
+    предыдущего на диск. Когда очередь заполнена, write() ждет, и клиент
+    притормаживается обычным механизмом TCP.
+
+    Принятые чанки отмечаются в битовой карте. Если задан state_path, карта
+    записанных на диск чанков после каждого чанка сохраняется в JSON рядом
+    с файлом: после обрыва связи (или перезапуска сервера) сессию можно
+    открыть заново через load(), и клиент досылает только недостающие чанки.
+    """
+
+    def __init__(self, file_path, total_chunks, durability, queue_size, state_path=None, bitmap=None, **info):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"Неизвестная политика надежности записи: {durability}")
+        self.file_path = file_path
+        self.total_chunks = total_chunks
+        self.durability = durability
+        self.state_path = state_path
+        self.info = info  # Метаданные для уведомления new_file: file_name, sender, file_size, file_type, date, room
+        self.max_size = total_chunks * MAX_PAYLOAD_SIZE  # Чанк приходит одним кадром, поэтому файл не длиннее
+        self.lock = threading.Lock()
+        # received - чанки, принятые в очередь записи; written - уже записанные в файл
+        self.received = bytearray(bitmap or bytes((total_chunks + 7) // 8))
+        self.written = bytearray(self.received)
+        self.received_chunks = sum(bin(byte).count('1') for byte in self.received)
+        self.bytes_written = 0
+        self.next_offset = 0
+        self.error = None
+        self.closed = False
+        self.last_activity = time.monotonic()
+        # SHA-256 считается на лету, пока чанки приходят по порядку (при возобновлении - по файлу)
+        self.hasher = hashlib.sha256() if bitmap is None else None
+        self.hashed_offset = 0
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        if bitmap is None:
+            flags |= os.O_TRUNC
+        self.fd = os.open(file_path, flags, 0o644)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+        if state_path and bitmap is None:
+            self._save_state()
+
+    @classmethod
+    def load(cls, state_path, durability, queue_size):
+        """Открывает сохраненную сессию возобновляемой загрузки."""
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return cls(state['file_path'], state['total_chunks'], durability, queue_size,
+                   state_path=state_path, bitmap=bytes.fromhex(state['bitmap']), **state['info'])
+
+    def write(self, data, offset=None, chunk=None):
+        """Ставит чанк в очередь записи. Без смещения чанк пишется следом за предыдущим.
+
+        Смещение должно быть целым неотрицательным числом, а чанк - укладываться
+        в total_chunks кадров максимального размера, иначе бросается ValueError.
+        chunk - номер чанка (с 1); повторно присланный чанк пропускается.
+        Возвращает True, если этим чанком загрузка стала полной (ровно для
+        одного вызова, даже если чанки приходят из разных потоков).
+        """
+        if self.error:
+            raise self.error
+        with self.lock:
+            if chunk is not None:
+                index = chunk - 1
+                if not 0 <= index < self.total_chunks:
+                    raise ValueError(f"Неверный номер чанка {chunk} из {self.total_chunks}")
+                if self.received[index // 8] & (1 << index % 8):
+                    # Проверяется до closed: повтор по другому соединению может прийти и после завершения
+                    return False
+            if self.closed:
+                raise ValueError(f"Сессия загрузки {self.file_path} уже закрыта")
+            self.last_activity = time.monotonic()
+            if offset is not None and not is_byte_offset(offset, self.max_size - len(data)):
+                raise ValueError(f"Неверное смещение чанка {offset!r} в файле из {self.total_chunks} чанков")
+            if chunk is not None:
+                self.received[index // 8] |= 1 << index % 8
+            if offset is None:
+                offset = self.next_offset
+            self.next_offset = offset + len(data)
+            self.received_chunks += 1
+            # Ставим в очередь под блокировкой, чтобы close() не опередил этот чанк
+            self.queue.put((offset, data, chunk))
+            return self.received_chunks == self.total_chunks
+
+    def is_complete(self):
+        return self.received_chunks >= self.total_chunks
+
+    def missing_chunks(self):
+        """Возвращает недостающие чанки диапазонами [первый, последний] (номера с 1)."""
+        ranges = []
+        with self.lock:
+            for index in range(self.total_chunks):
+                if self.received[index // 8] & (1 << index % 8):
+                    continue
+                if ranges and ranges[-1][1] == index:
+                    ranges[-1][1] = index + 1
+                else:
+                    ranges.append([index + 1, index + 1])
+        return ranges
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error:
+                continue  # После ошибки дочитываем очередь, чтобы не блокировать write()
+            offset, data, chunk = item
+            try:
+                self._pwrite(offset, data)
+                self._update_hash(offset, data)
+                if self.durability == DURABILITY_CHUNK:
+                    os.fsync(self.fd)
+                if chunk is not None:
+                    index = chunk - 1
+                    self.written[index // 8] |= 1 << index % 8
+                    if self.state_path:
+                        self._save_state()
+            except Exception as e:
+                logger.error(f"Ошибка записи в файл {self.file_path}: {e}")
+                self.error = e
+
+    def _save_state(self):
+        """Атомарно сохраняет карту записанных чанков."""
+        state = {
+            'file_path': self.file_path,
+            'total_chunks': self.total_chunks,
+            'bitmap': self.written.hex(),
+            'info': self.info
+        }
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_path, self.state_path)
+
+    def _pwrite(self, offset, data):
+        view = memoryview(data)
+        while view:
+            if hasattr(os, 'pwrite'):
+                written = os.pwrite(self.fd, view, offset)
+            else:
+                # В Windows нет pwrite; запись идет из одного потока, поэтому lseek безопасен
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                written = os.write(self.fd, view)
+            view = view[written:]
+            offset += written
+            self.bytes_written += written
+
+    def _update_hash(self, offset, data):
+        if self.hasher is None:
+            return
+        if offset != self.hashed_offset:
+            self.hasher = None  # Чанки пришли не по порядку: хеш посчитаем по файлу
+            return
+        self.hasher.update(data)
+        self.hashed_offset += len(data)
+
+    def sha256(self):
+        """Возвращает SHA-256 записанного файла (вызывать после close())."""
+        if self.hasher is not None and self.hashed_offset == os.path.getsize(self.file_path):
+            return self.hasher.hexdigest()
+        return hash_file(self.file_path)
+
+    def suspend(self):
+        """Закрывает файл незавершенной загрузки, оставляя его и карту чанков на диске."""
+        self._close_file()
+
+    def _close_file(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.writer.join()
+        try:
+            if not self.error and self.durability != DURABILITY_NONE:
+                os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+
+    def close(self):
+        """Дожидается записи всех чанков и закрывает файл.
+
+        Бросает исключение, если при записи произошла ошибка.
+        """
+        self._close_file()
+        if self.error:
+            raise self.error
+        self._remove_state()
+
+    def abort(self):
+        """Прерывает загрузку и удаляет недописанный файл."""
+        try:
+            self._close_file()
+        except Exception:
+            pass
+        try:
+            os.remove(self.file_path)
+        except OSError:
+            pass
+        self._remove_state()
+
+    def _remove_state(self):
+        if self.state_path:
+            try:
+                os.remove(self.state_path)
+            except OSError:
+                pass
+
+class UploadRegistry:
+    """Возобновляемые загрузки, общие для всех подключений сервера.
+
+    Загрузка с идентификатором upload_id хранится в directory как
+    <upload_id>.part (данные) и <upload_id>.json (метаданные и карта чанков).
+    Сессия переживает обрыв соединения: после переподключения клиент
+    спрашивает недостающие чанки и досылает их. Давно не используемые
+    сессии закрываются (файлы остаются на диске), а брошенные загрузки
+    старше ttl удаляются.
+    """
+
+    def __init__(self, directory, durability, queue_size, ttl, idle_timeout):
+        self.directory = directory
+        self.durability = durability
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.sessions = {}  # upload_id: UploadSession
+        self.completed = OrderedDict()  # upload_id: (владелец, id файла) - недавно завершенные загрузки
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def get(self, upload_id, owner):
+        """Возвращает открытую или сохраненную на диске сессию владельца или None."""
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            return None
+        with self.lock:
+            session = self.sessions.get(upload_id)
+            if session is None and os.path.exists(self._state_path(upload_id)):
+                try:
+                    session = UploadSession.load(self._state_path(upload_id), self.durability, self.queue_size)
+                except Exception as e:
+                    logger.error(f"Не удалось восстановить загрузку {upload_id}: {e}")
+                    return None
+                self.sessions[upload_id] = session
+        if session is None or session.info.get('sender') != owner:
+            return None
+        return session
+
+    def open(self, upload_id, owner, total_chunks, info):
+        """Возвращает сессию загрузки upload_id, создавая ее при необходимости.
+
+        Бросает ValueError, если идентификатор неверен или занят загрузкой
+        другого пользователя или другого файла.
+        """
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise ValueError(f"Неверный идентификатор загрузки: {upload_id}")
+        session = self.get(upload_id, owner)
+        with self.lock:
+            if session is None:
+                if upload_id in self.sessions or os.path.exists(self._state_path(upload_id)):
+                    raise ValueError(f"Идентификатор загрузки {upload_id} уже используется")
+                session = UploadSession(
+                    os.path.join(self.directory, f"{upload_id}.part"), total_chunks, self.durability,
+                    self.queue_size, state_path=self._state_path(upload_id), **info
+                )
+                self.sessions[upload_id] = session
+                return session
+        if session.total_chunks != total_chunks or session.info.get('file_name') != info.get('file_name'):
+            raise ValueError(f"Загрузка {upload_id} относится к другому файлу")
+        return session
+
+    def finish(self, upload_id, file_id):
+        """Убирает завершенную загрузку из реестра, запоминая id файла в каталоге."""
+        with self.lock:
+            session = self.sessions.pop(upload_id, None)
+            if session is not None:
+                self.completed[upload_id] = (session.info.get('sender'), file_id)
+                while len(self.completed) > COMPLETED_UPLOADS_KEPT:
+                    self.completed.popitem(last=False)
+
+    def completed_file(self, upload_id, owner):
+        """Возвращает id файла недавно завершенной загрузки владельца или None."""
+        with self.lock:
+            entry = self.completed.get(upload_id)
+        return entry[1] if entry and entry[0] == owner else None
+
+    def release(self, upload_id):
+        """Закрывает сессию, оставляя загрузку на диске; следующий get() прочитает ее заново."""
+        with self.lock:
+            session = self.sessions.pop(upload_id, None)
+        if session is not None:
+            session.suspend()
+
+    def suspend_idle(self):
+        """Закрывает файлы сессий, не получавших чанков дольше idle_timeout."""
+        deadline = time.monotonic() - self.idle_timeout
+        with self.lock:
+            idle = [(upload_id, session) for upload_id, session in self.sessions.items()
+                    if session.last_activity < deadline]
+            for upload_id, _ in idle:
+                del self.sessions[upload_id]
+        for _, session in idle:
+            session.suspend()
+        return len(idle)
+
+    def purge_expired(self):
+        """Удаляет с диска загрузки, брошенные дольше ttl назад."""
+        deadline = time.time() - self.ttl
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            upload_id = name.split('.', 1)[0]
+            with self.lock:
+                if upload_id in self.sessions:
+                    continue
+                try:
+                    if os.path.getmtime(path) < deadline:
+                        os.remove(path)
+                        removed += name.endswith('.json')
+                except OSError:
+                    pass
+        return removed
+
+    def cleanup_loop(self, interval):
+        """Периодически закрывает простаивающие и удаляет брошенные загрузки."""
+        while True:
+            time.sleep(interval)
+            suspended = self.suspend_idle()
+            removed = self.purge_expired()
+            if suspended or removed:
+                logger.info(f"Загрузки: закрыто простаивающих {suspended}, удалено брошенных {removed}.")
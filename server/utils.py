@@ -1,7 +1,10 @@
 # server/utils.py
 
+import os
 import socket
 import logging
+import hashlib
+from datetime import datetime
 
 try:
     import miniupnpc
@@ -45,4 +48,57 @@ def setup_upnp(tcp_port):
         return True
     except Exception as e:
         logger.error(f"Не удалось настроить UPnP: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def get_readable_file_size(size_in_bytes):
+    """Преобразует размер файла из байт в читаемый формат."""
+    for unit in ['Б', 'КБ', 'МБ', 'ГБ', 'ТБ']:
+        if size_in_bytes < 1024:
+            return f"{size_in_bytes:.2f} {unit}".rstrip('0').rstrip('.')  # Убираем лишние нули после точки
+        size_in_bytes /= 1024
+    return f"{size_in_bytes:.2f} ПБ".rstrip('0').rstrip('.')  # Убираем лишние нули после точки
+
+def get_file_type(file_path):
+    """Определяет тип файла по расширению."""
+    _, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+    if ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
+        return 'Изображение'
+    elif ext in ['.mp4', '.avi', '.mov', '.mkv']:
+        return 'Видео'
+    elif ext in ['.pdf', '.docx', '.xlsx', '.pptx', '.txt']:
+        return 'Документ'
+    elif ext in ['.zip', '.rar', '.7z', '.tar', '.gz']:
+        return 'Архив'
+    elif ext in ['.mp3', '.wav', '.aac', '.flac']:
+        return 'Музыка'
+    else:
+        return 'Другой'
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """Вычисляет SHA-256 содержимого файла."""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def is_byte_offset(value, limit):
+    """Проверяет смещение или длину из сообщения клиента: целое число от 0 до limit (bool не подходит)."""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= limit
+
+def format_timestamp(timestamp):
+    """Форматирует время в виде, принятом в протоколе."""
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+def describe_stored_file(stored_name, file_path):
+    """Восстанавливает метаданные файла из FILES_DIR по имени вида {sender}_{file_name}."""
+    parts = stored_name.split('_', 1)
+    return {
+        'file_name': parts[1] if len(parts) > 1 else stored_name,
+        'sender': parts[0] if len(parts) > 1 else 'Unknown',
+        'size': os.path.getsize(file_path),
+        'file_type': get_file_type(file_path),
+        'date': format_timestamp(os.path.getmtime(file_path)),
+        'sha256': hash_file(file_path)
+    }
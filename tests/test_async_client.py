@@ -0,0 +1,56 @@
+# tests/test_async_client.py
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'client'))
+
+from async_client import AsyncChatClient  # noqa: E402
+from framing import BINARY_PREFIX, BINARY_FRAME_MARKER, DEFAULT_MAX_PAYLOAD_SIZE, encode_message  # noqa: E402
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def read_frame(data, limit=64, eof=True):
+    """Разбирает data через AsyncChatClient.read_frame; возвращает (кадры, закрыл ли клиент соединение)."""
+    async def run():
+        client = AsyncChatClient('127.0.0.1', 1)
+        client.stream_reader = asyncio.StreamReader(limit=limit)
+        client.stream_writer = RecordingWriter()
+        client.stream_reader.feed_data(data)
+        if eof:
+            client.stream_reader.feed_eof()
+        frames = []
+        while True:
+            frame = await client.read_frame()
+            if frame is None:
+                return frames, client.stream_writer.closed
+            frames.append(frame)
+    return asyncio.run(run())
+
+
+def test_lines_read_until_eof():
+    frames, closed = read_frame(encode_message({'n': 1}) + encode_message({'n': 2}))
+    assert [frame.header for frame in frames] == [b'{"n": 1}', b'{"n": 2}']
+    assert not closed
+
+
+@pytest.mark.parametrize('eof', [True, False])
+def test_line_over_limit_closes_connection(eof):
+    frames, closed = read_frame(encode_message({'content': 'x' * 500}), eof=eof)
+    assert frames == [] and closed
+
+
+def test_oversize_binary_frame_closes_connection():
+    prefix = BINARY_PREFIX.pack(BINARY_FRAME_MARKER, 0, 2, DEFAULT_MAX_PAYLOAD_SIZE + 1)
+    frames, closed = read_frame(prefix + b'{}', eof=False)
+    assert frames == [] and closed
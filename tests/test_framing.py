@@ -0,0 +1,142 @@
+# tests/test_framing.py
+
+import json
+import os
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+from framing import (FrameReader, FrameTooLargeError, encode_message, encode_binary_frame,  # noqa: E402
+                     encode_compressed_message, encode_compressed_binary_frame, available_compressions,
+                     BINARY_PREFIX, BINARY_FRAME_MARKER, FLAG_ZLIB, FLAG_MESSAGE, FEATURE_ZLIB)
+
+
+class ScriptedSocket:
+    """Сокет, который отдает заранее заданные куски данных по одному на вызов recv_into."""
+
+    def __init__(self, *chunks):
+        self.chunks = [bytes(chunk) for chunk in chunks]
+
+    def recv_into(self, buffer, nbytes=0):
+        if not self.chunks:
+            return 0  # Соединение закрыто
+        size = min(nbytes or len(buffer), len(buffer))
+        chunk = self.chunks.pop(0)
+        if len(chunk) > size:
+            self.chunks.insert(0, chunk[size:])
+            chunk = chunk[:size]
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def make_reader(*chunks, bufsize=4096, **limits):
+    return FrameReader(ScriptedSocket(*chunks), bufsize, **limits)
+
+
+def test_newline_split_across_recv_calls():
+    data = encode_message({'type': 'message', 'content': 'привет'})
+    reader = make_reader(data[:5], data[5:-1], data[-1:])
+    frame = reader.read_frame()
+    assert json.loads(frame.header) == {'type': 'message', 'content': 'привет'}
+    assert frame.payload is None
+    assert reader.read_frame() is None
+
+
+def test_several_frames_in_one_recv():
+    data = (encode_message({'n': 1}) + encode_binary_frame({'n': 2}, b'\x00\x01\n')
+            + encode_message({'n': 3}))
+    reader = make_reader(data)
+    first, second, third = reader.read_frame(), reader.read_frame(), reader.read_frame()
+    assert json.loads(first.header) == {'n': 1}
+    assert json.loads(second.header) == {'n': 2}
+    assert bytes(second.payload) == b'\x00\x01\n'
+    assert json.loads(third.header) == {'n': 3}
+    assert reader.read_frame() is None
+
+
+def test_small_buffer_reads_frame_in_pieces():
+    payload = bytes(range(256)) * 8
+    data = encode_binary_frame({'chunk': 1}, payload)
+    reader = make_reader(data, bufsize=7)
+    frame = reader.read_frame()
+    assert json.loads(frame.header) == {'chunk': 1}
+    assert bytes(frame.payload) == payload
+
+
+def test_oversize_line_rejected():
+    reader = make_reader(b'{"content": "' + b'x' * 200, bufsize=16, max_message_size=64)
+    with pytest.raises(FrameTooLargeError):
+        reader.read_frame()
+
+
+def test_oversize_binary_header_rejected():
+    prefix = BINARY_PREFIX.pack(BINARY_FRAME_MARKER, 0, 65, 0)
+    reader = make_reader(prefix + b'{' * 65, max_message_size=64)
+    with pytest.raises(FrameTooLargeError):
+        reader.read_frame()
+
+
+def test_oversize_binary_payload_rejected():
+    # Размер проверяется по префиксу, до чтения самих данных
+    prefix = BINARY_PREFIX.pack(BINARY_FRAME_MARKER, 0, 2, 1025)
+    reader = make_reader(prefix + b'{}', max_payload_size=1024)
+    with pytest.raises(FrameTooLargeError):
+        reader.read_frame()
+
+
+def test_oversize_decompressed_payload_rejected():
+    data = encode_binary_frame({}, zlib.compress(b'\x00' * 4096), FLAG_ZLIB)
+    reader = make_reader(data, max_payload_size=1024)
+    with pytest.raises(FrameTooLargeError):
+        reader.read_frame()
+
+
+def test_binary_frame_without_compression():
+    payload = os.urandom(1000)
+    data = encode_compressed_binary_frame({'chunk': 1}, payload, FEATURE_ZLIB, 64)
+    _, flags, _, _ = BINARY_PREFIX.unpack(data[:BINARY_PREFIX.size])
+    assert flags == 0  # Случайные данные не сжимаются и идут как есть
+    frame = make_reader(data).read_frame()
+    assert frame.flags == 0
+    assert bytes(frame.payload) == payload
+
+
+@pytest.mark.parametrize('codec', available_compressions())
+def test_compressed_binary_frame(codec):
+    payload = b'chat refresh ' * 1000
+    data = encode_compressed_binary_frame({'chunk': 1}, payload, codec, 64)
+    _, flags, _, payload_length = BINARY_PREFIX.unpack(data[:BINARY_PREFIX.size])
+    assert flags and payload_length < len(payload)
+    frame = make_reader(data).read_frame()
+    assert json.loads(frame.header) == {'chunk': 1}
+    assert frame.flags == 0
+    assert bytes(frame.payload) == payload
+
+
+@pytest.mark.parametrize('codec', available_compressions())
+def test_compressed_message(codec):
+    message = {'type': 'history', 'messages': ['привет'] * 500}
+    data = encode_compressed_message(message, codec, 64)
+    _, flags, header_length, _ = BINARY_PREFIX.unpack(data[:BINARY_PREFIX.size])
+    assert flags & FLAG_MESSAGE and header_length == 0
+    frame = make_reader(data).read_frame()
+    assert frame.payload is None
+    assert json.loads(frame.header) == message
+
+
+def test_short_message_not_compressed():
+    data = encode_compressed_message({'type': 'ping'}, FEATURE_ZLIB, 64)
+    assert data == encode_message({'type': 'ping'})
+
+
+@pytest.mark.parametrize('cut', [5, BINARY_PREFIX.size + 3, -10])
+def test_eof_inside_binary_frame(cut):
+    data = encode_binary_frame({'chunk': 1}, b'x' * 100)
+    assert make_reader(data[:cut]).read_frame() is None
+
+
+def test_eof_inside_line():
+    assert make_reader(b'{"type": "mess').read_frame() is None
@@ -0,0 +1,64 @@
+# tests/test_history.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+import history  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Таблица сообщений в памяти вместо SQLite; база читается только вне блокировки журнала."""
+    rows = []
+    state = {'log': None, 'reads': 0, 'on_read': None}
+
+    def get_messages(room, since_id, max_id, limit):
+        assert not state['log'].lock._is_owned()
+        state['reads'] += 1
+        if state['on_read']:
+            on_read, state['on_read'] = state['on_read'], None
+            on_read()
+        found = [m for m in rows if m['room'] == room and since_id < m['id'] <= max_id]
+        return found[-limit:]
+
+    monkeypatch.setattr(history, 'get_last_message_id', lambda: 0)
+    monkeypatch.setattr(history, 'insert_messages', rows.extend)
+    monkeypatch.setattr(history, 'get_messages', get_messages)
+    return state
+
+
+def make_log(db, count):
+    log = history.MessageHistory(flush_interval=3600, group_size=10 ** 6)
+    db['log'] = log
+    for n in range(count):
+        log.append('general', 'alice', f'msg {n + 1}')
+    return log
+
+
+def replay(log, since_id, limit):
+    result = []
+    log.replay('general', since_id, limit, lambda messages, truncated: result.append(
+        ([m['id'] for m in messages], truncated, log.lock._is_owned())))
+    return result[0]
+
+
+def test_replay_merges_stored_and_pending(db):
+    log = make_log(db, 5)
+    log.flush()
+    log.append('general', 'bob', 'msg 6')
+    assert replay(log, 2, 10) == ([3, 4, 5, 6], False, True)
+    assert replay(log, None, 3) == ([4, 5, 6], True, True)
+
+
+def test_replay_rereads_messages_flushed_during_read(db):
+    log = make_log(db, 3)
+    log.flush()
+    log.append('general', 'bob', 'msg 4')
+    log.append('general', 'bob', 'msg 5')
+    db['on_read'] = log.flush  # Поток записи сбрасывает 4 и 5, пока идет чтение базы
+    assert replay(log, 1, 10) == ([2, 3, 4, 5], False, True)
+    assert db['reads'] == 2  # Второй раз дочитан только промежуток 4..5
@@ -0,0 +1,43 @@
+# tests/test_outbound.py
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+from outbound import OutboundQueue, FileSegment, POLICY_DROP  # noqa: E402
+
+
+def test_put_group_waits_for_room_for_whole_group():
+    queue = OutboundQueue(max_items=4, max_bytes=100, policy=POLICY_DROP)
+    queue.put(b'x' * 95)
+    done = threading.Event()
+
+    def put_group():
+        queue.put_group([b'file_info\n', FileSegment('file', 0, 10)])
+        done.set()
+
+    thread = threading.Thread(target=put_group)
+    thread.start()
+    assert not done.wait(0.1)  # Не хватает места под всю группу
+    assert queue.get_batch() == [b'x' * 95]
+    thread.join(1)
+    assert done.is_set()
+    batch = queue.get_batch()
+    assert batch[0] == b'file_info\n' and isinstance(batch[1], FileSegment)
+
+
+def test_broadcast_does_not_split_group():
+    queue = OutboundQueue(max_items=100, max_bytes=10 ** 6, policy=POLICY_DROP)
+    queue.put_group([b'file_info\n', FileSegment('file', 0, 10)])
+    queue.put(b'broadcast\n')
+    items = queue.get_batch()
+    assert items[0] == b'file_info\n' and isinstance(items[1], FileSegment) and items[2] == b'broadcast\n'
+
+
+def test_put_group_on_closed_queue():
+    queue = OutboundQueue(max_items=4, max_bytes=100, policy=POLICY_DROP)
+    queue.close()
+    assert queue.put_group([b'file_info\n', FileSegment('file', 0, 10)]) is False
+    assert queue.get_batch() is None
@@ -0,0 +1,38 @@
+# tests/test_sessions.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+import sessions  # noqa: E402
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.setattr(sessions, 'get_session_secret', lambda: b'secret' * 8)
+    monkeypatch.setattr(sessions, 'load_active_sessions', lambda now: {})
+    monkeypatch.setattr(sessions, 'add_session', lambda token_id, nickname, expires_at: None)
+    monkeypatch.setattr(sessions, 'revoke_session', lambda token_id: None)
+    return sessions.SessionStore(ttl=3600)
+
+
+def test_issued_token_verifies(store):
+    token, _ = store.issue('alice')
+    assert store.verify(token) == 'alice'
+
+
+@pytest.mark.parametrize('signature', ['подпись', '\ud800', 'é' * 64, ''])
+def test_non_ascii_signature_rejected(store, signature):
+    token, _ = store.issue('alice')
+    forged = token.rsplit('.', 1)[0] + '.' + signature
+    assert store.verify(forged) is None
+    assert store.revoke(forged) is False
+    assert store.verify(token) == 'alice'
+
+
+@pytest.mark.parametrize('token', [None, 42, 'no-dot', 'не base64.abc'])
+def test_malformed_token_rejected(store, token):
+    assert store.verify(token) is None
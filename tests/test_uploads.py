@@ -0,0 +1,43 @@
+# tests/test_uploads.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+from config import MAX_PAYLOAD_SIZE  # noqa: E402
+from uploads import UploadSession, DURABILITY_NONE  # noqa: E402
+
+
+def make_session(tmp_path, total_chunks=2, **kwargs):
+    return UploadSession(str(tmp_path / 'upload.part'), total_chunks, DURABILITY_NONE, 4, **kwargs)
+
+
+@pytest.mark.parametrize('offset', [-1, '0', 1.5, True, [0], 2 * MAX_PAYLOAD_SIZE])
+def test_write_rejects_bad_offset(tmp_path, offset):
+    session = make_session(tmp_path)
+    with pytest.raises(ValueError):
+        session.write(b'data', offset, 1)
+    assert session.missing_chunks() == [[1, 2]]  # Отвергнутый чанк не отмечен принятым
+    session.abort()
+
+
+def test_write_accepts_offsets_inside_file(tmp_path):
+    session = make_session(tmp_path)
+    assert session.write(b'world', 5, 2) is False
+    assert session.write(b'hello', 0, 1) is True
+    session.close()
+    with open(session.file_path, 'rb') as f:
+        assert f.read() == b'helloworld'
+
+
+def test_duplicate_chunk_after_close_is_skipped(tmp_path):
+    session = make_session(tmp_path)
+    session.write(b'hello', 0, 1)
+    session.write(b'world', 5, 2)
+    session.close()
+    assert session.write(b'world', 5, 2) is False  # Повтор не считается ошибкой
+    with pytest.raises(ValueError):
+        session.write(b'extra', 10)  # Новые данные в закрытую сессию не принимаются